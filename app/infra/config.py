@@ -5,10 +5,17 @@ import os
 class AppConfig:
     api_base_url: str
     request_timeout_s: float = 10.0
+    # Solo se usa sin réplica: con ella las lecturas no van al servidor
+    cache_ttl_s: float = 30.0
+    # Vacío (API_REPLICA_PATH=) para trabajar sin réplica local, solo en línea
+    replica_path: str = "replica.db"
 
     @staticmethod
     def load() -> "AppConfig":
         return AppConfig(
             api_base_url=os.getenv("API_BASE_URL", "http://127.0.0.1:8000"),
-            request_timeout_s=float(os.getenv("API_TIMEOUT_S", "10"))
+            request_timeout_s=float(os.getenv("API_TIMEOUT_S", "10")),
+            cache_ttl_s=float(os.getenv("API_CACHE_TTL_S", "30")),
+            replica_path=os.getenv("API_REPLICA_PATH", os.path.join(
+                os.getenv("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "splitwithme", "replica.db"))
         )
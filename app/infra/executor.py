@@ -0,0 +1,52 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+from gi.repository import GLib
+
+
+class BackgroundExecutor:
+    """
+    Ejecuta las llamadas al servidor en un pool de hilos para no bloquear el
+    hilo principal de GTK, y entrega el resultado (o el error) en ese hilo con
+    GLib.idle_add, donde ya se pueden tocar widgets.
+
+    Cada petición lleva una clave: una petición nueva con la misma clave
+    sustituye a la anterior. Si la anterior aún no había empezado se cancela y,
+    si ya estaba en marcha, su resultado se descarta al llegar.
+    submit() y cancel() deben llamarse desde el hilo principal.
+    """
+    def __init__(self, max_workers: int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        # Petición vigente de cada clave
+        self._latest: dict[Hashable, Future] = {}
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args,
+               on_done: Callable[[Any], None], on_error: Callable[[Exception], None], **kwargs) -> Future:
+        self.cancel(key)
+        future = self._pool.submit(fn, *args, **kwargs)
+        self._latest[key] = future
+
+        def deliver():
+            # Una petición sustituida o cancelada no llega a la vista
+            if self._latest.get(key) is not future:
+                return GLib.SOURCE_REMOVE
+            del self._latest[key]
+            try:
+                result = future.result()
+            except Exception as e:
+                on_error(e)
+            else:
+                on_done(result)
+            return GLib.SOURCE_REMOVE
+
+        future.add_done_callback(lambda _future: GLib.idle_add(deliver))
+        return future
+
+    def cancel(self, key: Hashable):
+        future = self._latest.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def shutdown(self):
+        self._latest.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
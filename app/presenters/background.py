@@ -0,0 +1,50 @@
+from typing import Any, Callable, Hashable
+
+from app.infra.executor import BackgroundExecutor
+
+
+class BackgroundPresenter:
+    """
+    Base de los presenters: las llamadas al servidor se lanzan en el
+    BackgroundExecutor y sus resultados llegan a la vista en el hilo principal,
+    así que un servidor lento nunca congela la ventana.
+    Mientras haya peticiones en curso la vista muestra su estado de carga.
+    """
+    def __init__(self, view, executor: BackgroundExecutor):
+        self.view = view
+        self.executor = executor
+        self._pending: set[Hashable] = set()
+
+    def run(self, name: Hashable | None, fn: Callable[..., Any], *args,
+            on_done: Callable[[Any], None], error_message: str, **kwargs):
+        """
+        Lanza fn(*args, **kwargs) en segundo plano. Una petición con el mismo `name` que
+        otra en curso la sustituye; con name=None (altas, bajas...) nunca se
+        sustituye.
+        """
+        key = (id(self), name if name is not None else object())
+        self._pending.add(key)
+        self.view.show_loading(True)
+
+        def done(result):
+            self._finish(key)
+            on_done(result)
+
+        def failed(e):
+            self._finish(key)
+            self.view.show_error(f"{error_message}: {e}")
+
+        self.executor.submit(key, fn, *args, on_done=done, on_error=failed, **kwargs)
+
+    def is_loading(self, name: Hashable) -> bool:
+        return (id(self), name) in self._pending
+
+    def cancel(self, name: Hashable):
+        key = (id(self), name)
+        self.executor.cancel(key)
+        self._finish(key)
+
+    def _finish(self, key):
+        self._pending.discard(key)
+        if not self._pending:
+            self.view.show_loading(False)
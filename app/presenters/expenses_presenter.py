@@ -1,67 +1,79 @@
+from app.infra.executor import BackgroundExecutor
+from app.presenters.background import BackgroundPresenter
 from app.services.api_client import ApiClient
 
-class ExpensesPresenter:
-    def __init__(self, view, api_client):
-        self.view = view
+PAGE_SIZE = 100
+
+
+class ExpensesPresenter(BackgroundPresenter):
+    def __init__(self, view, api_client: ApiClient, executor: BackgroundExecutor):
+        super().__init__(view, executor)
         self.api_client = api_client
+        self._query = None
+        self._expenses = []
+
+    def load_expenses(self, query=None, status: str | None = None):
+        # Si hay texto en el campo de búsqueda se busca por ID o descripción en el servidor;
+        # si no, se carga la primera página de gastos. Una búsqueda nueva sustituye
+        # a la que siguiera en curso
+        self._query = query
+
+        def loaded(expenses):
+            self._expenses = expenses
+            self.view.show_expenses(self._expenses)
+            if status:
+                self.view.show_status(status)
+
+        self.run("list", self.api_client.list_expenses, query, limit=PAGE_SIZE,
+                 on_done=loaded, error_message="Error cargando gastos")
+
+    def load_more_expenses(self):
+        """Añade la siguiente página de gastos a la tabla actual."""
+        # Mientras llega una lista nueva no hay página siguiente que pedir
+        if not self._expenses or self.is_loading("list"):
+            return
 
-    def load_expenses(self, query=None):
-        try:
-            if query:
-                # Si hay texto en el campo de búsqueda
-                expenses = [self.api_client.get_expense(query)]
+        def loaded(more):
+            if more:
+                self._expenses = self._expenses + more
+                self.view.show_expenses(self._expenses)
             else:
-                # Si no hay texto, carga todos los gastos
-                expenses = self.api_client.list_expenses()
-            self.view.show_expenses(expenses)
-        except Exception as e:
-            self.view.show_error(f"Error cargando gastos: {e}")
+                self.view.show_error("No hay más gastos.")
+
+        self.run("list", self.api_client.list_expenses, self._query, after=self._expenses[-1].get("id"), limit=PAGE_SIZE,
+                 on_done=loaded, error_message="Error cargando gastos")
 
     def select_expense(self, expense_id):
-        try:
-            expense = self.api_client.get_expense(expense_id)
-            self.view.show_expense_detail(expense)
-        except Exception as e:
-            self.view.show_error(f"Error cargando detalle del gasto: {e}")
-    def create_expense(self, description, date, amount):
-        data = {
-            "id": 0,
-            "description": description,
-            "date": date,
-            "amount": amount,
-            "credit_balance": 0,
-            "num_friends": 1
-        }
-        r = self._client.post("/expenses/", json=data)
-        r.raise_for_status()
-        return r.json()
+        self.run("detail", self.api_client.get_expense, expense_id,
+                 on_done=self.view.show_expense_detail, error_message="Error cargando detalle del gasto")
+
+    def apply_changes(self, changes: dict | None):
+        """Aplica a la tabla actual los cambios publicados por el servidor (None: recargar)."""
+        if changes is None:
+            self.load_expenses(self._query)
+            return
+        updated = {expense["id"]: expense for expense in changes["expenses"]}
+        deleted = set(changes["deleted_expenses"])
+        shown = {expense.get("id") for expense in self._expenses}
+        if not (shown & (updated.keys() | deleted)):
+            return
+        self._expenses = [updated.get(expense.get("id"), expense) for expense in self._expenses
+                          if expense.get("id") not in deleted]
+        self.view.update_expenses([expense for expense_id, expense in updated.items() if expense_id in shown], deleted)
 
+    # Las escrituras no se sustituyen entre sí; al terminar se recarga la lista
+
+    def create_expense(self, description, date, amount):
+        self.run(None, self.api_client.create_expense, description, date, amount,
+                 on_done=lambda expense: self.load_expenses(self._query, f"Gasto creado: {expense.get('id', '?')}"),
+                 error_message="Error creando gasto")
 
     def update_expense(self, expense_id, data):
-        try:
-            self.api_client.update_expense(expense_id, data)
-            self.load_expenses()
-            self.view.show_status("Gasto actualizado correctamente.")
-        except Exception as e:
-            self.view.show_error(f"Error al actualizar gasto: {e}")
+        self.run(None, self.api_client.update_expense, expense_id, data,
+                 on_done=lambda _result: self.load_expenses(self._query, f"Gasto actualizado: {expense_id}"),
+                 error_message="Error al actualizar gasto")
 
     def delete_expense(self, expense_id):
-        try:
-            self.api_client.delete_expense(expense_id)
-            self.load_expenses()
-            self.view.show_status("Gasto eliminado.")
-        except Exception as e:
-            self.view.show_error(f"Error al eliminar gasto: {e}")
-    def add_expense(self, description, amount):
-        try:
-            data = {
-                "description": description,
-                "date": "2025-10-06",  # o datetime.date.today().isoformat()
-                "amount": float(amount)
-            }
-            self.api_client.create_expense(data)
-            self.view.show_status("Gasto añadido correctamente.")
-            self.load_expenses()
-        except Exception as e:
-            self.view.show_error(f"Error creando gasto: {e}")
-
+        self.run(None, self.api_client.delete_expense, expense_id,
+                 on_done=lambda _result: self.load_expenses(self._query, f"Gasto eliminado: {expense_id}"),
+                 error_message="Error al eliminar gasto")
@@ -1,31 +1,73 @@
-
 from typing import Any
 
-class FriendsPresenter:
+from app.infra.executor import BackgroundExecutor
+from app.presenters.background import BackgroundPresenter
+
+PAGE_SIZE = 100
+
+
+class FriendsPresenter(BackgroundPresenter):
     """
     Orquesta casos de uso de Amigos para la FriendsView.
     Respeta MVP: el Presenter NO conoce widgets; solo llama a métodos de la vista.
+    Las peticiones se hacen en segundo plano (ver BackgroundPresenter).
     """
-    def __init__(self, view, api_client):
-        self.view = view
+    def __init__(self, view, api_client, executor: BackgroundExecutor):
+        super().__init__(view, executor)
         self.api = api_client
+        self._query = None
+        self._friends = []
 
     def load_friends(self, query: str = ""):
-        try:
-            friends = self.api.list_friends()
-            if query:
-                q = query.strip().lower()
-                friends = [f for f in friends if q in str(f.get("name","")).lower()]
-            self.view.show_friends(friends)
-        except Exception as e:
-            self.view.show_error(f"Error cargando amigos: {e}")
+        # El filtrado por nombre y la paginación los hace el servidor; una
+        # búsqueda nueva sustituye a la que siguiera en curso
+        self._query = query.strip() if query else None
+
+        def loaded(friends):
+            self._friends = friends
+            self.view.show_friends(self._friends)
+
+        self.run("list", self.api.list_friends, self._query, limit=PAGE_SIZE,
+                 on_done=loaded, error_message="Error cargando amigos")
+
+    def load_more_friends(self):
+        """Añade la siguiente página de amigos a la lista actual."""
+        # Mientras llega una lista nueva no hay página siguiente que pedir
+        if not self._friends or self.is_loading("list"):
+            return
+
+        def loaded(more):
+            if more:
+                self._friends = self._friends + more
+                self.view.show_friends(self._friends)
+            else:
+                self.view.show_error("No hay más amigos.")
+
+        self.run("list", self.api.list_friends, self._query, after=self._friends[-1].get("id"), limit=PAGE_SIZE,
+                 on_done=loaded, error_message="Error cargando amigos")
+
+    def apply_changes(self, changes: dict | None):
+        """Aplica a la lista actual los cambios publicados por el servidor (None: recargar)."""
+        if changes is None:
+            self.load_friends(self._query)
+            return
+        updated = {friend["id"]: friend for friend in changes["friends"]}
+        deleted = set(changes["deleted_friends"])
+        shown = {friend.get("id") for friend in self._friends}
+        if not (shown & (updated.keys() | deleted)):
+            return
+        self._friends = [updated.get(friend.get("id"), friend) for friend in self._friends
+                         if friend.get("id") not in deleted]
+        self.view.update_friends([friend for friend_id, friend in updated.items() if friend_id in shown], deleted)
 
     def select_friend(self, friend_id: Any):
-        try:
-            friend = self.api.get_friend(friend_id)
+        def fetch():
+            # Detalle y gastos asociados en el mismo viaje al hilo de trabajo
+            return self.api.get_friend(friend_id), self.api.list_friend_expenses(friend_id)
+
+        def loaded(result):
+            friend, expenses = result
             self.view.show_friend_detail(friend)
-            # Cargar gastos asociados
-            expenses = self.api.list_friend_expenses(friend_id)
             self.view.show_friend_expenses(expenses)
-        except Exception as e:
-            self.view.show_error(f"Error cargando detalle del amigo: {e}")
+
+        self.run("detail", fetch, on_done=loaded, error_message="Error cargando detalle del amigo")
@@ -1,22 +1,37 @@
+import json
+
 import httpx
 
+from app.services.http_cache import HttpCache
+
 
 class ApiClient:
     """
     Cliente HTTP hacia tu servidor FastAPI.
 
     Endpoints asumidos:
-      - GET /friends/
+      - GET /friends/?search=&after=&limit=
       - GET /friends/{id}/
       - GET /friends/{id}/expenses/
-      - GET /expenses/
+      - GET /expenses/?search=&after=&limit=
       - GET /expenses/{id}/
       - POST /expenses/
       - PUT /expenses/{id}/
       - DELETE /expenses/{id}/
+      - POST /friends/bulk
+      - POST /expenses/bulk
+      - POST /expenses/friends/bulk
+      - GET /changes/?since=&limit=
+      - GET /events/ (Server-Sent Events)
+
+    Las lecturas pasan por una HttpCache (TTL + LRU, revalidación con ETag) y
+    las escrituras invalidan las entradas a las que afectan. Detrás de un
+    ReplicaClient la caché sobra (las vistas leen de la réplica) y se crea con
+    `cache_max_entries=0`.
     """
 
-    def __init__(self, base_url: str = "http://127.0.0.1:8000", timeout_s: float = 10.0):
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", timeout_s: float = 10.0,
+                 cache_ttl_s: float = 30.0, cache_max_entries: int = 256):
         self._base_url = base_url
         self._timeout_s = timeout_s
         self._client = httpx.Client(
@@ -24,44 +39,61 @@ class ApiClient:
             timeout=self._timeout_s,
             follow_redirects=True
         )
+        self._cache = HttpCache(cache_ttl_s, cache_max_entries)
 
-    # ---- Friends ----
-    def list_friends(self):
-        r = self._client.get("/friends/")
+    @staticmethod
+    def _page_params(search: str | None, after: int | None, limit: int | None) -> dict:
+        """Parámetros de paginación por cursor: `after` es el último ID de la página anterior."""
+        params = {"search": search, "after": after, "limit": limit}
+        return {k: v for k, v in params.items() if v is not None}
+
+    def _get(self, path: str, params: dict | None = None):
+        """GET con caché: sirve la copia local mientras es reciente y si no la revalida."""
+        key = self._cache.key(path, params)
+        entry = self._cache.get(key)
+        if entry is not None and self._cache.is_fresh(entry):
+            return json.loads(entry.content)
+
+        headers = self._cache.validators(entry) if entry is not None else {}
+        r = self._client.get(path, params=params, headers=headers)
+        if r.status_code == 304 and entry is not None:
+            self._cache.renew(key)
+            return json.loads(entry.content)
         r.raise_for_status()
+        self._cache.store(key, r.content, r.headers.get("etag"), r.headers.get("last-modified"))
         return r.json()
 
+    def _invalidate(self, *prefixes: str):
+        """Descarta de la caché las rutas que empiezan por alguno de los prefijos."""
+        self._cache.invalidate(lambda path: path.startswith(prefixes))
+
+    def clear_cache(self):
+        self._cache.invalidate()
+
+    # ---- Friends ----
+    def list_friends(self, query: str | None = None, after: int | None = None, limit: int | None = None):
+        """Obtiene una página de amigos, opcionalmente filtrando por nombre en el servidor."""
+        return self._get("/friends/", self._page_params(query, after, limit))
+
     def get_friend(self, friend_id: int | str):
-        r = self._client.get(f"/friends/{friend_id}/")
-        r.raise_for_status()
-        return r.json()
+        return self._get(f"/friends/{friend_id}/")
 
     def list_friend_expenses(self, friend_id: int | str):
-        r = self._client.get(f"/friends/{friend_id}/expenses/")
-        r.raise_for_status()
-        return r.json()
+        return self._get(f"/friends/{friend_id}/expenses/")
 
     # ---- Expenses ----
-    def list_expenses(self, query: str | None = None):
-        """Obtiene los gastos desde el backend, opcionalmente filtrando por ID o descripción."""
-        if query:
-            if query.isdigit():
-                r = self._client.get(f"/expenses/{query}")
-                r.raise_for_status()
-                return [r.json()]
-            else:
-                r = self._client.get("/expenses/", params={"search": query})
-                r.raise_for_status()
-                return r.json()
+    def list_expenses(self, query: str | None = None, after: int | None = None, limit: int | None = None):
+        """Obtiene una página de gastos desde el backend, opcionalmente filtrando por ID o descripción."""
+        if query and query.isdigit():
+            # Una búsqueda por ID no tiene más páginas
+            if after is not None:
+                return []
+            return [self._get(f"/expenses/{query}")]
         else:
-            r = self._client.get("/expenses/")
-            r.raise_for_status()
-            return r.json()
+            return self._get("/expenses/", self._page_params(query or None, after, limit))
 
     def get_expense(self, expense_id: int | str):
-        r = self._client.get(f"/expenses/{expense_id}/")
-        r.raise_for_status()
-        return r.json()
+        return self._get(f"/expenses/{expense_id}/")
 
     def create_expense(self, description: str, date: str, amount: float):
         """Crea un nuevo gasto."""
@@ -73,6 +105,8 @@ class ApiClient:
             "num_friends": 1
         }
         r = self._client.post("/expenses/", json=data)
+        # Un gasto nuevo aún no tiene amigos: solo cambian los listados de gastos
+        self._invalidate("/expenses")
         r.raise_for_status()
         return r.json()
 
@@ -82,15 +116,75 @@ class ApiClient:
         data.setdefault("credit_balance", 0.0)
         data.setdefault("num_friends", 1)
         r = self._client.put(f"/expenses/{expense_id}/", json=data)
+        # Cambian el gasto y los balances de sus amigos, que no se conocen aquí
+        self._invalidate("/expenses", "/friends")
         r.raise_for_status()
         return r.json() if r.text else {}
 
     def delete_expense(self, expense_id: int | str):
         """Elimina un gasto."""
         r = self._client.delete(f"/expenses/{expense_id}/")
+        self._invalidate("/expenses", "/friends")
         r.raise_for_status()
         return {"deleted": expense_id}
 
+    # ---- Changes ----
+    def get_changes(self, since: int = 0, limit: int | None = None):
+        """Página del feed de cambios posteriores al cursor `since`; sin caché, cada cursor se pide una vez."""
+        params = {"since": since, "limit": limit}
+        r = self._client.get("/changes/", params={k: v for k, v in params.items() if v is not None})
+        r.raise_for_status()
+        return r.json()
+
+    def stream_events(self, since: int | None = None):
+        """
+        Se suscribe a GET /events/ y devuelve (evento, datos) según llegan. Con
+        `since` el servidor manda antes los cambios posteriores a ese cursor.
+        Termina cuando el servidor cierra el stream.
+        """
+        headers = {"Accept": "text/event-stream"}
+        if since is not None:
+            headers["Last-Event-ID"] = str(since)
+        # El servidor manda un comentario cada 15 s aunque no haya cambios
+        timeout = httpx.Timeout(self._timeout_s, read=60.0)
+        with self._client.stream("GET", "/events/", headers=headers, timeout=timeout) as r:
+            r.raise_for_status()
+            event, data = "message", []
+            for line in r.iter_lines():
+                if not line:
+                    if data:
+                        yield event, json.loads("\n".join(data))
+                    event, data = "message", []
+                elif not line.startswith(":"):
+                    field, _, value = line.partition(":")
+                    value = value.removeprefix(" ")
+                    if field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
+
+    # ---- Bulk ----
+    def create_friends(self, friends: list[dict]):
+        """Crea varios amigos en una sola petición; devuelve el resultado de cada uno."""
+        r = self._client.post("/friends/bulk", json=friends)
+        self._invalidate("/friends")
+        r.raise_for_status()
+        return r.json()
+
+    def create_expenses(self, expenses: list[dict]):
+        """Crea varios gastos en una sola petición; devuelve el resultado de cada uno."""
+        r = self._client.post("/expenses/bulk", json=expenses)
+        self._invalidate("/expenses")
+        r.raise_for_status()
+        return r.json()
+
+    def add_participants(self, participants: list[dict]):
+        """Asigna amigos a gastos ({"expense_id", "friend_id"}) en una sola petición."""
+        r = self._client.post("/expenses/friends/bulk", json=participants)
+        self._invalidate("/expenses", "/friends")
+        r.raise_for_status()
+        return r.json()
+
     # ---- Util ----
     def close(self):
         """Cierra la sesión HTTP limpia y segura."""
@@ -0,0 +1,50 @@
+import threading
+from typing import Callable
+
+import httpx
+
+from app.services.replica_client import ReplicaClient
+
+
+class EventStream:
+    """
+    Escucha en un hilo propio los cambios que el servidor publica en GET /events/.
+
+    Cada evento trae la página de cambios, que se aplica tal cual a la réplica
+    y se entrega a `dispatch`, que decide cómo pasarla a la interfaz. Solo se
+    sincroniza con GET /changes/ al (re)conectar, para reenviar lo que esté en
+    cola, y tras un evento `reset` (el cliente se quedó atrás), que se entrega
+    como None: hay que recargar lo que se muestra. Al reconectar el stream
+    sigue desde el cursor de la réplica, así que no se pierde ningún cambio.
+    """
+    def __init__(self, client: ReplicaClient, dispatch: Callable[[dict | None], None], retry_s: float = 3.0):
+        self.client = client
+        self.dispatch = dispatch
+        self.retry_s = retry_s
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="events", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        # La lectura en curso no se interrumpe: el hilo termina con el siguiente evento o con el proceso
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.client.sync()
+                for event, data in self.client.api.stream_events(self.client.replica.cursor):
+                    if self._stopped.is_set():
+                        return
+                    if event == "changes":
+                        if self.client.apply_changes(data):
+                            self.dispatch(data)
+                    elif event == "reset":
+                        self.client.sync()
+                        self.dispatch(None)
+            except (httpx.HTTPError, ValueError):
+                # Sin conexión o stream cortado: se reintenta
+                pass
+            self._stopped.wait(self.retry_s)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class CacheEntry:
+    content: bytes
+    etag: str | None
+    last_modified: str | None
+    stored_at: float
+
+
+class HttpCache:
+    """
+    Caché de respuestas GET del ApiClient, por ruta y parámetros.
+
+    - Una entrada con menos de `ttl_s` segundos se sirve sin tocar la red.
+    - Pasado ese tiempo se revalida con If-None-Match / If-Modified-Since si el
+      servidor mandó ETag o Last-Modified: un 304 la renueva sin descargar el cuerpo.
+    - Al superar `max_entries` se descarta la usada hace más tiempo (LRU); con
+      `max_entries=0` no se guarda nada y cada lectura va al servidor.
+
+    Se guardan los bytes y no el JSON ya decodificado, para que nadie pueda
+    modificar por accidente lo que está en caché. El ApiClient se usa desde los
+    hilos del BackgroundExecutor, así que los accesos van con un lock.
+    """
+    def __init__(self, ttl_s: float = 30.0, max_entries: int = 256):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: str, params: dict | None) -> tuple:
+        return path, tuple(sorted((params or {}).items()))
+
+    def get(self, key: tuple) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.stored_at < self.ttl_s
+
+    @staticmethod
+    def validators(entry: CacheEntry) -> dict:
+        """Cabeceras para revalidar una entrada caducada."""
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, key: tuple, content: bytes, etag: str | None, last_modified: str | None):
+        with self._lock:
+            self._entries[key] = CacheEntry(content, etag, last_modified, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def renew(self, key: tuple):
+        """El servidor confirmó (304) que la entrada sigue siendo válida."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.stored_at = time.monotonic()
+
+    def invalidate(self, matches: Callable[[str], bool] = lambda _path: True):
+        """Descarta las entradas cuya ruta cumple `matches` (todas por defecto)."""
+        with self._lock:
+            for key in [key for key in self._entries if matches(key[0])]:
+                del self._entries[key]
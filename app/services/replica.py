@@ -0,0 +1,209 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS friend (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    credit_balance REAL NOT NULL,
+    debit_balance REAL NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expense (
+    id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    credit_balance REAL NOT NULL,
+    num_friends INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS link (
+    expense_id INTEGER NOT NULL,
+    friend_id INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (expense_id, friend_id)
+);
+CREATE INDEX IF NOT EXISTS ix_link_friend_id ON link (friend_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    expense_id INTEGER,
+    data TEXT
+);
+"""
+
+FRIEND_COLUMNS = ("id", "name", "credit_balance", "debit_balance", "version")
+EXPENSE_COLUMNS = ("id", "description", "date", "amount", "credit_balance", "num_friends", "version")
+
+
+def like(query: str) -> str:
+    """Patrón LIKE que busca `query` literalmente, como `contains` en el servidor."""
+    return "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class LocalReplica:
+    """
+    Copia local en SQLite de amigos, gastos y participaciones, al día hasta el
+    cursor del feed GET /changes/ guardado en `meta`. Las lecturas devuelven
+    diccionarios con la misma forma que la API.
+
+    También guarda la cola (`outbox`) de escrituras hechas sin conexión, que
+    ReplicaClient reenvía en orden. Los gastos creados sin conexión tienen un
+    id local negativo hasta que el servidor les asigna uno.
+
+    Se usa desde los hilos del BackgroundExecutor: una sola conexión protegida
+    con un lock.
+    """
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+
+    def _query(self, sql: str, params=()) -> list[dict]:
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(sql, params)]
+
+    # ---- Sincronización ----
+    @property
+    def cursor(self) -> int:
+        rows = self._query("SELECT value FROM meta WHERE key = 'cursor'")
+        return int(rows[0]["value"]) if rows else 0
+
+    def apply(self, page: dict):
+        """Aplica una página del feed y avanza el cursor, todo en una transacción."""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO friend ({', '.join(FRIEND_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                    [tuple(friend[column] for column in FRIEND_COLUMNS) for friend in page["friends"]])
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO expense ({', '.join(EXPENSE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(expense[column] for column in EXPENSE_COLUMNS) for expense in page["expenses"]])
+                connection.executemany("INSERT OR REPLACE INTO link (expense_id, friend_id, amount) VALUES (?, ?, ?)",
+                                       [(link["expense_id"], link["friend_id"], link["amount"]) for link in page["links"]])
+                connection.executemany("DELETE FROM friend WHERE id = ?", [(friend_id,) for friend_id in page["deleted_friends"]])
+                connection.executemany("DELETE FROM expense WHERE id = ?", [(expense_id,) for expense_id in page["deleted_expenses"]])
+                connection.executemany("DELETE FROM link WHERE expense_id = ? AND friend_id = ?",
+                                       [(link["expense_id"], link["friend_id"]) for link in page["deleted_links"]])
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('cursor', ?)", (str(page["cursor"]),))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def reset(self):
+        """Vacía la copia (no la cola) para volver a sincronizar desde el cursor 0."""
+        with self._lock:
+            self._connection.executescript("""
+                BEGIN;
+                DELETE FROM friend;
+                DELETE FROM link;
+                DELETE FROM expense WHERE id > 0;
+                DELETE FROM meta WHERE key = 'cursor';
+                COMMIT;
+            """)
+
+    # ---- Lecturas ----
+    def list_friends(self, query: str | None = None, after: int | None = None, limit: int | None = None) -> list[dict]:
+        sql, params = "SELECT * FROM friend WHERE id > ?", [after or 0]
+        if query:
+            sql += " AND name LIKE ? ESCAPE '\\'"
+            params.append(like(query))
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit or -1)
+        return self._query(sql, params)
+
+    def get_friend(self, friend_id: int) -> dict | None:
+        rows = self._query("SELECT * FROM friend WHERE id = ?", (friend_id,))
+        return rows[0] if rows else None
+
+    def list_friend_expenses(self, friend_id: int) -> list[dict]:
+        rows = self._query("""
+            SELECT expense.id, description, expense.amount, num_friends, link.amount AS credit_balance
+            FROM link JOIN expense ON expense.id = link.expense_id
+            WHERE link.friend_id = ?
+            ORDER BY expense.id
+        """, (friend_id,))
+        for row in rows:
+            # Como en el servidor: cada amigo debe la parte redondeada al céntimo hacia abajo
+            row["debit_balance"] = (round(row["amount"] * 100) // row["num_friends"]) / 100
+        return rows
+
+    def list_expenses(self, query: str | None = None, after: int | None = None, limit: int | None = None) -> list[dict]:
+        if query and query.isdigit():
+            if after is not None:
+                return []
+            expense = self.get_expense(int(query))
+            return [expense] if expense else []
+        if after is not None and after < 0:
+            return []
+        sql, params = "SELECT * FROM expense WHERE id > ?", [after or 0]
+        if query:
+            sql += " AND description LIKE ? ESCAPE '\\'"
+            params.append(like(query))
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit or -1)
+        expenses = self._query(sql, params)
+        if after is None:
+            # Los gastos pendientes de crear en el servidor (id < 0) encabezan la primera página
+            sql, params = "SELECT * FROM expense WHERE id < 0", []
+            if query:
+                sql += " AND description LIKE ? ESCAPE '\\'"
+                params.append(like(query))
+            expenses = self._query(sql + " ORDER BY id DESC", params) + expenses
+        return expenses
+
+    def get_expense(self, expense_id: int) -> dict | None:
+        rows = self._query("SELECT * FROM expense WHERE id = ?", (expense_id,))
+        return rows[0] if rows else None
+
+    # ---- Escrituras locales y cola ----
+    def put_expense(self, expense: dict):
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO expense ({', '.join(EXPENSE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                tuple(expense.get(column) for column in EXPENSE_COLUMNS))
+
+    def remove_expense(self, expense_id: int):
+        with self._lock:
+            self._connection.execute("DELETE FROM expense WHERE id = ?", (expense_id,))
+
+    def next_local_id(self) -> int:
+        rows = self._query("SELECT min(min(id), 0) - 1 AS id FROM expense")
+        return rows[0]["id"] if rows[0]["id"] is not None else -1
+
+    def enqueue(self, operation: str, expense_id: int | None, data: dict | None) -> int:
+        with self._lock:
+            return self._connection.execute("INSERT INTO outbox (operation, expense_id, data) VALUES (?, ?, ?)",
+                                            (operation, expense_id, json.dumps(data) if data is not None else None)).lastrowid
+
+    def pending(self) -> list[dict]:
+        rows = self._query("SELECT * FROM outbox ORDER BY id")
+        for row in rows:
+            row["data"] = json.loads(row["data"]) if row["data"] is not None else None
+        return rows
+
+    def update_pending(self, outbox_id: int, data: dict):
+        with self._lock:
+            self._connection.execute("UPDATE outbox SET data = ? WHERE id = ?", (json.dumps(data), outbox_id))
+
+    def dequeue(self, outbox_id: int):
+        with self._lock:
+            self._connection.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
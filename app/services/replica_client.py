@@ -0,0 +1,186 @@
+import threading
+
+import httpx
+
+from app.services.api_client import ApiClient
+from app.services.replica import LocalReplica
+
+SYNC_PAGE_SIZE = 1000
+EXPENSE_FIELDS = ("description", "date", "amount", "version")
+
+
+class ReplicaClient:
+    """
+    Cliente con la misma interfaz que ApiClient para los presenters, que lee de
+    la LocalReplica en lugar del servidor.
+
+    - La primera página de cada listado sincroniza antes la réplica con el feed
+      GET /changes/: solo se descarga lo que cambió desde el último cursor.
+    - Sin conexión se sigue leyendo de la réplica (`online` pasa a False).
+    - Las escrituras de gastos se encolan en la réplica, se aplican en local y se
+      reenvían en orden en cuanto el servidor responde. Si el servidor rechaza una
+      (4xx), se descarta y el gasto se vuelve a leer del servidor.
+    """
+    def __init__(self, api: ApiClient, replica: LocalReplica):
+        self.api = api
+        self.replica = replica
+        self.online = True
+        # Una sola sincronización a la vez; las escrituras la usan también para
+        # que la cola no cambie mientras se reenvía
+        self._sync_lock = threading.RLock()
+        self._rejected: dict[int, Exception] = {}
+        self._created: dict[int, dict] = {}
+
+    # ---- Sincronización ----
+    def sync(self) -> bool:
+        """Reenvía la cola y aplica los cambios del servidor; devuelve False si no hay conexión."""
+        with self._sync_lock:
+            try:
+                if self._replay():
+                    self._pull()
+                self.online = True
+            except httpx.TransportError:
+                self.online = False
+            return self.online
+
+    def _pull(self):
+        cursor = self.replica.cursor
+        while True:
+            try:
+                page = self.api.get_changes(cursor, SYNC_PAGE_SIZE)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 410:
+                    raise
+                # El cursor es de otra base de datos: se empieza de cero
+                self.replica.reset()
+                cursor = 0
+                continue
+            self.replica.apply(page)
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                return
+
+    def apply_changes(self, page: dict) -> bool:
+        """
+        Aplica una página de cambios recibida por GET /events/ sin volver a
+        pedirla al feed; devuelve False si la réplica ya la tenía.
+        """
+        with self._sync_lock:
+            if page["cursor"] <= self.replica.cursor:
+                return False
+            if self.replica.pending():
+                # Las escrituras en cola van antes que los cambios del servidor
+                self.sync()
+            else:
+                self.replica.apply(page)
+            return True
+
+    def _replay(self) -> bool:
+        """Reenvía las escrituras pendientes en orden; False si el servidor falla (5xx)."""
+        for entry in self.replica.pending():
+            operation, expense_id, data = entry["operation"], entry["expense_id"], entry["data"]
+            try:
+                if operation == "create":
+                    self._created[expense_id] = self.api.create_expense(data["description"], data["date"], data["amount"])
+                elif operation == "update":
+                    self.api.update_expense(expense_id, dict(data))
+                else:
+                    self.api.delete_expense(expense_id)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code >= 500:
+                    return False
+                self._rejected[entry["id"]] = e
+                if operation != "create":
+                    self._refresh_expense(expense_id)
+            self.replica.dequeue(entry["id"])
+            if operation == "create":
+                # La fila con el id del servidor llega con el feed
+                self.replica.remove_expense(expense_id)
+        return True
+
+    def _refresh_expense(self, expense_id: int):
+        try:
+            self.replica.put_expense(self.api.get_expense(expense_id))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            self.replica.remove_expense(expense_id)
+
+    def _submit(self, operation: str, expense_id: int, data: dict | None):
+        # Las escrituras van siempre detrás de las que ya estén en cola
+        outbox_id = self.replica.enqueue(operation, expense_id, data)
+        self.sync()
+        error = self._rejected.pop(outbox_id, None)
+        if error is not None:
+            raise error
+
+    # ---- Friends ----
+    def list_friends(self, query: str | None = None, after: int | None = None, limit: int | None = None):
+        if after is None:
+            self.sync()
+        return self.replica.list_friends(query, after, limit)
+
+    def get_friend(self, friend_id: int | str):
+        friend = self.replica.get_friend(int(friend_id))
+        if friend is None:
+            raise LookupError(f"Amigo '{friend_id}' no encontrado")
+        return friend
+
+    def list_friend_expenses(self, friend_id: int | str):
+        return self.replica.list_friend_expenses(int(friend_id))
+
+    # ---- Expenses ----
+    def list_expenses(self, query: str | None = None, after: int | None = None, limit: int | None = None):
+        if after is None:
+            self.sync()
+        return self.replica.list_expenses(query, after, limit)
+
+    def get_expense(self, expense_id: int | str):
+        expense = self.replica.get_expense(int(expense_id))
+        if expense is None:
+            raise LookupError(f"Gasto '{expense_id}' no encontrado")
+        return expense
+
+    def create_expense(self, description: str, date: str, amount: float):
+        data = {"description": description, "date": date, "amount": amount}
+        with self._sync_lock:
+            # Hasta que el servidor lo cree, el gasto tiene un id local negativo
+            local_id = self.replica.next_local_id()
+            self.replica.put_expense({**data, "id": local_id, "credit_balance": 0.0, "num_friends": 1, "version": 1})
+            self._submit("create", local_id, data)
+            return self._created.pop(local_id, None) or self.replica.get_expense(local_id)
+
+    def update_expense(self, expense_id: int | str, data: dict):
+        expense_id = int(expense_id)
+        changes = {field: data[field] for field in EXPENSE_FIELDS if field in data}
+        with self._sync_lock:
+            current = self.replica.get_expense(expense_id) or {"id": expense_id, "credit_balance": 0.0, "num_friends": 1, "version": 1}
+            self.replica.put_expense({**current, **changes})
+            if expense_id < 0:
+                # Aún no existe en el servidor: se cambia el alta pendiente
+                for entry in self.replica.pending():
+                    if entry["operation"] == "create" and entry["expense_id"] == expense_id:
+                        changes.pop("version", None)
+                        self.replica.update_pending(entry["id"], {**entry["data"], **changes})
+                self.sync()
+            else:
+                self._submit("update", expense_id, changes)
+            return {}
+
+    def delete_expense(self, expense_id: int | str):
+        expense_id = int(expense_id)
+        with self._sync_lock:
+            self.replica.remove_expense(expense_id)
+            if expense_id < 0:
+                # Aún no existe en el servidor: basta con olvidar su alta
+                for entry in self.replica.pending():
+                    if entry["expense_id"] == expense_id:
+                        self.replica.dequeue(entry["id"])
+            else:
+                self._submit("delete", expense_id, None)
+            return {"deleted": expense_id}
+
+    # ---- Util ----
+    def close(self):
+        self.api.close()
+        self.replica.close()
@@ -1,24 +1,52 @@
 import gi
 gi.require_version("Gtk", "4.0")
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, Gio
 
 from app.presenters.expenses_presenter import ExpensesPresenter
+from app.views.list_models import ExpenseItem, bound_factory, patch_store, sync_store
+
+
+def cell_label() -> Gtk.Label:
+    label = Gtk.Label(xalign=0)
+    label.add_css_class("table-cell")
+    return label
+
+
+def render_amount(label: Gtk.Label, item: ExpenseItem):
+    label.set_text(f"{item.amount}€")
+    label.remove_css_class("amount-negative")
+    label.remove_css_class("amount-positive")
+    if item.amount < 0:
+        label.add_css_class("amount-negative")
+    elif item.amount > 0:
+        label.add_css_class("amount-positive")
+
+
+# Título, ancho y contenido de cada columna
+COLUMNS = [
+    ("ID", 70, lambda label, item: label.set_text(str(item.id))),
+    ("DESCRIPTION", 280, lambda label, item: label.set_text(item.description)),
+    ("DATE", 150, lambda label, item: label.set_text(item.date)),
+    ("AMOUNT", 130, render_amount),
+    ("CREDIT", 130, lambda label, item: label.set_text(f"{item.credit_balance}€")),
+    ("FRIENDS", 100, lambda label, item: label.set_text(str(item.num_friends))),
+]
 
 
 class ExpensesView(Gtk.Box):
     """
     Vista de Gastos (GTK4):
-    - Tabla alineada con Grid
+    - Tabla virtualizada (Gtk.ColumnView sobre un Gio.ListStore): solo se crean
+      widgets para las filas visibles y se reciclan al hacer scroll
     - Búsqueda + botones (Create / Delete)
     - Selección de fila con resaltado
+    - Indicador de carga mientras hay peticiones en curso
     """
-    def __init__(self, api_client):
+    def __init__(self, api_client, executor):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=10,
                          margin_top=12, margin_bottom=12, margin_start=12, margin_end=12)
 
-        self.presenter = ExpensesPresenter(self, api_client)
-        self._expenses_data = []
-        self.selected_row_widget = None
+        self.presenter = ExpensesPresenter(self, api_client, executor)
         self.selected_id = None
 
         # --- Barra superior ---
@@ -34,6 +62,9 @@ class ExpensesView(Gtk.Box):
         btn_reload = Gtk.Button(label="Recargar")
         btn_reload.connect("clicked", self.on_reload_clicked)
 
+        btn_more = Gtk.Button(label="Cargar más")
+        btn_more.connect("clicked", self.on_more_clicked)
+
         btn_create = Gtk.Button(label="Create an expense")
         btn_create.add_css_class("create-expense-button")
         btn_create.connect("clicked", self.on_add_clicked)
@@ -45,24 +76,38 @@ class ExpensesView(Gtk.Box):
         top_bar.append(self.search_entry)
         top_bar.append(btn_search)
         top_bar.append(btn_reload)
+        top_bar.append(btn_more)
         top_bar.append(btn_create)
         top_bar.append(btn_delete)
 
         # --- Tabla principal ---
-        self.grid = Gtk.Grid(column_spacing=25, row_spacing=6)
-        self.grid.add_css_class("expenses-grid")
+        self.store = Gio.ListStore(item_type=ExpenseItem)
+        self.selection = Gtk.SingleSelection(model=self.store, autoselect=False, can_unselect=True)
+        self.selection.connect("selection-changed", self.on_selection_changed)
+
+        self.table = Gtk.ColumnView(model=self.selection, show_row_separators=True)
+        self.table.add_css_class("expenses-grid")
+        for title, width, render in COLUMNS:
+            column = Gtk.ColumnViewColumn(title=title, factory=bound_factory(cell_label, render))
+            column.set_fixed_width(width)
+            column.set_expand(title == "DESCRIPTION")
+            self.table.append_column(column)
 
         scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
-        scrolled.set_child(self.grid)
+        scrolled.set_child(self.table)
 
         # --- Estado inferior ---
+        status_bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.spinner = Gtk.Spinner(visible=False)
         self.status = Gtk.Label(xalign=0)
         self.status.add_css_class("status-label")
+        status_bar.append(self.spinner)
+        status_bar.append(self.status)
 
         # --- Montaje ---
         self.append(top_bar)
         self.append(scrolled)
-        self.append(self.status)
+        self.append(status_bar)
 
         self.presenter.load_expenses()
 
@@ -75,6 +120,9 @@ class ExpensesView(Gtk.Box):
         query = self.search_entry.get_text().strip()
         self.presenter.load_expenses(query if query else None)
 
+    def on_more_clicked(self, _btn):
+        self.presenter.load_more_expenses()
+
     def on_add_clicked(self, _btn):
         self.show_expense_dialog("Añadir gasto")
 
@@ -83,77 +131,38 @@ class ExpensesView(Gtk.Box):
         if not self.selected_id:
             self.show_error("Selecciona un gasto primero.")
             return
-        try:
-            self.presenter.api_client.delete_expense(self.selected_id)
-            self.presenter.load_expenses()
-            self.show_error(f"Gasto eliminado: {self.selected_id}")
-            self.selected_id = None
-            self.selected_row_widget = None
-        except Exception as e:
-            self.show_error(f"Error eliminando gasto: {e}")
+        self.presenter.delete_expense(self.selected_id)
+        self.selection.unselect_all()
+
+    def on_selection_changed(self, _selection, _position, _n_items):
+        item = self.selection.get_selected_item()
+        self.selected_id = item.id if item is not None else None
+        if item is not None:
+            self.show_error(f"Seleccionado: ID {self.selected_id}")
 
     # --- Presenter callbacks ---
     def show_expenses(self, expenses):
-        self._expenses_data = expenses or []
-
-        for child in list(self.grid):
-            self.grid.remove(child)
-
-        headers = ["ID", "DESCRIPTION", "DATE", "AMOUNT", "CREDIT", "FRIENDS"]
-        for col, text in enumerate(headers):
-            lbl = Gtk.Label(label=text, xalign=0)
-            lbl.add_css_class("table-header")
-            self.grid.attach(lbl, col, 0, 1, 1)
-
-        for row, e in enumerate(self._expenses_data, start=1):
-            values = [
-                str(e.get("id", "")),
-                e.get("description", ""),
-                e.get("date", ""),
-                f"{e.get('amount', 0)}€",
-                f"{e.get('credit_balance', 0)}€",
-                str(e.get("num_friends", 0)),
-            ]
-
-            row_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=25)
-            row_box.add_css_class("table-row")
-
-            for col, val in enumerate(values):
-                lbl = Gtk.Label(label=val, xalign=0)
-                lbl.add_css_class("table-cell")
-
-                if col == 3:
-                    try:
-                        amount = float(e.get("amount", 0))
-                        if amount < 0:
-                            lbl.add_css_class("amount-negative")
-                        elif amount > 0:
-                            lbl.add_css_class("amount-positive")
-                    except Exception:
-                        pass
-                row_box.append(lbl)
-
-            # Detectar clic en fila
-            click = Gtk.GestureClick()
-            click.connect("pressed", self.on_row_clicked, e, row_box)
-            row_box.add_controller(click)
-
-            self.grid.attach(row_box, 0, row, len(headers), 1)
-
-        self.status.set_text(f"{len(self._expenses_data)} gasto(s)")
-
-    def on_row_clicked(self, _gesture, _n_press, _x, _y, expense, row_widget):
-        """Resalta la fila seleccionada."""
-        if self.selected_row_widget:
-            self.selected_row_widget.remove_css_class("table-row-selected")
-        row_widget.add_css_class("table-row-selected")
-        self.selected_row_widget = row_widget
-        self.selected_id = expense.get("id")
-        self.show_error(f"Seleccionado: ID {self.selected_id}")
+        # Se aplican solo las diferencias con lo que ya se muestra
+        sync_store(self.store, expenses or [], ExpenseItem)
+        self.status.set_text(f"{self.store.get_n_items()} gasto(s)")
+
+    def update_expenses(self, expenses, deleted_ids):
+        # Cambios publicados por el servidor: solo se tocan esas filas
+        patch_store(self.store, expenses, deleted_ids)
+
+    def show_expense_detail(self, expense):
+        self.status.set_text(f"Gasto {expense.get('id')}: {expense.get('description', '')}")
+
+    def show_status(self, message: str):
+        self.status.set_text(message)
 
     def show_error(self, message: str):
         self.status.set_text(message)
 
+    def show_loading(self, loading: bool):
+        self.spinner.set_visible(loading)
+        self.spinner.set_spinning(loading)
+
     # --- Diálogo para crear/editar ---
     def show_expense_dialog(self, title, expense=None):
         dialog = Gtk.Dialog(
@@ -198,26 +207,11 @@ class ExpensesView(Gtk.Box):
                     return
 
                 if expense is None:
-                    try:
-                        new_expense = self.presenter.api_client.create_expense(
-                            description=description,
-                            date=date,
-                            amount=amount
-                        )
-                        self.presenter.load_expenses()
-                        self.show_error(f"Gasto creado: {new_expense.get('id', '?')}")
-                    except Exception as e:
-                        self.show_error(f"Error creando gasto: {e}")
+                    self.presenter.create_expense(description, date, amount)
                 else:
-                    try:
-                        expense["description"] = description
-                        expense["date"] = date
-                        expense["amount"] = amount
-                        self.presenter.api_client.update_expense(expense["id"], expense)
-                        self.presenter.load_expenses()
-                        self.show_error(f"Gasto actualizado: {expense['id']}")
-                    except Exception as e:
-                        self.show_error(f"Error actualizando gasto: {e}")
+                    # Copia: el diccionario de la tabla no se toca desde el hilo de trabajo
+                    data = {**expense, "description": description, "date": date, "amount": amount}
+                    self.presenter.update_expense(expense["id"], data)
             dlg.destroy()
 
         dialog.connect("response", on_response)
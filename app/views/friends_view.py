@@ -1,23 +1,58 @@
 import gi
 gi.require_version("Gtk", "4.0")
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, Gio
 
 from app.presenters.friends_presenter import FriendsPresenter
+from app.views.list_models import FriendItem, bound_factory, patch_store, sync_store
+
+
+def friend_row() -> Gtk.Box:
+    """Fila de la lista: nombre + usuario + balances. Se crea una vez y se recicla."""
+    row_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+    row_box.add_css_class("friend-row")
+
+    row_box.lbl_name = Gtk.Label(xalign=0)
+    row_box.lbl_name.add_css_class("friend-name")
+
+    row_box.lbl_user = Gtk.Label(xalign=0)
+    row_box.lbl_user.add_css_class("friend-username")
+
+    row_box.lbl_debit = Gtk.Label()
+    row_box.lbl_debit.add_css_class("debit-label")
+
+    row_box.lbl_credit = Gtk.Label()
+    row_box.lbl_credit.add_css_class("credit-label")
+
+    # Empaquetar
+    row_box.append(row_box.lbl_name)
+    row_box.append(row_box.lbl_user)
+    row_box.append(row_box.lbl_debit)
+    row_box.append(row_box.lbl_credit)
+    return row_box
+
+
+def render_friend(row_box: Gtk.Box, item: FriendItem):
+    row_box.lbl_name.set_text(item.name or f"Amigo {item.id}")
+    row_box.lbl_user.set_text(item.data.get("username", f"user{item.id}"))
+    row_box.lbl_debit.set_text(f"Debit: {item.debit_balance}€")
+    row_box.lbl_credit.set_text(f"Credit: {item.credit_balance}€")
 
 
 class FriendsView(Gtk.Box):
     """
     Vista de Amigos modernizada:
     - Búsqueda de amigos
-    - Lista visual con nombre, usuario y balances (Debit / Credit)
+    - Lista visual con nombre, usuario y balances (Debit / Credit), virtualizada
+      (Gtk.ListView sobre un Gio.ListStore) para que miles de amigos no cuesten más
+      que las filas visibles
     - Sin opción de añadir amigo
+    - Indicador de carga mientras hay peticiones en curso
     """
-    def __init__(self, api_client):
+    def __init__(self, api_client, executor):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=10,
                          margin_top=12, margin_bottom=12, margin_start=12, margin_end=12)
 
-        self.presenter = FriendsPresenter(self, api_client)
-        self._friends_data = []
+        self.presenter = FriendsPresenter(self, api_client, executor)
 
         # --- Barra superior (búsqueda) ---
         top_bar = Gtk.Box(spacing=8)
@@ -28,9 +63,13 @@ class FriendsView(Gtk.Box):
         btn_reload = Gtk.Button(label="Reload")
         btn_reload.connect("clicked", self.on_reload_clicked)
 
+        btn_more = Gtk.Button(label="Load more")
+        btn_more.connect("clicked", self.on_more_clicked)
+
         top_bar.append(self.search_entry)
         top_bar.append(btn_search)
         top_bar.append(btn_reload)
+        top_bar.append(btn_more)
 
         # --- Contenedor principal de contenido ---
         self.content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=15)
@@ -42,22 +81,29 @@ class FriendsView(Gtk.Box):
         self.content_box.append(title)
 
         # Scrolled window para lista de amigos
-        self.list_box = Gtk.ListBox()
-        self.list_box.add_css_class("friends-list")
-        self.list_box.connect("row_selected", self.on_row_selected)
+        self.store = Gio.ListStore(item_type=FriendItem)
+        self.selection = Gtk.SingleSelection(model=self.store, autoselect=False, can_unselect=True)
+        self.selection.connect("selection-changed", self.on_selection_changed)
+
+        self.list_view = Gtk.ListView(model=self.selection, factory=bound_factory(friend_row, render_friend))
+        self.list_view.add_css_class("friends-list")
 
         scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
-        scrolled.set_child(self.list_box)
+        scrolled.set_child(self.list_view)
         self.content_box.append(scrolled)
 
         # Estado / mensajes
+        status_bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.spinner = Gtk.Spinner(visible=False)
         self.status = Gtk.Label(xalign=0)
         self.status.add_css_class("status-label")
+        status_bar.append(self.spinner)
+        status_bar.append(self.status)
 
         # Montaje final
         self.append(top_bar)
         self.append(self.content_box)
-        self.append(self.status)
+        self.append(status_bar)
 
         # Carga inicial
         self.presenter.load_friends()
@@ -71,54 +117,23 @@ class FriendsView(Gtk.Box):
         self.search_entry.set_text("")
         self.presenter.load_friends()
 
-    def on_row_selected(self, _listbox, row):
-        if not row:
-            return
-        idx = row.get_index()
-        friend = self._friends_data[idx]
-        self.presenter.select_friend(friend.get("id"))
+    def on_more_clicked(self, _btn):
+        self.presenter.load_more_friends()
+
+    def on_selection_changed(self, _selection, _position, _n_items):
+        item = self.selection.get_selected_item()
+        if item is not None:
+            self.presenter.select_friend(item.id)
 
     # --- Métodos llamados por el Presenter ---
     def show_friends(self, friends):
-        self._friends_data = friends or []
+        # Se aplican solo las diferencias con lo que ya se muestra
+        sync_store(self.store, friends or [], FriendItem)
+        self.status.set_text(f"{self.store.get_n_items()} friend(s) loaded")
 
-        # Limpiar lista previa
-        for row in list(self.list_box):
-            self.list_box.remove(row)
-
-        # Crear filas con nombre + usuario + balances
-        for f in self._friends_data:
-            name = f.get("name", f"Amigo {f.get('id')}")
-            username = f.get("username", f"user{f.get('id')}")
-            debit = f.get("debit_balance", 0)
-            credit = f.get("credit_balance", 0)
-
-            # Fila contenedora
-            row_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
-            row_box.add_css_class("friend-row")
-
-            lbl_name = Gtk.Label(label=name, xalign=0)
-            lbl_name.add_css_class("friend-name")
-
-            lbl_user = Gtk.Label(label=username, xalign=0)
-            lbl_user.add_css_class("friend-username")
-
-            lbl_debit = Gtk.Label(label=f"Debit: {debit}€")
-            lbl_debit.add_css_class("debit-label")
-
-            lbl_credit = Gtk.Label(label=f"Credit: {credit}€")
-            lbl_credit.add_css_class("credit-label")
-
-            # Empaquetar
-            row_box.append(lbl_name)
-            row_box.append(lbl_user)
-            row_box.append(lbl_debit)
-            row_box.append(lbl_credit)
-
-            self.list_box.append(row_box)
-
-        self.list_box.show()
-        self.status.set_text(f"{len(self._friends_data)} friend(s) loaded")
+    def update_friends(self, friends, deleted_ids):
+        # Cambios publicados por el servidor: solo se tocan esas filas
+        patch_store(self.store, friends, deleted_ids)
 
     def show_friend_detail(self, friend):
         # Mantener compatibilidad para presenter
@@ -130,3 +145,8 @@ class FriendsView(Gtk.Box):
     def show_error(self, message: str):
         self.status.set_text(message)
 
+    def show_loading(self, loading: bool):
+        self.spinner.set_visible(loading)
+        self.spinner.set_spinning(loading)
+
+
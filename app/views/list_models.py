@@ -0,0 +1,130 @@
+import gi
+gi.require_version("Gtk", "4.0")
+from gi.repository import Gtk, Gio, GObject
+from typing import Callable
+
+
+class RowItem(GObject.Object):
+    """
+    Elemento de un Gio.ListStore creado a partir del diccionario que devuelve la API.
+    Cada campo de FIELDS es una propiedad GObject; update() solo cambia (y notifica)
+    las que tienen un valor distinto, así que las filas visibles se repintan solas.
+    """
+    FIELDS: tuple[str, ...] = ()
+
+    def __init__(self, data: dict):
+        super().__init__()
+        self.data = {}
+        self.update(data)
+
+    @property
+    def key(self):
+        return self.data.get("id")
+
+    def update(self, data: dict):
+        self.data = data
+        with self.freeze_notify():
+            for name in self.FIELDS:
+                value = data.get(name)
+                current = self.get_property(name)
+                if value is None:
+                    continue
+                value = type(current)(value)
+                if value != current:
+                    self.set_property(name, value)
+
+
+class FriendItem(RowItem):
+    id = GObject.Property(type=GObject.TYPE_INT64, default=0)
+    name = GObject.Property(type=str, default="")
+    debit_balance = GObject.Property(type=float, default=0.0)
+    credit_balance = GObject.Property(type=float, default=0.0)
+    FIELDS = ("id", "name", "debit_balance", "credit_balance")
+
+
+class ExpenseItem(RowItem):
+    id = GObject.Property(type=GObject.TYPE_INT64, default=0)
+    description = GObject.Property(type=str, default="")
+    date = GObject.Property(type=str, default="")
+    amount = GObject.Property(type=float, default=0.0)
+    credit_balance = GObject.Property(type=float, default=0.0)
+    num_friends = GObject.Property(type=int, default=0)
+    FIELDS = ("id", "description", "date", "amount", "credit_balance", "num_friends")
+
+
+def sync_store(store: Gio.ListStore, rows: list[dict], item_type: type[RowItem]):
+    """
+    Lleva el contenido de `store` a `rows` con un único splice: los elementos
+    del principio y del final que conservan su id se actualizan en su sitio y
+    solo se sustituye el tramo intermedio. Cargar otra página es un splice al
+    final y una recarga sin cambios no toca ningún widget.
+    """
+    old = list(store)
+    shortest = min(len(old), len(rows))
+
+    prefix = 0
+    while prefix < shortest and old[prefix].key == rows[prefix].get("id"):
+        old[prefix].update(rows[prefix])
+        prefix += 1
+
+    suffix = 0
+    while suffix < shortest - prefix and old[-1 - suffix].key == rows[-1 - suffix].get("id"):
+        old[-1 - suffix].update(rows[-1 - suffix])
+        suffix += 1
+
+    # Los elementos del tramo intermedio que siguen en la lista se reutilizan
+    removed = old[prefix:len(old) - suffix]
+    reusable = {item.key: item for item in removed}
+    added = []
+    for row in rows[prefix:len(rows) - suffix]:
+        item = reusable.pop(row.get("id"), None)
+        if item is None:
+            item = item_type(row)
+        else:
+            item.update(row)
+        added.append(item)
+
+    if removed or added:
+        store.splice(prefix, len(removed), added)
+
+
+def patch_store(store: Gio.ListStore, rows: list[dict], deleted_ids: set):
+    """
+    Actualiza en su sitio los elementos de `store` que tienen una fila en `rows`
+    y quita los de `deleted_ids`; las filas que no se están mostrando se ignoran.
+    Solo se repintan las filas visibles que cambian.
+    """
+    rows_by_id = {row.get("id"): row for row in rows}
+    for position in reversed(range(store.get_n_items())):
+        item = store.get_item(position)
+        if item.key in deleted_ids:
+            store.remove(position)
+        elif item.key in rows_by_id:
+            item.update(rows_by_id[item.key])
+
+
+def bound_factory(setup: Callable[[], Gtk.Widget],
+                  render: Callable[[Gtk.Widget, RowItem], None]) -> Gtk.SignalListItemFactory:
+    """
+    Factoría de filas recicladas: setup() crea el widget una vez y render() lo
+    rellena con el elemento que muestra en cada momento, también cuando este
+    cambia alguna de sus propiedades.
+    """
+    factory = Gtk.SignalListItemFactory()
+
+    def on_setup(_factory, list_item):
+        list_item.set_child(setup())
+
+    def on_bind(_factory, list_item):
+        widget, item = list_item.get_child(), list_item.get_item()
+        render(widget, item)
+        widget.bound = (item, item.connect("notify", lambda changed, _pspec: render(widget, changed)))
+
+    def on_unbind(_factory, list_item):
+        item, handler = list_item.get_child().bound
+        item.disconnect(handler)
+
+    factory.connect("setup", on_setup)
+    factory.connect("bind", on_bind)
+    factory.connect("unbind", on_unbind)
+    return factory
@@ -1,10 +1,14 @@
 import gi
 gi.require_version("Gtk", "4.0")
-from gi.repository import Gtk, Gio, Gdk
+from gi.repository import Gtk, Gio, Gdk, GLib
 
 from app.views.friends_view import FriendsView
 from app.views.expenses_view import ExpensesView
 from app.services.api_client import ApiClient
+from app.services.replica import LocalReplica
+from app.services.replica_client import ReplicaClient
+from app.services.event_stream import EventStream
+from app.infra.executor import BackgroundExecutor
 
 
 class MainWindow(Gtk.ApplicationWindow):
@@ -49,11 +53,32 @@ class MainWindow(Gtk.ApplicationWindow):
         self.stack.set_hexpand(True)
 
         # API client
-        self.api_client = ApiClient("http://127.0.0.1:8000")
+        config = self_app.config
+        if config.replica_path:
+            # Las vistas leen de la réplica local, que se sincroniza con el servidor
+            # y guarda las escrituras hechas sin conexión. La réplica sustituye a la
+            # caché HTTP: lo poco que aún se pide al servidor tiene que llegar al día
+            self.api_client = ReplicaClient(ApiClient(config.api_base_url, config.request_timeout_s, cache_max_entries=0),
+                                            LocalReplica(config.replica_path))
+        else:
+            # Sin réplica cada lectura va al servidor, a través de la caché HTTP
+            self.api_client = ApiClient(config.api_base_url, config.request_timeout_s, config.cache_ttl_s)
+
+        # Las peticiones se hacen fuera del hilo principal para que la ventana
+        # siga respondiendo aunque el servidor tarde
+        self.executor = BackgroundExecutor()
+        self.connect("close-request", self.on_close_request)
 
         # Vistas
-        self.friends_view = FriendsView(self.api_client)
-        self.expenses_view = ExpensesView(self.api_client)
+        self.friends_view = FriendsView(self.api_client, self.executor)
+        self.expenses_view = ExpensesView(self.api_client, self.executor)
+
+        # Cambios publicados por el servidor; se aplican en el hilo principal.
+        # Sin réplica no hay cursor desde el que seguirlos: la caché caduca sola
+        self.events = None
+        if isinstance(self.api_client, ReplicaClient):
+            self.events = EventStream(self.api_client, lambda changes: GLib.idle_add(self.on_changes, changes))
+            self.events.start()
 
         self.stack.add_titled(self.friends_view, "friends", "Friends")
         self.stack.add_titled(self.expenses_view, "expenses", "Expenses")
@@ -93,3 +118,15 @@ class MainWindow(Gtk.ApplicationWindow):
     def show_expenses(self, button):
         self.stack.set_visible_child_name("expenses")
 
+    def on_changes(self, changes):
+        self.friends_view.presenter.apply_changes(changes)
+        self.expenses_view.presenter.apply_changes(changes)
+        return GLib.SOURCE_REMOVE
+
+    def on_close_request(self, _window):
+        # Descarta las peticiones pendientes; las que estén en marcha terminan solas
+        if self.events is not None:
+            self.events.stop()
+        self.executor.shutdown()
+        return False
+
@@ -0,0 +1,55 @@
+"""
+Compara dos resultados de benchmarks/run.py, por ejemplo de dos commits.
+
+Muestra la variación de p50/p95, de las consultas SQL y del pico de memoria de
+cada caso y termina con error si alguno empeora más que el umbral indicado.
+
+Uso:
+    python -m benchmarks.compare antes.json despues.json
+    python -m benchmarks.compare antes.json despues.json --threshold 1.5
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: Path) -> dict:
+    report = json.loads(path.read_text(encoding="utf-8"))
+    return {dataset["dataset"]["expenses"]: dataset["results"] for dataset in report["datasets"]}
+
+
+def ratio(before: float, after: float) -> float:
+    return after / before if before else (1.0 if not after else float("inf"))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compara dos resultados de benchmarks")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.25, help="cociente de p95 a partir del cual hay regresión")
+    args = parser.parse_args(argv)
+
+    before, after = load(args.before), load(args.after)
+    regressions = []
+    for size in sorted(before.keys() & after.keys()):
+        print(f"{size} gastos:")
+        print(f"  {'caso':<55} {'p50':>7} {'p95':>7} {'consultas':>13} {'memoria':>8}")
+        for name in sorted(before[size].keys() & after[size].keys()):
+            old, new = before[size][name], after[size][name]
+            p95 = ratio(old["p95_ms"], new["p95_ms"])
+            queries = f"{old['queries']} -> {new['queries']}"
+            print(f"  {name:<55} {ratio(old['p50_ms'], new['p50_ms']):>6.2f}x {p95:>6.2f}x "
+                  f"{queries:>13} {ratio(old['peak_kib'], new['peak_kib']):>7.2f}x")
+            if p95 > args.threshold or new["queries"] > old["queries"]:
+                regressions.append(f"{size} {name}")
+
+    if regressions:
+        print("Regresiones:\n  " + "\n  ".join(regressions))
+        return 1
+    print("Sin regresiones")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Benchmark de todas las rutas de la API sobre bases de datos sembradas.
+
+Para cada tamaño se crea una base de datos nueva con datos deterministas
+(persistence/fixtures.py) y se lanzan las peticiones con el cliente de pruebas de
+FastAPI, dentro del mismo proceso. De cada caso se guarda la latencia
+(p50/p95/p99), el número de consultas SQL por petición y el pico de memoria
+(tracemalloc, en una pasada aparte para no distorsionar los tiempos).
+
+Cada tamaño se ejecuta en un subproceso, porque el motor de la base de datos
+se crea al importar persistence.database a partir de DB_URL. Las respuestas
+cacheadas por ResponseCacheMiddleware se invalidan antes de cada petición
+salvo con --cache.
+
+Uso:
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000 10000 100000 --iterations 50 --output bench.json
+    python -m benchmarks.run --sizes 10000 --distribution 1:1,2:1,10:1 --only "GET /friends/"
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from persistence.fixtures import DEFAULT_DISTRIBUTION
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = [1000, 10000, 100000]
+SAMPLED_LINKS = 1000
+SAMPLED_NAMES = 100
+
+
+@dataclass
+class Context:
+    client: object
+    rng: random.Random
+    friends: int
+    expenses: int
+    links: list[tuple[int, int]]
+    names: list[str]
+    created: int = 0
+
+    def unique(self) -> int:
+        self.created += 1
+        return self.created
+
+    def friend_id(self) -> int:
+        return self.rng.randint(1, self.friends)
+
+    def expense_id(self) -> int:
+        return self.rng.randint(1, self.expenses)
+
+    def link(self) -> tuple[int, int]:
+        return self.rng.choice(self.links)
+
+    def name(self) -> str:
+        return self.rng.choice(self.names)
+
+    def new_friend(self) -> int:
+        return self.client.post("/friends/", json={"name": f"Bench {self.unique()}"}).json()["id"]
+
+    def new_expense(self, num_friends: int = 0) -> int:
+        expense_id = self.client.post("/expenses/", json={"description": f"Bench {self.unique()}",
+                                                          "date": "2025-01-01", "amount": 90.0}).json()["id"]
+        for friend_id in self.rng.sample(range(1, self.friends + 1), min(num_friends, self.friends)):
+            self.client.post(f"/expenses/{expense_id}/friends", params={"friend_id": friend_id})
+        return expense_id
+
+    def new_link(self) -> tuple[int, int]:
+        expense_id = self.new_expense()
+        friend_id = self.friend_id()
+        self.client.post(f"/expenses/{expense_id}/friends", params={"friend_id": friend_id})
+        return expense_id, friend_id
+
+
+@dataclass
+class Case:
+    method: str
+    # Ruta tal y como está declarada en el router
+    route: str
+    # Preparación fuera de la medida: devuelve la URL y los argumentos de la petición
+    prepare: Callable[[Context], tuple[str, dict]]
+    label: str = ""
+    # Las rutas que recorren toda la base de datos se repiten menos veces
+    heavy: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.route}" + (f" [{self.label}]" if self.label else "")
+
+
+def import_file(ctx: Context) -> tuple[str, dict]:
+    records = "".join(json.dumps({"description": f"Importado {ctx.unique()}", "date": "2025-02-01", "amount": 30.0,
+                                  "participants": {ctx.name(): 10.0, f"Bench {ctx.unique()}": 0}}) + "\n"
+                      for _ in range(100))
+    return "/admin/import", {"files": {"file": ("bench.jsonl", records.encode())}}
+
+
+def fixtures(ctx: Context) -> tuple[str, dict]:
+    friends = [{"id": f"u{friend}", "name": f"Bench {ctx.unique()}"} for friend in range(10)]
+    expenses = [{"id": f"e{expense}", "description": f"Bench {ctx.unique()}", "date": "2025-03-01", "amount": 60.0,
+                 "participants": [f"u{friend}" for friend in ctx.rng.sample(range(10), 3)]} for expense in range(20)]
+    return "/admin/fixtures", {"json": {"friends": friends, "expenses": expenses}}
+
+
+def bulk_participants(ctx: Context) -> tuple[str, dict]:
+    expense_ids = [item["id"] for item in ctx.client.post("/expenses/bulk", json=[
+        {"description": f"Bench {ctx.unique()}", "date": "2025-01-01", "amount": 90.0} for _ in range(10)]).json()]
+    participants = [{"expense_id": expense_id, "friend_id": friend_id}
+                    for expense_id in expense_ids
+                    for friend_id in ctx.rng.sample(range(1, ctx.friends + 1), min(10, ctx.friends))]
+    return "/expenses/friends/bulk", {"json": participants}
+
+
+def rename_friend(ctx: Context) -> tuple[str, dict]:
+    # Se conserva el nombre sembrado para no alterar los datos
+    friend_id = ctx.friend_id()
+    name = ctx.client.get(f"/friends/{friend_id}").json()["name"]
+    return f"/friends/{friend_id}", {"json": {"name": name}}
+
+
+def update_expense(ctx: Context) -> tuple[str, dict]:
+    expense_id = ctx.new_expense(num_friends=3)
+    return f"/expenses/{expense_id}", {"json": {"description": f"Bench {ctx.unique()}", "date": "2025-01-02", "amount": 120.5}}
+
+
+CASES = [
+    Case("GET", "/friends/", lambda ctx: ("/friends/", {"params": {"after": ctx.friend_id(), "limit": 100}})),
+    Case("GET", "/friends/", lambda ctx: ("/friends/", {"params": {"search": ctx.name()}}), label="search"),
+    Case("GET", "/friends/{friend_id}", lambda ctx: (f"/friends/{ctx.friend_id()}", {})),
+    Case("GET", "/friends/{friend_id}/expenses", lambda ctx: (f"/friends/{ctx.friend_id()}/expenses", {})),
+    Case("POST", "/friends/", lambda ctx: ("/friends/", {"json": {"name": f"Bench {ctx.unique()}"}})),
+    Case("POST", "/friends/bulk", lambda ctx: ("/friends/bulk", {"json": [{"name": f"Bench {ctx.unique()}"} for _ in range(100)]})),
+    Case("PUT", "/friends/{friend_id}", rename_friend),
+    Case("DELETE", "/friends/{friend_id}", lambda ctx: (f"/friends/{ctx.new_friend()}", {})),
+    Case("GET", "/expenses/", lambda ctx: ("/expenses/", {"params": {"after": ctx.expense_id(), "limit": 100}})),
+    Case("GET", "/expenses/", lambda ctx: ("/expenses/", {"params": {"search": f"#{ctx.expense_id()}"}}), label="search"),
+    Case("GET", "/expenses/", lambda ctx: ("/expenses/", {"params": {"date_from": "2024-03-01", "date_to": "2024-03-31"}}), label="dates"),
+    Case("GET", "/expenses/{expense_id}", lambda ctx: (f"/expenses/{ctx.expense_id()}", {})),
+    Case("POST", "/expenses/", lambda ctx: ("/expenses/", {"json": {"description": f"Bench {ctx.unique()}", "date": "2025-01-01", "amount": 42.5}})),
+    Case("POST", "/expenses/bulk", lambda ctx: ("/expenses/bulk", {"json": [{"description": f"Bench {ctx.unique()}", "date": "2025-01-01", "amount": 42.5} for _ in range(100)]})),
+    Case("PUT", "/expenses/{expense_id}", update_expense),
+    Case("DELETE", "/expenses/{expense_id}", lambda ctx: (f"/expenses/{ctx.new_expense(num_friends=3)}", {})),
+    Case("GET", "/expenses/{expense_id}/friends", lambda ctx: (f"/expenses/{ctx.link()[0]}/friends", {})),
+    Case("GET", "/expenses/{expense_id}/friends/{friend_id}", lambda ctx: ("/expenses/{}/friends/{}".format(*ctx.link()), {})),
+    Case("POST", "/expenses/{expense_id}/friends", lambda ctx: (f"/expenses/{ctx.new_expense(num_friends=3)}/friends", {"params": {"friend_id": ctx.friend_id()}})),
+    Case("POST", "/expenses/friends/bulk", bulk_participants),
+    Case("PUT", "/expenses/{expense_id}/friends/{friend_id}", lambda ctx: ("/expenses/{}/friends/{}".format(*ctx.link()), {"params": {"amount": 1.5}})),
+    Case("DELETE", "/expenses/{expense_id}/friends/{friend_id}", lambda ctx: ("/expenses/{}/friends/{}".format(*ctx.new_link()), {})),
+    Case("GET", "/settlements/", lambda ctx: ("/settlements/", {}), heavy=True),
+    Case("GET", "/export/friends", lambda ctx: ("/export/friends", {}), heavy=True),
+    Case("GET", "/export/expenses", lambda ctx: ("/export/expenses", {}), heavy=True),
+    Case("GET", "/export/ledger", lambda ctx: ("/export/ledger", {"params": {"format": "csv"}}), heavy=True),
+    Case("GET", "/dashboard/{year}", lambda ctx: ("/dashboard/2024", {})),
+    Case("GET", "/dashboard/{year}/{month}", lambda ctx: ("/dashboard/2024/3", {})),
+    Case("GET", "/ledger/", lambda ctx: ("/ledger/", {"params": {"friend_id": ctx.friend_id()}})),
+    Case("GET", "/ledger/friends/{friend_id}", lambda ctx: (f"/ledger/friends/{ctx.friend_id()}", {})),
+    Case("GET", "/ledger/friends/{friend_id}", lambda ctx: (f"/ledger/friends/{ctx.friend_id()}", {"params": {"as_of": "2024-06-01T00:00:00"}}), label="as_of"),
+    Case("GET", "/ledger/expenses/{expense_id}", lambda ctx: (f"/ledger/expenses/{ctx.link()[0]}", {})),
+    Case("GET", "/changes/", lambda ctx: ("/changes/", {"params": {"since": ctx.rng.randrange(ctx.expenses), "limit": 1000}})),
+    Case("POST", "/admin/compact", lambda ctx: ("/admin/compact", {})),
+    Case("POST", "/admin/import", import_file),
+    Case("POST", "/admin/fixtures", fixtures),
+]
+
+
+STREAMING_ROUTES = {("GET", "/events/")}
+
+
+def percentile(quantiles: list[float], p: int) -> float:
+    return round(quantiles[p - 1] * 1000, 3)
+
+
+def summarize(latencies: list[float], queries: list[int], statuses: list[int]) -> dict:
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {"iterations": len(latencies),
+            "p50_ms": percentile(quantiles, 50),
+            "p95_ms": percentile(quantiles, 95),
+            "p99_ms": percentile(quantiles, 99),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "queries": statistics.median_low(queries),
+            "max_queries": max(queries),
+            "errors": sum(1 for status in statuses if status >= 400)}
+
+
+def run_worker(args) -> dict:
+    # El motor se crea con el DB_URL de este subproceso al importar los módulos
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from sqlmodel import select, Session
+    import main
+    from persistence.database import engine
+    from persistence.generation import data_generation
+    from persistence.migrations import migrate
+    from persistence.models import Friend, FriendExpenseLink
+    from persistence.fixtures import generate_data
+
+    migrate(engine)
+    started = time.perf_counter()
+    num_friends = max(1, int(args.size * args.friends_ratio))
+    generated = generate_data(engine, num_friends, args.size, args.distribution, args.seed)
+    dataset = {"expenses": generated.expenses, "friends": generated.friends, "links": generated.links,
+               "distribution": args.distribution, "seed": args.seed,
+               "seed_seconds": round(time.perf_counter() - started, 3)}
+
+    queries = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*_):
+        queries[0] += 1
+
+    with Session(engine) as session:
+        links = session.exec(select(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id)
+                             .order_by(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id)).all()
+        names = session.exec(select(Friend.name).order_by(Friend.id).limit(SAMPLED_NAMES)).all()
+    links = random.Random(args.seed).sample(links, min(SAMPLED_LINKS, len(links))) or [(1, 1)]
+
+    results = {}
+    with TestClient(main.app) as client:
+        ctx = Context(client, random.Random(args.seed), num_friends, args.size, links, names)
+
+        def measure(case: Case, iterations: int, trace: bool) -> tuple[list[float], list[int], list[int], int]:
+            latencies, counts, statuses, peak = [], [], [], 0
+            for _ in range(iterations):
+                url, kwargs = case.prepare(ctx)
+                if not args.cache:
+                    data_generation.bump()
+                if trace:
+                    tracemalloc.reset_peak()
+                queries[0] = 0
+                request_started = time.perf_counter()
+                response = client.request(case.method, url, **kwargs)
+                latencies.append(time.perf_counter() - request_started)
+                counts.append(queries[0])
+                statuses.append(response.status_code)
+                if trace:
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+            return latencies, counts, statuses, peak
+
+        for case in CASES:
+            if args.only and case.name not in args.only and f"{case.method} {case.route}" not in args.only:
+                continue
+            iterations = max(3, args.iterations // 10) if case.heavy else args.iterations
+            measure(case, args.warmup, trace=False)
+            latencies, counts, statuses, _ = measure(case, iterations, trace=False)
+            tracemalloc.start()
+            _, _, _, peak = measure(case, args.memory_iterations, trace=True)
+            tracemalloc.stop()
+            results[case.name] = {"method": case.method, "route": case.route,
+                                  **summarize(latencies, counts, statuses),
+                                  "peak_kib": round(peak / 1024, 1)}
+            print(f"  {case.name:<55} p50 {results[case.name]['p50_ms']:>9.2f} ms  "
+                  f"p99 {results[case.name]['p99_ms']:>9.2f} ms  "
+                  f"{results[case.name]['queries']:>5} consultas  {results[case.name]['peak_kib']:>9.1f} KiB", flush=True)
+
+        # Rutas de la API sin ningún caso de benchmark; los streams sin fin no se cronometran
+        covered = {(case.method, case.route) for case in CASES} | STREAMING_ROUTES
+        uncovered = [f"{method.upper()} {path}"
+                     for path, operations in main.app.openapi()["paths"].items()
+                     for method in operations
+                     if (method.upper(), path) not in covered]
+
+    return {"dataset": dataset, "results": results, "uncovered_routes": uncovered}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las rutas de la API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="número de gastos de cada base de datos")
+    parser.add_argument("--friends-ratio", type=float, default=0.1, help="amigos por cada gasto sembrado")
+    parser.add_argument("--distribution", default=DEFAULT_DISTRIBUTION, help="amigos por gasto, como tamaño:peso,...")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--memory-iterations", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="no invalidar la caché de respuestas entre peticiones")
+    parser.add_argument("--only", nargs="+", help="casos a ejecutar, por ejemplo \"GET /friends/\"")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_output is not None:
+        args.worker_output.write_text(json.dumps(run_worker(args)), encoding="utf-8")
+        return
+
+    report = {"commit": git_commit(),
+              "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "settings": {"iterations": args.iterations, "warmup": args.warmup,
+                           "memory_iterations": args.memory_iterations, "cache": args.cache},
+              "datasets": []}
+    for size in args.sizes:
+        print(f"{size} gastos:", flush=True)
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "result.json"
+            env = {**os.environ, "DB_URL": f"sqlite:///{Path(directory) / 'bench.db'}", "DB_ECHO": "0",
+                   "DB_COMPACTION_INTERVAL_S": "0"}
+            command = [sys.executable, "-m", "benchmarks.run", "--size", str(size), "--worker-output", str(output),
+                       "--friends-ratio", str(args.friends_ratio), "--distribution", args.distribution,
+                       "--seed", str(args.seed), "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+                       "--memory-iterations", str(args.memory_iterations)]
+            if args.cache:
+                command.append("--cache")
+            if args.only:
+                command += ["--only", *args.only]
+            subprocess.run(command, cwd=ROOT, env=env, check=True)
+            report["datasets"].append(json.loads(output.read_text(encoding="utf-8")))
+
+    uncovered = sorted({route for dataset in report["datasets"] for route in dataset["uncovered_routes"]})
+    if uncovered and not args.only:
+        print("Rutas sin caso de benchmark: " + ", ".join(uncovered))
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Resultados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,41 @@
-from fastapi import FastAPI
+import asyncio
+import math
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from sqlalchemy.exc import IntegrityError
 
+from persistence.database import config, engine, write_engine, async_engine
+from middleware.cache import ResponseCacheMiddleware
+from middleware.metrics import MetricsMiddleware, instrument
 from persistence.utils import create_db_and_tables, init_db_if_empty
+from persistence.ledger import compact_periodically
+from persistence.read_model import read_model
+from persistence.events import hub
 
-from routers import friends, expenses, friend_expenses
+from routers import friends, expenses, friend_expenses, admin, exports, settlements, metrics, ledger, dashboard, changes, events
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     init_db_if_empty()
+    if config.read_model:
+        read_model.rebuild(engine)
+    compaction = None
+    if config.compaction_interval_s > 0:
+        compaction = asyncio.create_task(compact_periodically(write_engine, config.compaction_interval_s))
+    broadcast = asyncio.create_task(hub.run(engine))
     yield
+    for task in (compaction, broadcast):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 tags_metadata = [
@@ -25,6 +50,34 @@ tags_metadata = [
 {
         "name": "friend_expenses",
         "description": "CRUD operations with expenses and friends.",
+    },
+    {
+        "name": "settlements",
+        "description": "Who should pay whom to clear every balance.",
+    },
+    {
+        "name": "export",
+        "description": "Streaming NDJSON/CSV dumps of friends, expenses and balances.",
+    },
+    {
+        "name": "dashboard",
+        "description": "Spending per month and per friend, for a month or a year.",
+    },
+    {
+        "name": "ledger",
+        "description": "Every credit change as an immutable event, and the credits as of any date.",
+    },
+    {
+        "name": "changes",
+        "description": "Feed of the friends, expenses and links changed since a cursor, to keep replicas in sync.",
+    },
+    {
+        "name": "events",
+        "description": "Server-Sent Events pushed when friends, expenses or links change.",
+    },
+    {
+        "name": "admin",
+        "description": "Data import and maintenance.",
     }
 ]
 
@@ -40,17 +93,19 @@ description = """
 You will able to:
 * **➕ Create a friend**: requires only one attribute, the `name` 
 * **🔍 Retrieve friend info**: includes the internal `id`, the `name` as well as the total `credit balance` and `debit balance`.
-* **📋 Retrive the list of friends**: shows all friends with their `id`, `name`, total `credit balance` and total `debit balance`.
+* **📋 Retrive the list of friends**: shows friends with their `id`, `name`, total `credit balance` and total `debit balance`, one page at a time (`limit`, and `after` set to the last `id` of the previous page) and optionally filtered by a `search` substring of the name.
 * **📋 Retrive a friend list of expenses**: shows all expenses splitted with the specified friend with their `id`, `description`, `amount`, `num friends` that share the expense, `credit balance` and `debit balance`.
-* **✏️ Update a friend**: you can modify the `name` of a friend.
+* **📥 Create many friends at once**: send a list of friends and get back the new `id` (or the error) of each one.
+* **✏️ Update a friend**: you can modify the `name` of a friend. Send the `version` you read to get a 409 instead of overwriting a concurrent change.
 * **❌ Delete a friend**: only possible if their current credit balance is 0.
 
 ### 💵 Expenses
 You will able to:
 * **➕ Create an expense**: requires `description`, `date` (format: YYYY-MM-DD) and `amount`
 * **🔍 Retrieve expense info**: includes the internal `id`, the `description`, `date`, `amount` and the total `credit balance`.
-* **📋 Retrive the list of expenses**: shows all expenses with their `id`, `description`, `date`, `amount`, `num friends` that split the expense and  total `credit balance`.
-* **✏️ Update an expense**: you can change the `description`, `date` or `amount`.
+* **📋 Retrive the list of expenses**: shows expenses with their `id`, `description`, `date`, `amount`, `num friends` that split the expense and  total `credit balance`, one page at a time (`limit`, and `after` set to the last `id` of the previous page) and optionally filtered by a `search` substring of the description and a `date_from`/`date_to` range.
+* **📥 Create many expenses at once**: send a list of expenses and get back the new `id` (or the error) of each one.
+* **✏️ Update an expense**: you can change the `description`, `date` or `amount`. Send the `version` you read to get a 409 instead of overwriting a concurrent change.
 * **❌ Delete an expense**
 
 
@@ -58,11 +113,43 @@ You will able to:
 You will able to:
 
 * **👥 Assign a friend to an expense**: their initial credit balance will be 0 by default.
+* **📥 Assign many friends to expenses at once**: send a list of `expense_id`/`friend_id` pairs and get back the result of each one.
 * **🔍 Retrieve friend-expense info**: get the `id`, `name` as well as the`credit balance` and the `debit balance` for a friend relative to a specific expense.
 * **📋 Retrieve all friends sharing an expense**:  returns a list with each friend's internal `id`, `name, `credit balance` and `debit balance` for that expense.
-* **✏️ Update a friend's credit for an expense**: increases the friend's `credit balance`  by the specified `amount`.  
+* **✏️ Update a friend's credit for an expense**: increases the friend's `credit balance`  by the specified `amount`. Concurrent payments are all applied.  
 * **❌ Delete a friend from an expense**: only possible if their current credit balance is 0.
 
+### 🤝 Settle up
+You will able to:
+
+* **🤝 Get the transfers that clear every balance**: who pays whom and how much so that every friend, and you, end up at zero, with at most one payment fewer than the people involved.
+
+### 📅 Dashboard
+You will able to:
+
+* **📅 Get the totals of a month or a year**: number of expenses, `amount` and `credit balance` of each month, and the `num expenses`, `credit balance` and `debit balance` of each friend in the period. They are read from monthly totals kept up to date on every write, so they cost the same however many expenses there are.
+
+### 📒 Ledger
+You will able to:
+
+* **📋 Retrieve the payment ledger**: every change to a friend's credit in an expense (`payment`, `opening`, `reversal` or `adjustment`) with its `amount` and `created_at`, one page at a time and optionally filtered by `expense_id` and/or `friend_id`. Events are never modified, so the history can be audited.
+* **🕰️ Rebuild credits as of any date**: the `credit balance` of a friend or an expense, link by link, as of `as_of` (now by default), even for friends and expenses deleted since then.
+
+### 🔄 Changes
+You will able to:
+
+* **🔄 Sync a local copy**: get the current state of every friend, expense and friend-expense link changed since a `since` cursor (0 for everything), with the rows deleted in between listed by key. Save the returned `cursor` and ask again from it while `has_more` is true; later syncs only cost the delta. A 410 means the cursor belongs to another database and the copy has to start over.
+
+### 📡 Events
+You will able to:
+
+* **📡 Get changes pushed as they happen**: `GET /events/` is a Server-Sent Events stream with a `changes` event, with the same content as a `GET /changes/` page, after every write. The event `id` is the feed cursor: reconnect with `Last-Event-ID` (or `since`) to receive what was missed. A `reset` event means the stream can no longer catch up and the client has to sync from `GET /changes/`.
+
+### 📤 Export
+You will able to:
+
+* **📤 Download friends, expenses or the full friend × expense ledger** with their balances as NDJSON (`format=ndjson`) or CSV (`format=csv`). Rows are streamed as they are read, so exports of any size start right away.
+
 """
 
 app = FastAPI(
@@ -74,6 +161,25 @@ app = FastAPI(
     openapi_tags=tags_metadata,
 )
 
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
+    # Rejected amounts like NaN or Infinity are echoed back as strings, JSON has no such numbers
+    errors = jsonable_encoder(exc.errors(), custom_encoder={float: lambda value: value if math.isfinite(value) else str(value)})
+    return JSONResponse(status_code=422, content={"detail": errors})
+
+
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError) -> JSONResponse:
+    # A write that breaks a constraint conflicts with the stored data; the
+    # session of the request has already rolled back when it closed
+    return JSONResponse(status_code=409, content={"detail": "Request conflicts with the stored data"})
+
+
+# Cache the GET responses of friends, expenses and dashboards until the next write
+app.add_middleware(ResponseCacheMiddleware, prefixes=("/friends", "/expenses", "/dashboard"))
+
 # Enable CORS
 origins = [
     "*",
@@ -86,7 +192,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(friends.router)
-app.include_router(expenses.router)
-app.include_router(friend_expenses.router)
+# Count the SQL of every request, outermost so that cached responses are measured too
+instrument(engine)
+if async_engine is not None:
+    instrument(async_engine.sync_engine)
+app.add_middleware(MetricsMiddleware)
+
+if config.use_async:
+    from routers.async_routes import make_async_router
+
+    app.include_router(make_async_router(friends.router))
+    app.include_router(make_async_router(expenses.router))
+    app.include_router(make_async_router(friend_expenses.router))
+else:
+    app.include_router(friends.router)
+    app.include_router(expenses.router)
+    app.include_router(friend_expenses.router)
+
+app.include_router(settlements.router)
+app.include_router(dashboard.router)
+app.include_router(exports.router)
+app.include_router(ledger.router)
+app.include_router(changes.router)
+app.include_router(events.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
 
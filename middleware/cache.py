@@ -0,0 +1,79 @@
+"""
+Response cache for the GET endpoints, with ETag / If-None-Match support.
+
+Responses are cached by path and query string and tagged with the data
+generation they were built at (see persistence/generation.py). Their ETag
+combines that generation with a digest of the path and query string. A cached
+response is served while no write has been committed since; a request whose
+If-None-Match still matches gets a bodiless 304 without running the handler
+at all.
+"""
+import hashlib
+from collections import OrderedDict
+
+from persistence.generation import data_generation
+
+MAX_ENTRIES = 1024
+
+
+def digest(key: tuple[str, bytes]) -> str:
+    # Scopes the ETag to the request, a tag of one URL never validates another
+    path, query_string = key
+    return hashlib.blake2b(path.encode() + b"?" + query_string, digest_size=8).hexdigest()
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app, prefixes: tuple[str, ...], max_entries: int = MAX_ENTRIES):
+        self.app = app
+        self.prefixes = prefixes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        generation = data_generation.value
+        key = (scope["path"], scope["query_string"])
+        etag = f'"{data_generation.run_id}-{generation}-{digest(key)}"'.encode()
+        request_headers = dict(scope["headers"])
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(b",")]:
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [(b"etag", etag), (b"cache-control", b"no-cache")]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == generation:
+            self.entries.move_to_end(key)
+            _, headers, body = entry
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        status = None
+        headers = None
+        chunks = []
+
+        async def send_and_capture(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if status == 200:
+                    headers = [*message.get("headers", []), (b"etag", etag), (b"cache-control", b"no-cache")]
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and status == 200:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and data_generation.value == generation:
+                    self.store(key, (generation, headers, b"".join(chunks)))
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
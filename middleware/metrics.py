@@ -0,0 +1,200 @@
+"""
+Request metrics: SQL queries and time per request, Server-Timing headers and
+the counters published by GET /metrics in the Prometheus text format.
+
+instrument() hooks the cursor events of an engine. Queries run while a
+request is being served are added to that request's RequestStats, which is
+found through a context variable: the threadpool, run_sync and the streaming
+iterators all copy the context, so they see the object the middleware set.
+The Server-Timing header is sent with the response start, so the SQL of a
+streamed body only shows up in /metrics.
+"""
+import re
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import Engine, event
+from starlette.routing import compile_path
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED = "unmatched"
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    sql_seconds: float = 0.0
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_stats", default=None)
+
+
+def instrument(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        started = connection.info["query_started"].pop()
+        stats = current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Failed queries never reach after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    # Only updated from the event loop, so no locking is needed
+    def __init__(self):
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries_per_request = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        self.latency[key].observe(seconds)
+        self.queries_per_request[key].observe(stats.queries)
+        self.requests[(method, route, status)] += 1
+        if status >= 500:
+            self.errors[key] += 1
+        self.queries[key] += stats.queries
+        self.sql_seconds[key] += stats.sql_seconds
+
+    def render(self, pools: dict) -> str:
+        lines = []
+
+        def labels(method, route):
+            return f'method="{label(method)}",route="{label(route)}"'
+
+        lines += ["# HELP http_requests_total Requests served, by route and status.",
+                  "# TYPE http_requests_total counter"]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{{labels(method, route)},status="{status}"}} {count}')
+
+        lines += ["# HELP http_request_errors_total Requests that failed with a 5xx status.",
+                  "# TYPE http_request_errors_total counter"]
+        for key in sorted(self.latency):
+            lines.append(f"http_request_errors_total{{{labels(*key)}}} {self.errors[key]}")
+
+        lines += ["# HELP http_request_duration_seconds Request latency, by route.",
+                  "# TYPE http_request_duration_seconds histogram"]
+        for key, histogram in sorted(self.latency.items()):
+            lines += histogram.lines("http_request_duration_seconds", labels(*key))
+
+        lines += ["# HELP sql_queries_per_request SQL statements run per request, by route.",
+                  "# TYPE sql_queries_per_request histogram"]
+        for key, histogram in sorted(self.queries_per_request.items()):
+            lines += histogram.lines("sql_queries_per_request", labels(*key))
+
+        lines += ["# HELP sql_queries_total SQL statements run while serving requests.",
+                  "# TYPE sql_queries_total counter"]
+        for key, count in sorted(self.queries.items()):
+            lines.append(f"sql_queries_total{{{labels(*key)}}} {count}")
+
+        lines += ["# HELP sql_seconds_total Time spent in SQL while serving requests.",
+                  "# TYPE sql_seconds_total counter"]
+        for key, seconds in sorted(self.sql_seconds.items()):
+            lines.append(f"sql_seconds_total{{{labels(*key)}}} {seconds}")
+
+        for name, method, help in (("db_pool_checked_out", "checkedout", "Connections in use."),
+                                   ("db_pool_checked_in", "checkedin", "Idle connections in the pool."),
+                                   ("db_pool_size", "size", "Configured pool size."),
+                                   ("db_pool_overflow", "overflow", "Connections over the pool size.")):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            for engine_name, pool in pools.items():
+                # Pools without a queue (e.g. StaticPool) have no counters
+                if hasattr(pool, method):
+                    lines.append(f'{name}{{engine="{label(engine_name)}"}} {getattr(pool, method)()}')
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+        self.templates = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                timing = f'db;dur={stats.sql_seconds * 1000:.3f};desc="{stats.queries} queries", app;dur={elapsed * 1000:.3f}'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            self.registry.observe(scope["method"], self.route(scope), status, time.perf_counter() - started, stats)
+
+    def route(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        # Responses served by the cache never reach the router: match the
+        # path against the documented templates to keep the labels bounded
+        if self.templates is None:
+            self.templates = [(compile_path(path)[0], path) for path in scope["app"].openapi()["paths"]]
+        for pattern, path in self.templates:
+            if pattern.match(scope["path"]):
+                return path
+        return UNMATCHED
@@ -0,0 +1,295 @@
+from datetime import date
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy import Date, bindparam, type_coerce
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select, func
+
+from persistence.models import Friend, Expense, FriendExpenseLink, MonthlyTotal, MonthlyFriendTotal
+from persistence.money import share
+from persistence import ledger
+from persistence.read_model import touch
+
+
+def expense_sizes(expense_ids=None):
+    # Number of people sharing each expense: its friends plus the user himself/herself
+    query = select(FriendExpenseLink.expense_id,
+                   (func.count(FriendExpenseLink.friend_id) + 1).label("num_friends"))
+    if expense_ids is not None:
+        query = query.where(FriendExpenseLink.expense_id.in_(expense_ids))
+    return query.group_by(FriendExpenseLink.expense_id).subquery()
+
+
+def get_friend_balances(session: Session, friend_ids: Optional[Iterable[int]] = None) -> dict[int, tuple[int, int]]:
+    # Credit and debit in cents of every requested friend (all of them if None) in a
+    # single grouped query; both are integer sums, the debit with integer division
+    if friend_ids is not None:
+        friend_ids = list(friend_ids)
+        if not friend_ids:
+            return {}
+        # Only the expenses shared with the requested friends need to be sized
+        involved = select(FriendExpenseLink.expense_id).where(FriendExpenseLink.friend_id.in_(friend_ids))
+        sizes = expense_sizes(involved)
+    else:
+        sizes = expense_sizes()
+
+    query = (select(FriendExpenseLink.friend_id,
+                    func.sum(FriendExpenseLink.amount_cents),
+                    func.sum(Expense.amount_cents // sizes.c.num_friends))
+             .join(Expense, Expense.id == FriendExpenseLink.expense_id)
+             .join(sizes, sizes.c.expense_id == FriendExpenseLink.expense_id)
+             .group_by(FriendExpenseLink.friend_id))
+    if friend_ids is not None:
+        query = query.where(FriendExpenseLink.friend_id.in_(friend_ids))
+
+    balances = {friend_id: (0, 0) for friend_id in friend_ids or []}
+    for friend_id, credit_balance, debit_balance in session.exec(query):
+        balances[friend_id] = (credit_balance or 0, debit_balance or 0)
+    return balances
+
+
+def get_expense_balances(session: Session, expense_ids: Optional[Iterable[int]] = None) -> dict[int, tuple[int, int]]:
+    # Credit in cents and size of every requested expense (all of them if None) in a single grouped query
+    query = (select(Expense.id,
+                    func.coalesce(func.sum(FriendExpenseLink.amount_cents), 0),
+                    func.count(FriendExpenseLink.friend_id) + 1)
+             .outerjoin(FriendExpenseLink, FriendExpenseLink.expense_id == Expense.id)
+             .group_by(Expense.id))
+    if expense_ids is not None:
+        query = query.where(Expense.id.in_(list(expense_ids)))
+    return {expense_id: (credit_balance, num_friends) for expense_id, credit_balance, num_friends in session.exec(query)}
+
+
+def expense_month():
+    # First day of the month of the expense, computed by SQLite
+    return type_coerce(func.date(Expense.date, "start of month"), Date)
+
+
+def get_monthly_totals(session: Session) -> dict[date, tuple[int, int, int]]:
+    # Number of expenses, amount and credit in cents of every month, from scratch
+    month = expense_month()
+    totals = {day: (count, amount, 0) for day, count, amount in
+              session.exec(select(month, func.count(Expense.id), func.sum(Expense.amount_cents)).group_by(month))}
+    for day, credit in session.exec(select(month, func.sum(FriendExpenseLink.amount_cents))
+                                    .join(FriendExpenseLink, FriendExpenseLink.expense_id == Expense.id)
+                                    .group_by(month)):
+        count, amount, _ = totals[day]
+        totals[day] = (count, amount, credit)
+    return totals
+
+
+def get_monthly_friend_totals(session: Session) -> dict[tuple[date, int], tuple[int, int, int]]:
+    # Number of expenses, credit and debit in cents of every friend in every month, from scratch
+    month = expense_month()
+    sizes = expense_sizes()
+    query = (select(month, FriendExpenseLink.friend_id,
+                    func.count(Expense.id),
+                    func.sum(FriendExpenseLink.amount_cents),
+                    func.sum(Expense.amount_cents // sizes.c.num_friends))
+             .join(FriendExpenseLink, FriendExpenseLink.expense_id == Expense.id)
+             .join(sizes, sizes.c.expense_id == Expense.id)
+             .group_by(month, FriendExpenseLink.friend_id))
+    return {(day, friend_id): (count, credit, debit) for day, friend_id, count, credit, debit in session.exec(query)}
+
+
+def get_friend_expenses(session: Session, friend_id: int) -> list[tuple[Expense, int]]:
+    # Every expense of the friend along with the friend's credit in it
+    query = (select(Expense, FriendExpenseLink.amount_cents)
+             .join(FriendExpenseLink, FriendExpenseLink.expense_id == Expense.id)
+             .where(FriendExpenseLink.friend_id == friend_id)
+             .order_by(Expense.id))
+    return session.exec(query).all()
+
+
+# The balance columns of Friend and Expense and the monthly rollups are
+# maintained incrementally by the write paths: take the shares of the expenses
+# before changing them, flush the change and call update_balances() with them
+# in the same transaction.
+
+class ExpenseShares(NamedTuple):
+    # First day of the month of the expense, None if it does not exist
+    month: Optional[date]
+    amount_cents: int
+    # Credit and debit in cents of each friend sharing the expense
+    friends: dict[int, tuple[int, int]]
+
+
+# Shares of an expense that does not exist yet
+NO_SHARES = ExpenseShares(None, 0, {})
+
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+
+def get_shares(session: Session, expense_ids: Iterable[int]) -> dict[int, ExpenseShares]:
+    # Shares of each of the expenses, in two queries
+    expense_ids = list(expense_ids)
+    expenses = session.exec(select(Expense.id, Expense.date, Expense.amount_cents).where(Expense.id.in_(expense_ids))).all()
+    credits = session.exec(select(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id, FriendExpenseLink.amount_cents)
+                           .where(FriendExpenseLink.expense_id.in_(expense_ids))).all()
+
+    friends = {expense_id: {} for expense_id, _, _ in expenses}
+    for expense_id, friend_id, credit in credits:
+        friends[expense_id][friend_id] = credit
+    shares = {}
+    for expense_id, day, amount_cents in expenses:
+        debit_per_friend = share(amount_cents, len(friends[expense_id]) + 1)
+        shares[expense_id] = ExpenseShares(month_of(day), amount_cents,
+                                           {friend_id: (credit, debit_per_friend) for friend_id, credit in friends[expense_id].items()})
+    return shares
+
+
+def get_expense_shares(session: Session, expense_id: int) -> ExpenseShares:
+    return get_shares(session, [expense_id]).get(expense_id, NO_SHARES)
+
+
+def add_to(totals: dict, key, *values: int):
+    totals[key] = tuple(total + value for total, value in zip(totals.get(key, (0,) * len(values)), values))
+
+
+def add_monthly_totals(session_or_connection, month_rows: list[dict], friend_rows: list[dict]):
+    # Adds the rows to the rollups, creating the months and friends not seen yet
+    if month_rows:
+        table = MonthlyTotal.__table__
+        upsert = insert(table)
+        session_or_connection.execute(upsert.on_conflict_do_update(
+            index_elements=["month"],
+            set_={column: table.c[column] + upsert.excluded[column]
+                  for column in ("num_expenses", "amount_cents", "credit_balance_cents")}), month_rows)
+    if friend_rows:
+        table = MonthlyFriendTotal.__table__
+        upsert = insert(table)
+        session_or_connection.execute(upsert.on_conflict_do_update(
+            index_elements=["month", "friend_id"],
+            set_={column: table.c[column] + upsert.excluded[column]
+                  for column in ("num_expenses", "credit_balance_cents", "debit_balance_cents")}), friend_rows)
+
+
+def update_rollups(session: Session, previous_shares: dict[int, ExpenseShares], shares: dict[int, ExpenseShares]):
+    # Take the previous version of every expense out of its month and add the
+    # current one, then apply the net change of each row as an upsert
+    months, friend_months = {}, {}
+    for expense_id, previous in previous_shares.items():
+        for expense_shares, sign in ((previous, -1), (shares.get(expense_id, NO_SHARES), 1)):
+            if expense_shares.month is None:
+                continue
+            credit = sum(credit for credit, _ in expense_shares.friends.values())
+            add_to(months, expense_shares.month, sign, sign * expense_shares.amount_cents, sign * credit)
+            for friend_id, (credit, debit) in expense_shares.friends.items():
+                add_to(friend_months, (expense_shares.month, friend_id), sign, sign * credit, sign * debit)
+
+    month_updates = [{"month": month, "num_expenses": count, "amount_cents": amount, "credit_balance_cents": credit}
+                     for month, (count, amount, credit) in months.items() if count or amount or credit]
+    friend_updates = [{"month": month, "friend_id": friend_id, "num_expenses": count,
+                       "credit_balance_cents": credit, "debit_balance_cents": debit}
+                      for (month, friend_id), (count, credit, debit) in friend_months.items() if count or credit or debit]
+    add_monthly_totals(session, month_updates, friend_updates)
+
+    # Rows left without expenses are removed, as if they had never been written
+    months_table = MonthlyTotal.__table__
+    emptied = [{"row_month": update["month"]} for update in month_updates if update["num_expenses"] < 0]
+    if emptied:
+        session.exec(months_table.delete().where(months_table.c.month == bindparam("row_month"),
+                                                 months_table.c.num_expenses == 0),
+                     params=emptied)
+    friends_table = MonthlyFriendTotal.__table__
+    emptied = [{"row_month": update["month"], "row_friend_id": update["friend_id"]}
+               for update in friend_updates if update["num_expenses"] < 0]
+    if emptied:
+        session.exec(friends_table.delete().where(friends_table.c.month == bindparam("row_month"),
+                                                  friends_table.c.friend_id == bindparam("row_friend_id"),
+                                                  friends_table.c.num_expenses == 0),
+                     params=emptied)
+
+
+def update_expenses_balances(session: Session, previous_shares: dict[int, ExpenseShares]):
+    shares = get_shares(session, previous_shares.keys())
+
+    # Move the balances of the friends whose share changed in any of the expenses,
+    # and record every credit that changed in the ledger
+    deltas = {}
+    events = []
+    for expense_id, expense_previous in previous_shares.items():
+        expense_previous_shares = expense_previous.friends
+        expense_shares = shares.get(expense_id, NO_SHARES).friends
+        for friend_id in expense_previous_shares.keys() | expense_shares.keys():
+            previous_credit, previous_debit = expense_previous_shares.get(friend_id, (0, 0))
+            credit, debit = expense_shares.get(friend_id, (0, 0))
+            credit_delta, debit_delta = deltas.get(friend_id, (0, 0))
+            deltas[friend_id] = (credit_delta + credit - previous_credit, debit_delta + debit - previous_debit)
+            if credit != previous_credit:
+                if friend_id not in expense_previous_shares:
+                    kind = ledger.OPENING
+                elif friend_id not in expense_shares:
+                    kind = ledger.REVERSAL
+                else:
+                    kind = ledger.ADJUSTMENT
+                events.append({"expense_id": expense_id, "friend_id": friend_id,
+                               "amount_cents": credit - previous_credit, "kind": kind})
+    ledger.record(session, events)
+    touch(session, friend_ids=deltas.keys(), expense_ids=previous_shares.keys())
+
+    friends = Friend.__table__
+    friend_updates = [{"friend_id": friend_id, "credit_delta": credit_delta, "debit_delta": debit_delta}
+                      for friend_id, (credit_delta, debit_delta) in deltas.items()
+                      if credit_delta != 0 or debit_delta != 0]
+    if friend_updates:
+        session.exec(friends.update()
+                     .where(friends.c.id == bindparam("friend_id"))
+                     .values(credit_balance_cents=friends.c.credit_balance_cents + bindparam("credit_delta"),
+                             debit_balance_cents=friends.c.debit_balance_cents + bindparam("debit_delta")),
+                     params=friend_updates)
+
+    expenses = Expense.__table__
+    expense_updates = [{"expense_id": expense_id,
+                        "credit": sum(credit for credit, _ in expense_shares.friends.values()),
+                        "size": len(expense_shares.friends) + 1}
+                       for expense_id, expense_shares in shares.items()]
+    if expense_updates:
+        session.exec(expenses.update()
+                     .where(expenses.c.id == bindparam("expense_id"))
+                     .values(credit_balance_cents=bindparam("credit"), num_friends=bindparam("size")),
+                     params=expense_updates)
+
+    update_rollups(session, previous_shares, shares)
+
+
+def update_balances(session: Session, expense_id: int, previous_shares: ExpenseShares):
+    update_expenses_balances(session, {expense_id: previous_shares})
+
+
+def add_credit(session: Session, expense_id: int, friend_id: int, amount_cents: int) -> Optional[int]:
+    # A payment only moves credits, so the link, the friend, the expense and its
+    # month are incremented in place without reading them first: concurrent payments
+    # cannot overwrite each other. Returns the new credit of the friend in the
+    # expense, or None if the friend does not share it
+    links = FriendExpenseLink.__table__
+    credit = session.exec(links.update()
+                          .where(links.c.expense_id == expense_id, links.c.friend_id == friend_id)
+                          .values(amount_cents=links.c.amount_cents + amount_cents)
+                          .returning(links.c.amount_cents)).scalar()
+    if credit is None or amount_cents == 0:
+        return credit
+
+    ledger.record(session, [{"expense_id": expense_id, "friend_id": friend_id,
+                             "amount_cents": amount_cents, "kind": ledger.PAYMENT}])
+    touch(session, friend_ids=[friend_id], expense_ids=[expense_id])
+
+    friends = Friend.__table__
+    session.exec(friends.update()
+                 .where(friends.c.id == friend_id)
+                 .values(credit_balance_cents=friends.c.credit_balance_cents + amount_cents))
+    expenses = Expense.__table__
+    day = session.exec(expenses.update()
+                       .where(expenses.c.id == expense_id)
+                       .values(credit_balance_cents=expenses.c.credit_balance_cents + amount_cents)
+                       .returning(expenses.c.date)).scalar()
+    months = MonthlyTotal.__table__
+    session.exec(months.update()
+                 .where(months.c.month == month_of(day))
+                 .values(credit_balance_cents=months.c.credit_balance_cents + amount_cents))
+    friend_months = MonthlyFriendTotal.__table__
+    session.exec(friend_months.update()
+                 .where(friend_months.c.month == month_of(day), friend_months.c.friend_id == friend_id)
+                 .values(credit_balance_cents=friend_months.c.credit_balance_cents + amount_cents))
+    return credit
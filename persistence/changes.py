@@ -0,0 +1,84 @@
+"""
+Change feed of friends, expenses and links.
+
+SQLite triggers append the key of every inserted, updated or deleted row to
+the Change table, so writes through the ORM, Core statements, imports and
+fixtures all show up without the write paths knowing about it. The id of a
+change is a monotonic cursor: SQLite has a single writer, so changes become
+visible in id order and a client that has read up to a cursor never misses
+an earlier one.
+
+get_changes() returns the current state of the rows changed after a cursor.
+Several changes to a row collapse into its latest state, and a row that no
+longer exists is reported as deleted, so applying a page is idempotent.
+"""
+from sqlalchemy import Connection
+from sqlmodel import Session, select, func, tuple_
+
+from persistence.models import (Change, Friend, Expense, FriendExpenseLink, FriendPublic, ExpensePublic,
+                                FriendExpenseLinkPublic, Participant, ChangesPage)
+
+# Table and key columns (friend_id, expense_id) of each tracked table
+TRACKED = {
+    "friend": ("id", None),
+    "expense": (None, "id"),
+    "friendexpenselink": ("friend_id", "expense_id"),
+}
+
+
+def trigger_statements() -> list[str]:
+    statements = []
+    for table, (friend_key, expense_key) in TRACKED.items():
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            friend_id = f"{row}.{friend_key}" if friend_key else "NULL"
+            expense_id = f"{row}.{expense_key}" if expense_key else "NULL"
+            statements.append(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_change AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change (table_name, friend_id, expense_id) VALUES ('{table}', {friend_id}, {expense_id});
+                END
+            """)
+    return statements
+
+
+def create_triggers(connection: Connection):
+    for statement in trigger_statements():
+        connection.exec_driver_sql(statement)
+
+
+def get_changes(session: Session, since: int, limit: int) -> ChangesPage:
+    # Reads the changes and the rows in the same transaction, so the rows
+    # are the state as of the returned cursor or of a later change, which
+    # the next page will report again
+    changes = session.exec(select(Change).where(Change.id > since).order_by(Change.id).limit(limit + 1)).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    friend_ids, expense_ids, link_keys = set(), set(), set()
+    for change in changes:
+        if change.table_name == "friend":
+            friend_ids.add(change.friend_id)
+        elif change.table_name == "expense":
+            expense_ids.add(change.expense_id)
+        else:
+            link_keys.add((change.expense_id, change.friend_id))
+
+    friends = session.exec(select(Friend).where(Friend.id.in_(friend_ids)).order_by(Friend.id)).all() if friend_ids else []
+    expenses = session.exec(select(Expense).where(Expense.id.in_(expense_ids)).order_by(Expense.id)).all() if expense_ids else []
+    links = session.exec(select(FriendExpenseLink)
+                         .where(tuple_(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id).in_(list(link_keys)))
+                         .order_by(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id)).all() if link_keys else []
+
+    return ChangesPage(cursor=changes[-1].id if changes else since,
+                       has_more=has_more,
+                       friends=[FriendPublic.from_friend(friend) for friend in friends],
+                       expenses=[ExpensePublic.from_expense(expense) for expense in expenses],
+                       links=[FriendExpenseLinkPublic.from_link(link) for link in links],
+                       deleted_friends=sorted(friend_ids - {friend.id for friend in friends}),
+                       deleted_expenses=sorted(expense_ids - {expense.id for expense in expenses}),
+                       deleted_links=[Participant(expense_id=expense_id, friend_id=friend_id)
+                                      for expense_id, friend_id in sorted(link_keys - {(link.expense_id, link.friend_id) for link in links})])
+
+
+def last_change_id(session: Session) -> int:
+    return session.exec(select(func.coalesce(func.max(Change.id), 0))).one()
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, replace
+import os
+
+
+@dataclass
+class DatabaseConfig:
+    url: str = "sqlite:///expenses.db"
+    echo: bool = False
+    # Pragmas applied to every pooled connection
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size_kib: int = 65536
+    mmap_size: int = 268435456
+    busy_timeout_ms: int = 5000
+    foreign_keys: bool = True
+    # Connection pool
+    pool_size: int = 8
+    max_overflow: int = 16
+    pool_timeout_s: float = 30.0
+    # Serve the routers from async handlers over aiosqlite instead of the threadpool
+    use_async: bool = False
+    # Serve single friend/expense reads from an in-memory copy (persistence/read_model.py)
+    read_model: bool = False
+    # Seconds between ledger compactions of the server, 0 disables them
+    compaction_interval_s: float = 300.0
+
+    @staticmethod
+    def load() -> "DatabaseConfig":
+        # A profile gives the defaults; any DB_* variable overrides them
+        profile = os.getenv("DB_PROFILE", "production")
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown DB_PROFILE '{profile}' (available: {', '.join(PROFILES)})")
+        config = PROFILES[profile]
+        return replace(
+            config,
+            url=os.getenv("DB_URL", config.url),
+            echo=_env_bool("DB_ECHO", config.echo),
+            journal_mode=os.getenv("DB_JOURNAL_MODE", config.journal_mode),
+            synchronous=os.getenv("DB_SYNCHRONOUS", config.synchronous),
+            cache_size_kib=int(os.getenv("DB_CACHE_SIZE_KIB", config.cache_size_kib)),
+            mmap_size=int(os.getenv("DB_MMAP_SIZE", config.mmap_size)),
+            busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", config.busy_timeout_ms)),
+            foreign_keys=_env_bool("DB_FOREIGN_KEYS", config.foreign_keys),
+            pool_size=int(os.getenv("DB_POOL_SIZE", config.pool_size)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", config.max_overflow)),
+            pool_timeout_s=float(os.getenv("DB_POOL_TIMEOUT_S", config.pool_timeout_s)),
+            use_async=_env_bool("DB_ASYNC", config.use_async),
+            read_model=_env_bool("DB_READ_MODEL", config.read_model),
+            compaction_interval_s=float(os.getenv("DB_COMPACTION_INTERVAL_S", config.compaction_interval_s)),
+        )
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+PROFILES = {
+    # Logs every statement and keeps the classic rollback journal, fully synced
+    "dev": DatabaseConfig(
+        echo=True,
+        journal_mode="DELETE",
+        synchronous="FULL",
+        cache_size_kib=2048,
+        mmap_size=0,
+        pool_size=2,
+        max_overflow=2,
+    ),
+    # WAL lets readers run concurrently with the writer; NORMAL sync is safe in WAL mode
+    "production": DatabaseConfig(),
+}
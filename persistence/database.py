@@ -1,12 +1,97 @@
 from typing import Any
+from fastapi import Request
+from sqlalchemy import Engine, event
 from sqlmodel import create_engine, Session
 
+from persistence.config import DatabaseConfig
 
-SQLITE_FILE_NAME = "expenses.db"
-SQLITE_URL = f"sqlite:///{SQLITE_FILE_NAME}"
 
-engine = create_engine(SQLITE_URL, echo=True)
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+# Requests with any other method get a session that writes (see get_session)
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
 
-def get_session() -> Any:
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+
+def configure_connections(engine: Engine, config: DatabaseConfig):
+    journal_mode = config.journal_mode.upper()
+    synchronous = config.synchronous.upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"Unknown journal mode '{config.journal_mode}'")
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Unknown synchronous level '{config.synchronous}'")
+
+    pragmas = [
+        f"PRAGMA journal_mode = {journal_mode}",
+        f"PRAGMA synchronous = {synchronous}",
+        # Negative values are KiB instead of pages
+        f"PRAGMA cache_size = -{int(config.cache_size_kib)}",
+        f"PRAGMA mmap_size = {int(config.mmap_size)}",
+        f"PRAGMA busy_timeout = {int(config.busy_timeout_ms)}",
+        # Foreign keys are disabled in sqlite3 by default
+        f"PRAGMA foreign_keys = {'ON' if config.foreign_keys else 'OFF'}",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, _connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see on_begin) instead of the sqlite3
+        # module, which would skip it for DDL and break transactional migrations
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        # DEFERRED unless the engine was made for writes (see for_writes)
+        connection.exec_driver_sql(f"BEGIN {connection.get_execution_options().get('begin', 'DEFERRED')}")
+
+
+def for_writes(engine):
+    # A deferred transaction that has read cannot take the write lock once
+    # another connection committed: SQLite fails it at once with SQLITE_BUSY
+    # instead of waiting on busy_timeout. Transactions of the returned engine
+    # take the write lock when they begin, so concurrent writers queue instead
+    return engine.execution_options(begin="IMMEDIATE")
+
+
+def build_engine(config: DatabaseConfig) -> Engine:
+    engine = create_engine(config.url,
+                           echo=config.echo,
+                           pool_size=config.pool_size,
+                           max_overflow=config.max_overflow,
+                           pool_timeout=config.pool_timeout_s,
+                           connect_args={"check_same_thread": False})
+    configure_connections(engine, config)
+    return engine
+
+
+def build_async_engine(config: DatabaseConfig):
+    # aiosqlite is only needed when the async data path is enabled
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_engine = create_async_engine(config.url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+                                       echo=config.echo,
+                                       pool_size=config.pool_size,
+                                       max_overflow=config.max_overflow,
+                                       pool_timeout=config.pool_timeout_s)
+    configure_connections(async_engine.sync_engine, config)
+    return async_engine
+
+
+config = DatabaseConfig.load()
+engine = build_engine(config)
+write_engine = for_writes(engine)
+async_engine = build_async_engine(config) if config.use_async else None
+async_write_engine = for_writes(async_engine) if config.use_async else None
+
+def get_session(request: Request) -> Any:
+    with Session(engine if request.method in READ_METHODS else write_engine) as session:
+        yield session
+
+
+async def get_async_session(request: Request) -> Any:
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(async_engine if request.method in READ_METHODS else async_write_engine) as session:
+        yield session
@@ -0,0 +1,117 @@
+"""
+In-process broadcast of data changes to the subscribers of GET /events/.
+
+Every committed session wakes the hub through call_soon_threadsafe, whatever
+thread it was committed in. The hub task then reads the change feed (see
+persistence/changes.py) after its cursor once and fans the pages out to every
+subscriber, so a burst of commits costs one read however many clients
+listen. Without subscribers commits do not wake it, and a periodic poll just
+moves the cursor; the same poll picks up the writes of other processes.
+
+Pages are published with the cursor they start from, so a subscriber that
+is behind them (it connected between two reads) catches up from the feed
+itself. Each subscriber has a bounded queue: one that falls behind is dropped
+with a reset marker instead of slowing the hub or growing without bound.
+"""
+import asyncio
+from contextlib import suppress
+from typing import Optional
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from persistence import changes
+from persistence.models import ChangesPage
+
+QUEUE_SIZE = 256
+PAGE_SIZE = 1000
+# Changes committed by other processes are seen after at most this long
+POLL_S = 5.0
+# Put in a queue instead of a page when its subscriber fell behind
+RESET = None
+
+
+def read_changes(engine: Engine, since: int) -> list[ChangesPage]:
+    pages = []
+    with Session(engine) as session:
+        while True:
+            page = changes.get_changes(session, since, PAGE_SIZE)
+            if page.cursor == since:
+                return pages
+            pages.append(page)
+            since = page.cursor
+            if not page.has_more:
+                return pages
+
+
+def last_change_id(engine: Engine) -> int:
+    with Session(engine) as session:
+        return changes.last_change_id(session)
+
+
+class BroadcastHub:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: set[asyncio.Queue] = set()
+        self.cursor = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wake: Optional[asyncio.Event] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        # Queues hold (cursor the page starts from, page) or RESET
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def notify(self):
+        # Called from any thread after a commit
+        if self.loop is not None and self.subscribers:
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    def publish(self, since: int, page: ChangesPage):
+        for queue in list(self.subscribers):
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET)
+                self.subscribers.discard(queue)
+            else:
+                queue.put_nowait((since, page))
+
+    async def run(self, engine: Engine, poll_s: float = POLL_S):
+        # Background task of the server, started by the lifespan
+        self.wake = asyncio.Event()
+        self.cursor = await asyncio.to_thread(last_change_id, engine)
+        self.loop = asyncio.get_running_loop()
+        try:
+            while True:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.wake.wait(), poll_s)
+                self.wake.clear()
+                try:
+                    if not self.subscribers:
+                        cursor = await asyncio.to_thread(last_change_id, engine)
+                        # Unless someone subscribed meanwhile, who may need the changes up to it
+                        if not self.subscribers:
+                            self.cursor = cursor
+                        continue
+                    pages = await asyncio.to_thread(read_changes, engine, self.cursor)
+                except Exception as e:
+                    print(f"Change broadcast failed: {e}")
+                    continue
+                for page in pages:
+                    self.publish(self.cursor, page)
+                    self.cursor = page.cursor
+        finally:
+            self.loop = None
+
+
+hub = BroadcastHub()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def on_commit(session):
+    hub.notify()
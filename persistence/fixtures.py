@@ -0,0 +1,167 @@
+"""
+Deterministic data for demos, load tests and benchmarks.
+
+`load_fixtures()` writes a hand-written dataset like scripts/demo_data.json,
+where friends and expenses have their own string ids and participants refer to
+them. `generate_data()` produces any number of friends, expenses and links
+from a seed: the same arguments on an empty database always give the same rows.
+
+The number of friends sharing each generated expense follows a distribution
+written as `size:weight,...`; e.g. `1:3,2:4,5:1` gives expenses of 1, 2 and 5
+friends in proportion 3:4:1. Rows are written with explicit ids through
+executemany inserts in a single transaction, and the balances are computed
+while generating, so no maintenance query runs afterwards; credits already
+paid are recorded as opening events of the ledger (see persistence.ledger).
+"""
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Optional
+from faker import Faker
+from sqlalchemy import Engine, insert
+from sqlmodel import Session, select, func
+
+from persistence.models import Friend, Expense, FriendExpenseLink, Payment, Fixtures, FixturesReport
+from persistence.balances import NO_SHARES, update_expenses_balances, add_monthly_totals, month_of
+from persistence.money import to_cents, share
+from persistence import ledger
+from persistence.read_model import touch
+
+DEFAULT_DISTRIBUTION = "0:1,1:3,2:4,3:2,5:1"
+PAID_RATIO = 1 / 3
+CHUNK_SIZE = 10000
+FIRST_DATE = date(2024, 1, 1)
+DAYS = 2 * 365
+NAME_POOL = 500
+DESCRIPTIONS = ("Travel to {}", "Dinner in {}", "Hotel in {}", "Museum in {}", "Groceries in {}")
+
+
+def next_id(session_or_connection, model) -> int:
+    return session_or_connection.execute(select(func.coalesce(func.max(model.id), 0))).scalar() + 1
+
+
+def load_fixtures(session: Session, fixtures: Fixtures) -> FixturesReport:
+    # Fixture ids are mapped to new consecutive ids, so nothing has to be read back
+    friend_ids = {friend.id: friend_id for friend_id, friend in enumerate(fixtures.friends, start=next_id(session, Friend))}
+    expense_ids = {expense.id: expense_id for expense_id, expense in enumerate(fixtures.expenses, start=next_id(session, Expense))}
+
+    if fixtures.friends:
+        session.exec(insert(Friend.__table__),
+                     params=[{"id": friend_ids[friend.id], "name": friend.name,
+                              "credit_balance_cents": 0, "debit_balance_cents": 0} for friend in fixtures.friends])
+    if fixtures.expenses:
+        session.exec(insert(Expense.__table__),
+                     params=[{"id": expense_ids[expense.id], "description": expense.description, "date": expense.date,
+                              "amount_cents": to_cents(expense.amount), "credit_balance_cents": 0, "num_friends": 1}
+                             for expense in fixtures.expenses])
+    links = [{"expense_id": expense_ids[expense.id], "friend_id": friend_ids[friend], "amount_cents": to_cents(paid)}
+             for expense in fixtures.expenses
+             for friend, paid in expense.paid().items()]
+    if links:
+        session.exec(insert(FriendExpenseLink.__table__), params=links)
+
+    update_expenses_balances(session, {expense_id: NO_SHARES for expense_id in expense_ids.values()})
+    touch(session, friend_ids=friend_ids.values())
+    session.commit()
+    return FixturesReport(friends=friend_ids, expenses=expense_ids)
+
+
+def parse_distribution(spec: str) -> tuple[list[int], list[float]]:
+    sizes, weights = [], []
+    for item in spec.split(","):
+        size, _, weight = item.partition(":")
+        sizes.append(int(size))
+        weights.append(float(weight or 1))
+    if any(size < 0 for size in sizes) or any(weight < 0 for weight in weights) or not sum(weights):
+        raise ValueError(f"Invalid friends per expense distribution '{spec}'")
+    return sizes, weights
+
+
+@dataclass
+class GeneratedData:
+    friends: int
+    expenses: int
+    links: int
+
+
+def generate_data(engine: Engine,
+                  num_friends: int,
+                  num_expenses: int,
+                  distribution: str = DEFAULT_DISTRIBUTION,
+                  seed: int = 0,
+                  paid_ratio: float = PAID_RATIO,
+                  on_progress: Optional[Callable[[GeneratedData], None]] = None) -> GeneratedData:
+    rng = random.Random(seed)
+    sizes, weights = parse_distribution(distribution)
+    # Faker is only used for small pools of names, it is too slow to call per row
+    fake = Faker("es_ES")
+    fake.seed_instance(seed)
+    names = [fake.first_name() for _ in range(NAME_POOL)]
+    cities = [fake.city() for _ in range(NAME_POOL)]
+
+    generated = GeneratedData(friends=num_friends, expenses=0, links=0)
+    with engine.begin() as connection:
+        # Friends go in last with their final balances, checked on commit
+        connection.exec_driver_sql("PRAGMA defer_foreign_keys = ON")
+        first_friend = next_id(connection, Friend)
+        first_expense = next_id(connection, Expense)
+        friend_ids = range(first_friend, first_friend + num_friends)
+        credits = [0] * num_friends
+        debits = [0] * num_friends
+
+        months, friend_months = {}, {}
+
+        for chunk_start in range(0, num_expenses, CHUNK_SIZE):
+            expenses, links = [], []
+            for expense_id in range(first_expense + chunk_start, first_expense + min(chunk_start + CHUNK_SIZE, num_expenses)):
+                amount_cents = rng.randint(500, 100000)
+                expense_friends = rng.sample(range(num_friends), min(rng.choices(sizes, weights)[0], num_friends))
+                debit = share(amount_cents, len(expense_friends) + 1)
+                day = FIRST_DATE + timedelta(days=rng.randrange(DAYS))
+                month = month_of(day)
+                credit_balance = 0
+                for friend in expense_friends:
+                    paid = debit if rng.random() < paid_ratio else 0
+                    links.append({"expense_id": expense_id, "friend_id": friend_ids[friend], "amount_cents": paid})
+                    credits[friend] += paid
+                    debits[friend] += debit
+                    credit_balance += paid
+                    count, credit, friend_debit = friend_months.get((month, friend), (0, 0, 0))
+                    friend_months[(month, friend)] = (count + 1, credit + paid, friend_debit + debit)
+                count, amount, credit = months.get(month, (0, 0, 0))
+                months[month] = (count + 1, amount + amount_cents, credit + credit_balance)
+                # The id keeps descriptions unique on the same date
+                description = rng.choice(DESCRIPTIONS).format(rng.choice(cities))
+                expenses.append({"id": expense_id,
+                                 "description": f"{description} #{expense_id}",
+                                 "date": day,
+                                 "amount_cents": amount_cents,
+                                 "credit_balance_cents": credit_balance,
+                                 "num_friends": len(expense_friends) + 1})
+            connection.execute(insert(Expense.__table__), expenses)
+            if links:
+                connection.execute(insert(FriendExpenseLink.__table__), links)
+                openings = [{**link, "kind": ledger.OPENING} for link in links if link["amount_cents"]]
+                if openings:
+                    connection.execute(insert(Payment.__table__), openings)
+            generated.expenses += len(expenses)
+            generated.links += len(links)
+            if on_progress is not None:
+                on_progress(generated)
+
+        friend_names = [rng.choice(names) for _ in range(num_friends)]
+        for chunk_start in range(0, num_friends, CHUNK_SIZE):
+            connection.execute(insert(Friend.__table__),
+                               [{"id": friend_ids[friend], "name": friend_names[friend],
+                                 "credit_balance_cents": credits[friend], "debit_balance_cents": debits[friend]}
+                                for friend in range(chunk_start, min(chunk_start + CHUNK_SIZE, num_friends))])
+
+        month_rows = [{"month": month, "num_expenses": count, "amount_cents": amount, "credit_balance_cents": credit}
+                      for month, (count, amount, credit) in months.items()]
+        friend_rows = [{"month": month, "friend_id": friend_ids[friend], "num_expenses": count,
+                        "credit_balance_cents": credit, "debit_balance_cents": debit}
+                       for (month, friend), (count, credit, debit) in friend_months.items()]
+        for chunk_start in range(0, max(len(month_rows), len(friend_rows)), CHUNK_SIZE):
+            add_monthly_totals(connection, month_rows[chunk_start:chunk_start + CHUNK_SIZE],
+                               friend_rows[chunk_start:chunk_start + CHUNK_SIZE])
+    return generated
@@ -0,0 +1,58 @@
+"""
+Data generation counter: a number that changes after every committed write.
+
+Anything derived from the data (cached responses, ETags) can be tagged with
+the generation it was computed at and is still valid while the generation
+stays the same. Writes are detected on every Session, whether they go through
+the unit of work (flush) or as INSERT/UPDATE/DELETE statements, and the
+counter moves once the transaction has been committed.
+
+The counter lives in this process: with several server processes each one
+only sees its own writes.
+"""
+import threading
+import uuid
+from sqlalchemy import event
+from sqlalchemy.orm import Session, ORMExecuteState
+
+
+class DataGeneration:
+    def __init__(self):
+        # Tells apart the generations of different server runs
+        self.run_id = uuid.uuid4().hex[:8]
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+data_generation = DataGeneration()
+
+
+@event.listens_for(Session, "after_flush")
+def on_flush(session, _flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def on_execute(orm_execute_state: ORMExecuteState):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def on_commit(session):
+    if session.info.pop("wrote", False):
+        data_generation.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def on_rollback(session):
+    session.info.pop("wrote", None)
@@ -0,0 +1,181 @@
+"""
+Streaming import of historical expenses and payments from CSV or JSONL.
+
+Every record is an expense with its participants and what each of them has
+already paid. JSONL lines look like:
+
+    {"description": "Cena", "date": "2025-06-24", "amount": 90.0, "participants": {"Ana": 30.0, "Luis": 0}}
+
+(`participants` may also be a plain list of names when nobody has paid yet).
+CSV files have the columns description, date, amount and participants, the
+latter written as `Ana:30;Luis`. Amounts are decimal and stored as integer
+cents (see persistence.money).
+
+Records are read one at a time and written in chunked transactions, so memory
+does not grow with the size of the file. A record that cannot be parsed,
+including a JSONL line that is not valid JSON or UTF-8, is skipped and
+reported with its row (the line number for JSONL) without stopping the
+import. Streams should be opened with errors="surrogateescape" so that bad
+bytes reach the parser instead of failing the read. Friends are matched by name through an
+in-memory map and created when missing.
+"""
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, Optional, TextIO, Union
+from sqlmodel import Session, select, insert, tuple_
+
+from persistence.models import Friend, Expense, FriendExpenseLink
+from persistence.balances import NO_SHARES, update_expenses_balances
+from persistence.money import to_cents
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ("csv", "jsonl")
+
+
+@dataclass
+class ImportProgress:
+    rows: int = 0
+    expenses: int = 0
+    friends: int = 0
+    skipped: int = 0
+    errors: list[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def skip(self, row: int, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row}: {reason}")
+
+
+# Readers yield (row number, record); JSONL records are the raw lines, parsed
+# along with the rest of the record so that a bad line only skips its row
+
+def read_csv(stream: TextIO) -> Iterator[tuple[int, dict]]:
+    for row, record in enumerate(csv.DictReader(stream), start=1):
+        participants = {}
+        for participant in (record.get("participants") or "").split(";"):
+            name, _, paid = participant.partition(":")
+            if name.strip():
+                participants[name.strip()] = paid.strip() or 0
+        yield row, {**record, "participants": participants}
+
+
+def read_jsonl(stream: TextIO) -> Iterator[tuple[int, str]]:
+    for row, line in enumerate(stream, start=1):
+        if line.strip():
+            yield row, line
+
+
+def read_records(stream: TextIO, format: str) -> Iterator[tuple[int, Union[dict, str]]]:
+    if format == "csv":
+        return read_csv(stream)
+    if format == "jsonl":
+        return read_jsonl(stream)
+    raise ValueError(f"Unknown import format '{format}' (available: {', '.join(FORMATS)})")
+
+
+def text(value) -> str:
+    # Bytes that were not UTF-8 were read as lone surrogates, which cannot be stored
+    value = str(value).strip()
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        raise ValueError(f"'{value.encode('utf-8', 'replace').decode()}' is not valid UTF-8") from None
+    return value
+
+
+def parse_record(record: Union[dict, str]) -> tuple[str, date, int, dict[str, int]]:
+    if isinstance(record, str):
+        record = json.loads(record)
+    description = text(record["description"])
+    day = datetime.strptime(str(record["date"]).strip(), "%Y-%m-%d").date()
+    amount = to_cents(record["amount"])
+    if amount < 0:
+        raise ValueError(f"negative amount '{record['amount']}'")
+    participants = record.get("participants") or {}
+    if isinstance(participants, list):
+        participants = {name: 0 for name in participants}
+    return description, day, amount, {text(name): to_cents(paid) for name, paid in participants.items()}
+
+
+def import_expenses(session: Session,
+                    records: Iterable[tuple[int, Union[dict, str]]],
+                    chunk_size: int = CHUNK_SIZE,
+                    on_progress: Optional[Callable[[ImportProgress], None]] = None) -> ImportProgress:
+    progress = ImportProgress()
+    # Friends with the same name are matched to the oldest one
+    friend_ids = {}
+    for friend_id, name in session.exec(select(Friend.id, Friend.name).order_by(Friend.id.desc())):
+        friend_ids[name] = friend_id
+
+    chunk = []
+    for row, record in records:
+        progress.rows += 1
+        try:
+            chunk.append((row, *parse_record(record)))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            progress.skip(row, f"malformed record ({e})")
+        if len(chunk) >= chunk_size:
+            import_chunk(session, chunk, friend_ids, progress)
+            chunk = []
+            if on_progress is not None:
+                on_progress(progress)
+    if chunk:
+        import_chunk(session, chunk, friend_ids, progress)
+    if on_progress is not None:
+        on_progress(progress)
+    return progress
+
+
+def import_chunk(session: Session, chunk: list, friend_ids: dict[str, int], progress: ImportProgress):
+    # Skip expenses that already exist or repeat within the chunk
+    keys = {}
+    for row, description, date, amount, participants in chunk:
+        if (description, date) in keys:
+            progress.skip(row, f"expense '{description}' on {date} repeats row {keys[(description, date)][0]}")
+        else:
+            keys[(description, date)] = (row, description, date, amount, participants)
+    existing = session.exec(select(Expense.description, Expense.date)
+                            .where(tuple_(Expense.description, Expense.date).in_(list(keys)))).all()
+    for description, date in existing:
+        row = keys.pop((description, date))[0]
+        progress.skip(row, f"expense '{description}' on {date} already exists")
+    if not keys:
+        return
+
+    new_names = list({name for *_, participants in keys.values() for name in participants if name not in friend_ids})
+    if new_names:
+        table = Friend.__table__
+        ids = session.exec(insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                           params=[{"name": name, "credit_balance_cents": 0, "debit_balance_cents": 0} for name in new_names]).scalars().all()
+        friend_ids.update(zip(new_names, ids))
+        progress.friends += len(ids)
+
+    table = Expense.__table__
+    records = list(keys.values())
+    expense_ids = session.exec(insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                               params=[{"description": description, "date": date, "amount_cents": amount,
+                                        "credit_balance_cents": 0, "num_friends": 1}
+                                       for _, description, date, amount, _ in records]).scalars().all()
+    links = [{"expense_id": expense_id, "friend_id": friend_ids[name], "amount_cents": paid}
+             for expense_id, (*_, participants) in zip(expense_ids, records)
+             for name, paid in participants.items()]
+    if links:
+        session.exec(insert(FriendExpenseLink.__table__), params=links)
+
+    # The new expenses had no shares before the import
+    update_expenses_balances(session, {expense_id: NO_SHARES for expense_id in expense_ids})
+    session.commit()
+    progress.expenses += len(expense_ids)
@@ -0,0 +1,141 @@
+"""
+Append-only ledger of credit changes with periodic snapshots.
+
+Every change to the credit of a friend in an expense is appended to the
+Payment table:
+- payments recorded through the API (`payment`)
+- credits that links are created with, by imports and fixtures (`opening`)
+- credits that leave with a deleted link, friend or expense (`reversal`)
+
+The materialized balance columns are still updated on every write, so regular
+reads do not touch the ledger.
+
+compact() rolls the events since the previous snapshot into a new one, which
+holds the credit of each link changed in between. The credit of a link as of
+any date is then its latest snapshot row plus the events after that snapshot,
+so rebuilding balances reads a bounded tail of events however long the
+history gets.
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Engine, and_, insert, literal
+from sqlmodel import Session, select, func
+
+from persistence.models import Payment, Snapshot, SnapshotCredit
+
+PAYMENT = "payment"
+OPENING = "opening"
+REVERSAL = "reversal"
+ADJUSTMENT = "adjustment"
+
+
+def record(session: Session, events: list[dict]):
+    # Events are dicts with expense_id, friend_id, amount_cents and kind
+    if events:
+        session.exec(insert(Payment.__table__), params=events)
+
+
+def last_payment_id(session: Session, as_of: Optional[datetime] = None) -> Optional[int]:
+    query = select(func.max(Payment.id))
+    if as_of is not None:
+        query = query.where(Payment.created_at <= as_of)
+    return session.exec(query).one()
+
+
+def latest_snapshot(session: Session, payment_id: Optional[int] = None) -> Optional[Snapshot]:
+    query = select(Snapshot).order_by(Snapshot.id.desc()).limit(1)
+    if payment_id is not None:
+        query = query.where(Snapshot.payment_id <= payment_id)
+    return session.exec(query).first()
+
+
+def get_credits(session: Session,
+                as_of: Optional[datetime] = None,
+                expense_id: Optional[int] = None,
+                friend_id: Optional[int] = None) -> dict[tuple[int, int], int]:
+    # Credit of every (expense_id, friend_id) link as of a date, optionally
+    # restricted to an expense or a friend: latest snapshot plus the tail
+    last = last_payment_id(session, as_of)
+    if last is None:
+        return {}
+    snapshot = latest_snapshot(session, last)
+
+    credits = {}
+    if snapshot is not None:
+        latest = select(SnapshotCredit.expense_id, SnapshotCredit.friend_id,
+                        func.max(SnapshotCredit.snapshot_id).label("snapshot_id")).where(SnapshotCredit.snapshot_id <= snapshot.id)
+        if expense_id is not None:
+            latest = latest.where(SnapshotCredit.expense_id == expense_id)
+        if friend_id is not None:
+            latest = latest.where(SnapshotCredit.friend_id == friend_id)
+        latest = latest.group_by(SnapshotCredit.expense_id, SnapshotCredit.friend_id).subquery()
+        rows = session.exec(select(SnapshotCredit.expense_id, SnapshotCredit.friend_id, SnapshotCredit.amount_cents)
+                            .join(latest, and_(SnapshotCredit.expense_id == latest.c.expense_id,
+                                               SnapshotCredit.friend_id == latest.c.friend_id,
+                                               SnapshotCredit.snapshot_id == latest.c.snapshot_id)))
+        credits = {(row_expense_id, row_friend_id): amount for row_expense_id, row_friend_id, amount in rows}
+
+    tail = (select(Payment.expense_id, Payment.friend_id, func.sum(Payment.amount_cents))
+            .where(Payment.id > (snapshot.payment_id if snapshot is not None else 0), Payment.id <= last))
+    if expense_id is not None:
+        tail = tail.where(Payment.expense_id == expense_id)
+    if friend_id is not None:
+        tail = tail.where(Payment.friend_id == friend_id)
+    for row_expense_id, row_friend_id, amount in session.exec(tail.group_by(Payment.expense_id, Payment.friend_id)):
+        credits[(row_expense_id, row_friend_id)] = credits.get((row_expense_id, row_friend_id), 0) + amount
+    return credits
+
+
+def compact(session: Session) -> Optional[Snapshot]:
+    # Rolls the events since the previous snapshot into a new one; returns
+    # None when there is nothing new
+    wrote = session.info.get("wrote", False)
+    last = last_payment_id(session)
+    previous = latest_snapshot(session)
+    first = previous.payment_id if previous is not None else 0
+    if last is None or last == first:
+        return None
+
+    snapshot = Snapshot(payment_id=last)
+    session.add(snapshot)
+    session.flush()
+
+    prior = (select(SnapshotCredit.amount_cents)
+             .where(SnapshotCredit.expense_id == Payment.expense_id, SnapshotCredit.friend_id == Payment.friend_id)
+             .order_by(SnapshotCredit.snapshot_id.desc())
+             .limit(1)
+             .scalar_subquery())
+    changed = (select(literal(snapshot.id), Payment.expense_id, Payment.friend_id,
+                      func.coalesce(prior, 0) + func.sum(Payment.amount_cents))
+               .where(Payment.id > first, Payment.id <= last)
+               .group_by(Payment.expense_id, Payment.friend_id))
+    session.exec(insert(SnapshotCredit.__table__)
+                 .from_select(["snapshot_id", "expense_id", "friend_id", "amount_cents"], changed))
+    # A snapshot changes no balance, so it leaves the data generation (and the
+    # cached responses) alone unless the session had written before
+    if not wrote:
+        session.info.pop("wrote", None)
+    session.commit()
+    session.refresh(snapshot)
+    return snapshot
+
+
+def count_links(session: Session, snapshot: Snapshot) -> int:
+    return session.exec(select(func.count()).select_from(SnapshotCredit).where(SnapshotCredit.snapshot_id == snapshot.id)).one()
+
+
+def compact_engine(engine: Engine) -> Optional[Snapshot]:
+    with Session(engine) as session:
+        return compact(session)
+
+
+async def compact_periodically(engine: Engine, interval_s: float):
+    # Background task of the server; compaction runs in a worker thread so
+    # that the event loop keeps serving requests
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await asyncio.to_thread(compact_engine, engine)
+        except Exception as e:
+            print(f"Ledger compaction failed: {e}")
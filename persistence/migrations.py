@@ -0,0 +1,251 @@
+"""
+Versioned schema migrations for the SQLite store.
+
+The schema version of a database file is kept in `PRAGMA user_version`.
+New databases are created straight from the models and stamped with the latest
+version; existing ones run every migration above their version, in order.
+To change the schema, update the models and append a migration that upgrades
+an existing file to match them. Migrations are plain SQL so that they keep
+working against old files when the models move on.
+"""
+from datetime import datetime
+from sqlalchemy import Connection, Engine, inspect
+from sqlmodel import SQLModel
+
+from persistence.changes import create_triggers
+from persistence.money import to_cents
+
+
+def add_indexes(connection: Connection):
+    # Expenses with the same description and date were allowed before the
+    # unique index: keep the oldest one and tag the rest with their id
+    connection.exec_driver_sql("""
+        UPDATE expense SET description = description || ' (' || id || ')'
+        WHERE id NOT IN (SELECT min(id) FROM expense GROUP BY description, date)
+    """)
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_friendexpenselink_expense_id ON friendexpenselink (expense_id)")
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_expense_description_date ON expense (description, date)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_expense_date ON expense (date)")
+
+
+def fill_balances(connection: Connection):
+    # Databases created before the balance columns were maintained on write
+    connection.exec_driver_sql("""
+        UPDATE expense SET
+            credit_balance = (SELECT coalesce(sum(amount), 0) FROM friendexpenselink WHERE expense_id = expense.id),
+            num_friends = (SELECT count(*) + 1 FROM friendexpenselink WHERE expense_id = expense.id)
+    """)
+    connection.exec_driver_sql("""
+        UPDATE friend SET
+            credit_balance = (SELECT coalesce(sum(amount), 0) FROM friendexpenselink WHERE friend_id = friend.id),
+            debit_balance = (SELECT coalesce(sum(expense.amount / expense.num_friends), 0)
+                             FROM friendexpenselink JOIN expense ON expense.id = friendexpenselink.expense_id
+                             WHERE friendexpenselink.friend_id = friend.id)
+    """)
+
+
+def store_cents(connection: Connection):
+    # Money becomes integer cents (see persistence.money). Columns are added and
+    # dropped in place instead of rebuilding the tables, which keeps the
+    # migration inside its transaction with foreign keys on (SQLite >= 3.35)
+    for table, column in (("expense", "amount_cents"),
+                          ("expense", "credit_balance_cents"),
+                          ("friendexpenselink", "amount_cents"),
+                          ("friend", "credit_balance_cents"),
+                          ("friend", "debit_balance_cents")):
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    # Amounts are rounded in Python so that they match what the API would store
+    for table in ("expense", "friendexpenselink"):
+        amounts = connection.exec_driver_sql(f"SELECT rowid, amount FROM {table}").all()
+        if amounts:
+            connection.exec_driver_sql(f"UPDATE {table} SET amount_cents = ? WHERE rowid = ?",
+                                       [(to_cents(amount or 0), rowid) for rowid, amount in amounts])
+
+    # Balances are recomputed with the new split: friends owe amount // size
+    connection.exec_driver_sql("""
+        UPDATE expense SET
+            credit_balance_cents = (SELECT coalesce(sum(amount_cents), 0) FROM friendexpenselink WHERE expense_id = expense.id),
+            num_friends = (SELECT count(*) + 1 FROM friendexpenselink WHERE expense_id = expense.id)
+    """)
+    connection.exec_driver_sql("""
+        UPDATE friend SET
+            credit_balance_cents = (SELECT coalesce(sum(amount_cents), 0) FROM friendexpenselink WHERE friend_id = friend.id),
+            debit_balance_cents = (SELECT coalesce(sum(expense.amount_cents / expense.num_friends), 0)
+                                   FROM friendexpenselink JOIN expense ON expense.id = friendexpenselink.expense_id
+                                   WHERE friendexpenselink.friend_id = friend.id)
+    """)
+
+    for table, column in (("expense", "amount"),
+                          ("expense", "credit_balance"),
+                          ("friendexpenselink", "amount"),
+                          ("friend", "credit_balance"),
+                          ("friend", "debit_balance")):
+        connection.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+
+def add_versions(connection: Connection):
+    connection.exec_driver_sql("ALTER TABLE friend ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    connection.exec_driver_sql("ALTER TABLE expense ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+
+def add_ledger(connection: Connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE payment (
+            id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            friend_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            kind VARCHAR NOT NULL,
+            created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            PRIMARY KEY (id)
+        )
+    """)
+    connection.exec_driver_sql("CREATE INDEX ix_payment_created_at ON payment (created_at)")
+    connection.exec_driver_sql("CREATE INDEX ix_payment_expense_id ON payment (expense_id)")
+    connection.exec_driver_sql("CREATE INDEX ix_payment_friend_id_expense_id ON payment (friend_id, expense_id)")
+    connection.exec_driver_sql("""
+        CREATE TABLE snapshot (
+            id INTEGER NOT NULL,
+            payment_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            PRIMARY KEY (id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        CREATE TABLE snapshotcredit (
+            expense_id INTEGER NOT NULL,
+            friend_id INTEGER NOT NULL,
+            snapshot_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            PRIMARY KEY (expense_id, friend_id, snapshot_id),
+            FOREIGN KEY(snapshot_id) REFERENCES snapshot (id)
+        )
+    """)
+    connection.exec_driver_sql("CREATE INDEX ix_snapshotcredit_friend_id_snapshot_id ON snapshotcredit (friend_id, snapshot_id)")
+    # The history before the ledger is lost: open it with the current credits
+    connection.exec_driver_sql("""
+        INSERT INTO payment (expense_id, friend_id, amount_cents, kind)
+        SELECT expense_id, friend_id, amount_cents, 'opening' FROM friendexpenselink
+        WHERE amount_cents != 0
+        ORDER BY expense_id, friend_id
+    """)
+
+
+
+def normalize_dates(connection: Connection):
+    # Dates were validated with strptime("%Y-%m-%d") when they were strings, which
+    # accepts unpadded values like 2024-1-5; SQLite's date functions and the
+    # string comparisons of the range filters need YYYY-MM-DD. Rewritten rows
+    # that clash with an existing expense are tagged with their id, as in add_indexes
+    rows = connection.exec_driver_sql("""
+        SELECT id, description, date FROM expense
+        WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' ORDER BY id
+    """).all()
+    for expense_id, description, date in rows:
+        try:
+            day = datetime.strptime(str(date).strip(), "%Y-%m-%d").date().isoformat()
+        except ValueError:
+            print(f"Expense {expense_id} keeps its malformed date '{date}'")
+            continue
+        clash = connection.exec_driver_sql("SELECT 1 FROM expense WHERE description = ? AND date = ? AND id != ?",
+                                           (description, day, expense_id)).first()
+        if clash is not None:
+            description = f"{description} ({expense_id})"
+        connection.exec_driver_sql("UPDATE expense SET description = ?, date = ? WHERE id = ?",
+                                   (description, day, expense_id))
+
+
+def add_rollups(connection: Connection):
+    # The months are computed by SQLite, which returns NULL for unpadded dates.
+    # Any file past this version already had valid dates, since NULL months
+    # fail the inserts below, so the fix runs here rather than as a version of its own
+    normalize_dates(connection)
+    connection.exec_driver_sql("""
+        CREATE TABLE monthlytotal (
+            month DATE NOT NULL,
+            num_expenses INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            credit_balance_cents INTEGER NOT NULL,
+            PRIMARY KEY (month)
+        )
+    """)
+    connection.exec_driver_sql("""
+        CREATE TABLE monthlyfriendtotal (
+            month DATE NOT NULL,
+            friend_id INTEGER NOT NULL,
+            num_expenses INTEGER NOT NULL,
+            credit_balance_cents INTEGER NOT NULL,
+            debit_balance_cents INTEGER NOT NULL,
+            PRIMARY KEY (month, friend_id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO monthlytotal (month, num_expenses, amount_cents, credit_balance_cents)
+        SELECT date(date, 'start of month'), count(*), sum(amount_cents), sum(credit_balance_cents)
+        FROM expense GROUP BY date(date, 'start of month')
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO monthlyfriendtotal (month, friend_id, num_expenses, credit_balance_cents, debit_balance_cents)
+        SELECT date(e.date, 'start of month'), l.friend_id, count(*), sum(l.amount_cents), sum(e.amount_cents / e.num_friends)
+        FROM friendexpenselink l JOIN expense e ON e.id = l.expense_id
+        GROUP BY date(e.date, 'start of month'), l.friend_id
+    """)
+
+
+def add_changes(connection: Connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE change (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            table_name VARCHAR NOT NULL,
+            friend_id INTEGER,
+            expense_id INTEGER
+        )
+    """)
+    create_triggers(connection)
+    # Existing rows are reported as changes, so that a client that syncs from
+    # cursor 0 gets all of them
+    connection.exec_driver_sql("INSERT INTO change (table_name, friend_id, expense_id) SELECT 'friend', id, NULL FROM friend ORDER BY id")
+    connection.exec_driver_sql("INSERT INTO change (table_name, friend_id, expense_id) SELECT 'expense', NULL, id FROM expense ORDER BY id")
+    connection.exec_driver_sql("""
+        INSERT INTO change (table_name, friend_id, expense_id)
+        SELECT 'friendexpenselink', friend_id, expense_id FROM friendexpenselink ORDER BY expense_id, friend_id
+    """)
+
+
+# MIGRATIONS[n] upgrades a database from version n to version n + 1
+MIGRATIONS = [
+    add_indexes,
+    fill_balances,
+    store_cents,
+    add_versions,
+    add_ledger,
+    add_rollups,
+    add_changes,
+]
+
+
+def get_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def set_version(connection: Connection, version: int):
+    connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(engine: Engine) -> int:
+    with engine.begin() as connection:
+        if not inspect(connection).has_table("expense"):
+            SQLModel.metadata.create_all(connection)
+            # Triggers are not part of the models
+            create_triggers(connection)
+            set_version(connection, len(MIGRATIONS))
+        else:
+            for version in range(get_version(connection), len(MIGRATIONS)):
+                print(f"Migrating database to version {version + 1} ({MIGRATIONS[version].__name__})")
+                MIGRATIONS[version](connection)
+                set_version(connection, version + 1)
+            # Tables added to the models since the file was created
+            SQLModel.metadata.create_all(connection)
+        return get_version(connection)
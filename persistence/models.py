@@ -1,7 +1,12 @@
 
-from typing import Optional
-from sqlmodel import Field, Relationship, SQLModel
-from pydantic import BaseModel
+import datetime as dt
+from datetime import date, datetime
+from typing import Optional, Union
+from sqlalchemy import text
+from sqlmodel import Field, Relationship, SQLModel, Index
+from pydantic import BaseModel, FiniteFloat
+
+from persistence.money import from_cents
 
 class Message(BaseModel):
     detail: str
@@ -9,8 +14,8 @@ class Message(BaseModel):
 
 class FriendExpenseLink(SQLModel, table=True):
     friend_id: Optional[int] = Field(default=None, foreign_key="friend.id", primary_key=True)    
-    expense_id: Optional[int] = Field(default=None, foreign_key="expense.id", primary_key=True)
-    amount: float = Field(default = 0)
+    expense_id: Optional[int] = Field(default=None, foreign_key="expense.id", primary_key=True, index=True)
+    amount_cents: int = Field(default = 0)
 
     friend: "Friend" = Relationship(back_populates="expense_links")
     expense: "Expense" = Relationship(back_populates="friend_links")
@@ -20,23 +25,290 @@ class Friend(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str  
     expense_links: list["FriendExpenseLink"] = Relationship(back_populates="friend", cascade_delete=True)
-    credit_balance: float = Field(default = 0)
-    debit_balance: float = Field(default = 0)
+    credit_balance_cents: int = Field(default = 0)
+    debit_balance_cents: int = Field(default = 0)
+    # Bumped on every change of the name, for optimistic concurrency
+    version: int = Field(default = 1)
 
 
 class Expense(SQLModel, table=True):
+    __table_args__ = (Index("ix_expense_description_date", "description", "date", unique=True),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     description: str
-    date: str
-    amount: float
-    credit_balance: Optional[float] = Field(default = 0)
+    # Stored as YYYY-MM-DD, so ranges are served by the index (dt.date
+    # because the field name shadows the type)
+    date: dt.date = Field(index=True)
+    amount_cents: int
+    credit_balance_cents: int = Field(default = 0)
     num_friends: Optional[int] = Field(default = 1)
+    # Bumped on every change of the description, date or amount
+    version: int = Field(default = 1)
     friend_links: list["FriendExpenseLink"] = Relationship(back_populates="expense", cascade_delete=True)
 
+
+class MonthlyTotal(SQLModel, table=True):
+    # Expenses of each month (keyed by its first day), maintained on every write;
+    # rows are removed when the month has no expenses left
+    month: date = Field(primary_key=True)
+    num_expenses: int = Field(default = 0)
+    amount_cents: int = Field(default = 0)
+    credit_balance_cents: int = Field(default = 0)
+
+
+class MonthlyFriendTotal(SQLModel, table=True):
+    # Share of each friend in the expenses of each month; rows are removed
+    # when the friend has no expenses left in the month
+    month: date = Field(primary_key=True)
+    friend_id: int = Field(primary_key=True)
+    num_expenses: int = Field(default = 0)
+    credit_balance_cents: int = Field(default = 0)
+    debit_balance_cents: int = Field(default = 0)
+
+
+# Timestamps are taken from the database clock when the row is inserted, so
+# they follow the order of the ids
+NOW = text("(strftime('%Y-%m-%d %H:%M:%f', 'now'))")
+
+
+class Payment(SQLModel, table=True):
+    # Append-only ledger of every change to the credit of a friend in an
+    # expense. Rows are never updated or deleted and outlive the expense, so
+    # there are no foreign keys.
+    __table_args__ = (Index("ix_payment_friend_id_expense_id", "friend_id", "expense_id"),
+                      Index("ix_payment_expense_id", "expense_id"))
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    expense_id: int
+    friend_id: int
+    amount_cents: int
+    kind: str = Field(default="payment")
+    created_at: Optional[datetime] = Field(default=None, index=True, sa_column_kwargs={"server_default": NOW})
+
+
+class Snapshot(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Last ledger event rolled into the snapshot
+    payment_id: int
+    created_at: Optional[datetime] = Field(default=None, sa_column_kwargs={"server_default": NOW})
+
+
+class SnapshotCredit(SQLModel, table=True):
+    # Credit of every link that changed since the previous snapshot, as of
+    # this one; the credit of a link at a snapshot is its latest row up to it
+    __table_args__ = (Index("ix_snapshotcredit_friend_id_snapshot_id", "friend_id", "snapshot_id"),)
+
+    expense_id: int = Field(primary_key=True)
+    friend_id: int = Field(primary_key=True)
+    snapshot_id: int = Field(primary_key=True, foreign_key="snapshot.id")
+    amount_cents: int
+
+
+class Change(SQLModel, table=True):
+    # Change feed of friends, expenses and links, filled by the triggers in
+    # persistence/changes.py: one row per inserted, updated or deleted row,
+    # with the key of that row. The id is the cursor of GET /changes and is
+    # never reused (AUTOINCREMENT).
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str
+    friend_id: Optional[int] = None
+    expense_id: Optional[int] = None
+
+
+# The API accepts and returns decimal amounts, the tables store integer cents
+
+class FriendCreate(BaseModel):
+    id: Optional[int] = None
+    name: str
+    # On updates, the version the change is based on (409 if it is no longer current)
+    version: Optional[int] = None
+
+
+class FriendPublic(BaseModel):
+    id: int
+    name: str
+    credit_balance: float = 0
+    debit_balance: float = 0
+    version: int = 1
+
+    @classmethod
+    def from_friend(cls, friend: Friend) -> "FriendPublic":
+        return cls(id=friend.id, name=friend.name,
+                   credit_balance=from_cents(friend.credit_balance_cents),
+                   debit_balance=from_cents(friend.debit_balance_cents),
+                   version=friend.version)
+
+
+class ExpenseCreate(BaseModel):
+    id: Optional[int] = None
+    description: str
+    date: dt.date
+    amount: FiniteFloat = Field(ge=0)
+    # On updates, the version the change is based on (409 if it is no longer current)
+    version: Optional[int] = None
+
+
+class ExpensePublic(BaseModel):
+    id: int
+    description: str
+    date: dt.date
+    amount: float
+    credit_balance: float = 0
+    num_friends: int = 1
+    version: int = 1
+
+    @classmethod
+    def from_expense(cls, expense: Expense) -> "ExpensePublic":
+        return cls(id=expense.id, description=expense.description, date=expense.date,
+                   amount=from_cents(expense.amount_cents),
+                   credit_balance=from_cents(expense.credit_balance_cents),
+                   num_friends=expense.num_friends,
+                   version=expense.version)
+
+
+class FriendExpenseLinkPublic(BaseModel):
+    friend_id: int
+    expense_id: int
+    amount: float
+
+    @classmethod
+    def from_link(cls, link: FriendExpenseLink) -> "FriendExpenseLinkPublic":
+        return cls(friend_id=link.friend_id, expense_id=link.expense_id, amount=from_cents(link.amount_cents))
+
+
 class FriendExpense(BaseModel):
     id: int
     description: str
     amount: float
     num_friends: int
     credit_balance: float
-    debit_balance: float
\ No newline at end of file
+    debit_balance: float
+
+class Participant(BaseModel):
+    expense_id: int
+    friend_id: int
+
+
+class BulkItemResult(BaseModel):
+    # Outcome of one item of a bulk request, in the same order as the request
+    index: int
+    status: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    rows: int
+    expenses: int
+    friends: int
+    skipped: int
+    errors: list[str]
+    seconds: float
+    rows_per_second: float
+
+
+class Transfer(BaseModel):
+    # A payment that settles part of the balances; a None id is the user himself/herself
+    from_id: Optional[int]
+    from_name: str
+    to_id: Optional[int]
+    to_name: str
+    amount: float
+
+
+class FixtureFriend(BaseModel):
+    id: str
+    name: str
+
+
+class FixtureExpense(BaseModel):
+    id: str
+    description: str
+    date: dt.date
+    amount: FiniteFloat = Field(ge=0)
+    # Ids of the friends sharing the expense, or what each of them has already paid
+    participants: Union[list[str], dict[str, FiniteFloat]] = []
+
+    def paid(self) -> dict[str, float]:
+        if isinstance(self.participants, dict):
+            return self.participants
+        return dict.fromkeys(self.participants, 0)
+
+
+class Fixtures(BaseModel):
+    friends: list[FixtureFriend] = []
+    expenses: list[FixtureExpense] = []
+
+
+class FixturesReport(BaseModel):
+    # Id given to each friend and expense of the fixtures
+    friends: dict[str, int]
+    expenses: dict[str, int]
+
+
+class PaymentPublic(BaseModel):
+    id: int
+    expense_id: int
+    friend_id: int
+    amount: float
+    kind: str
+    created_at: datetime
+
+    @classmethod
+    def from_payment(cls, payment: Payment) -> "PaymentPublic":
+        return cls(id=payment.id, expense_id=payment.expense_id, friend_id=payment.friend_id,
+                   amount=from_cents(payment.amount_cents), kind=payment.kind, created_at=payment.created_at)
+
+
+class LedgerBalance(BaseModel):
+    # Credit rebuilt from the ledger as of a date (now if None)
+    as_of: Optional[datetime]
+    credit_balance: float
+    links: list[FriendExpenseLinkPublic]
+
+
+class SnapshotReport(BaseModel):
+    snapshot_id: Optional[int]
+    payment_id: Optional[int]
+    links: int
+
+
+class MonthTotal(BaseModel):
+    month: date
+    num_expenses: int
+    amount: float
+    # What friends have paid of it
+    credit_balance: float
+
+
+class FriendTotal(BaseModel):
+    friend_id: int
+    name: str
+    num_expenses: int
+    credit_balance: float
+    debit_balance: float
+
+
+class Dashboard(BaseModel):
+    date_from: date
+    date_to: date
+    num_expenses: int
+    amount: float
+    credit_balance: float
+    months: list[MonthTotal]
+    friends: list[FriendTotal]
+
+
+class ChangesPage(BaseModel):
+    # Current state of the rows changed after a cursor; rows that no longer
+    # exist are listed by key
+    cursor: int
+    has_more: bool
+    friends: list[FriendPublic]
+    expenses: list[ExpensePublic]
+    links: list[FriendExpenseLinkPublic]
+    deleted_friends: list[int]
+    deleted_expenses: list[int]
+    deleted_links: list[Participant]
@@ -0,0 +1,41 @@
+"""
+Money is stored as integer cents so that balances are exact sums.
+
+The API keeps speaking decimal amounts: they are rounded to the nearest cent
+(halves away from zero) on the way in and divided by 100 on the way out.
+
+An expense of `amount_cents` shared by `num_friends` people (its friends plus
+the user himself/herself) is split as follows: every friend owes
+`amount_cents / num_friends` truncated toward zero, as SQLite's integer
+division does, and the user absorbs the remainder. The shares always add up
+to the amount and the sums in SQL match the ones made here.
+
+Expenses cannot be negative, but rows stored before that was enforced are
+split by the same rule.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount) -> int:
+    # Through str() so that floats like 0.285 round as they are written
+    try:
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount '{amount}'") from None
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount '{amount}'")
+    return int(value.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents: int) -> float:
+    # Also takes SQL expressions: a float divisor keeps the result a float in
+    # SQLite instead of a Numeric that would come back as Decimal
+    return cents / 100.0
+
+
+def share(amount_cents: int, num_friends: int) -> int:
+    # Debit of each friend of an expense; the remainder stays with the user
+    debit = abs(amount_cents) // num_friends
+    return debit if amount_cents >= 0 else -debit
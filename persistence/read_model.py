@@ -0,0 +1,204 @@
+"""
+Optional in-memory read model of friends, expenses and links, enabled with
+DB_READ_MODEL=1.
+
+The rows are kept in dicts indexed by id, with the balances already
+materialized, and the credits of the links indexed both by expense and by
+friend, so the single-item reads of the routers are served without SQL. It is
+loaded from SQLite at startup and kept up to date by the write paths: they
+record the ids they touch in the session (see touch()), and once the
+transaction has been committed those entries are read back from the database
+and replaced. Rolled back transactions never reach it.
+
+Entries are replaced, never modified in place, so readers on other threads
+always see a whole row and can iterate the links without locking. Like the
+data generation counter, the model only sees the writes of its own process.
+
+The async handlers (DB_ASYNC=1) commit on the event loop thread, where the
+refresh would block every other request while it reads SQLite. They defer it
+instead (see defer_refresh()) and await it in a worker thread before
+answering; the data generation moves once more afterwards, so that responses
+cached from the stale model in between are dropped.
+"""
+import asyncio
+import threading
+from datetime import date
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+from sqlmodel import select
+
+from persistence.models import Friend, Expense, FriendExpenseLink
+from persistence.generation import data_generation
+
+# Ids read back per query after a commit
+CHUNK_SIZE = 5000
+
+
+class FriendRow(NamedTuple):
+    id: int
+    name: str
+    credit_balance_cents: int
+    debit_balance_cents: int
+    version: int
+
+
+class ExpenseRow(NamedTuple):
+    id: int
+    description: str
+    date: date
+    amount_cents: int
+    credit_balance_cents: int
+    num_friends: int
+    version: int
+
+
+FRIEND_COLUMNS = (Friend.id, Friend.name, Friend.credit_balance_cents, Friend.debit_balance_cents, Friend.version)
+EXPENSE_COLUMNS = (Expense.id, Expense.description, Expense.date, Expense.amount_cents,
+                   Expense.credit_balance_cents, Expense.num_friends, Expense.version)
+LINK_COLUMNS = (FriendExpenseLink.expense_id, FriendExpenseLink.friend_id, FriendExpenseLink.amount_cents)
+
+
+def chunks(ids: list[int]) -> Iterable[list[int]]:
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+class ReadModel:
+    def __init__(self):
+        self.enabled = False
+        self.engine: Optional[Engine] = None
+        self.friends: dict[int, FriendRow] = {}
+        self.expenses: dict[int, ExpenseRow] = {}
+        # Credit in cents of each friend in each expense, by expense and by friend
+        self.expense_links: dict[int, dict[int, int]] = {}
+        self.friend_links: dict[int, dict[int, int]] = {}
+        self.lock = threading.Lock()
+
+    def rebuild(self, engine: Engine):
+        friends, expenses, expense_links, friend_links = {}, {}, {}, {}
+        with engine.connect() as connection:
+            for row in connection.execute(select(*FRIEND_COLUMNS)):
+                friends[row.id] = FriendRow(*row)
+            for row in connection.execute(select(*EXPENSE_COLUMNS)):
+                expenses[row.id] = ExpenseRow(*row)
+            for expense_id, friend_id, credit in connection.execute(select(*LINK_COLUMNS).order_by(*LINK_COLUMNS[:2])):
+                expense_links.setdefault(expense_id, {})[friend_id] = credit
+                friend_links.setdefault(friend_id, {})[expense_id] = credit
+        with self.lock:
+            self.engine = engine
+            self.friends, self.expenses = friends, expenses
+            self.expense_links, self.friend_links = expense_links, friend_links
+            self.enabled = True
+
+    def refresh(self, friend_ids: set[int], expense_ids: set[int]):
+        # Reading and applying under the lock keeps concurrent commits of the
+        # same rows from being applied out of order
+        with self.lock, self.engine.connect() as connection:
+            friends = {}
+            for ids in chunks(sorted(friend_ids)):
+                for row in connection.execute(select(*FRIEND_COLUMNS).where(Friend.id.in_(ids))):
+                    friends[row.id] = FriendRow(*row)
+            expenses, links = {}, {expense_id: {} for expense_id in expense_ids}
+            for ids in chunks(sorted(expense_ids)):
+                for row in connection.execute(select(*EXPENSE_COLUMNS).where(Expense.id.in_(ids))):
+                    expenses[row.id] = ExpenseRow(*row)
+                for expense_id, friend_id, credit in connection.execute(select(*LINK_COLUMNS)
+                                                                        .where(FriendExpenseLink.expense_id.in_(ids))
+                                                                        .order_by(*LINK_COLUMNS[:2])):
+                    links[expense_id][friend_id] = credit
+
+            for friend_id in friend_ids:
+                if friend_id in friends:
+                    self.friends[friend_id] = friends[friend_id]
+                else:
+                    self.friends.pop(friend_id, None)
+                    self.friend_links.pop(friend_id, None)
+            for expense_id in expense_ids:
+                if expense_id in expenses:
+                    self.expenses[expense_id] = expenses[expense_id]
+                else:
+                    self.expenses.pop(expense_id, None)
+                self.set_links(expense_id, links[expense_id])
+
+    def set_links(self, expense_id: int, credits: dict[int, int]):
+        previous = self.expense_links.get(expense_id, {})
+        for friend_id in previous.keys() | credits.keys():
+            friend_links = dict(self.friend_links.get(friend_id, {}))
+            if friend_id in credits:
+                friend_links[expense_id] = credits[friend_id]
+            else:
+                friend_links.pop(expense_id, None)
+            if friend_links:
+                self.friend_links[friend_id] = dict(sorted(friend_links.items()))
+            else:
+                self.friend_links.pop(friend_id, None)
+        if credits:
+            self.expense_links[expense_id] = credits
+        else:
+            self.expense_links.pop(expense_id, None)
+
+
+read_model = ReadModel()
+
+
+def touch(session: Session, friend_ids: Iterable[int] = (), expense_ids: Iterable[int] = ()):
+    # Marks rows to be reloaded into the read model when the session commits
+    if read_model.enabled:
+        touched_friends, touched_expenses = session.info.setdefault("read_model", (set(), set()))
+        touched_friends.update(friend_ids)
+        touched_expenses.update(expense_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def on_flush(session, _flush_context):
+    # Rows written through the unit of work; Core statements call touch()
+    if read_model.enabled:
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, Friend):
+                touch(session, friend_ids=[instance.id])
+            elif isinstance(instance, Expense):
+                touch(session, expense_ids=[instance.id])
+            elif isinstance(instance, FriendExpenseLink):
+                touch(session, friend_ids=[instance.friend_id], expense_ids=[instance.expense_id])
+
+
+def refresh_or_disable(friend_ids: set[int], expense_ids: set[int]):
+    try:
+        read_model.refresh(friend_ids, expense_ids)
+    except Exception as e:
+        # A stale model would serve wrong balances: fall back to SQLite
+        read_model.enabled = False
+        print(f"Read model disabled, it could not be refreshed: {e}")
+
+
+def defer_refresh(session: Session) -> list:
+    # Refreshes after the commits of this session are collected in the returned
+    # list instead of being run; pass it to run_deferred() off the commit
+    return session.info.setdefault("read_model_deferred", [])
+
+
+async def run_deferred(deferred: list):
+    if not deferred:
+        return
+    while deferred:
+        await asyncio.to_thread(refresh_or_disable, *deferred.pop(0))
+    data_generation.bump()
+
+
+# Inserted first so that the model is current before the data generation
+# moves and cached responses are rebuilt
+@event.listens_for(Session, "after_commit", insert=True)
+def on_commit(session):
+    touched = session.info.pop("read_model", None)
+    if touched is not None and read_model.enabled:
+        deferred = session.info.get("read_model_deferred")
+        if deferred is not None:
+            deferred.append(touched)
+        else:
+            refresh_or_disable(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def on_rollback(session):
+    session.info.pop("read_model", None)
@@ -0,0 +1,165 @@
+"""
+Recomputes the balance columns of Friend and Expense from scratch and reports
+any drift with respect to the values maintained by the write paths.
+
+The credit of every friend in every expense is also checked against the
+payment ledger, which is the source of truth: links whose credit differs are
+reset to the ledger, and credits left in the ledger by links that no longer
+exist are closed with a reversal event. The monthly rollups are recomputed
+last, from the fixed balances.
+
+Usage:
+    python -m persistence.reconcile          # report only
+    python -m persistence.reconcile --fix    # report and overwrite the stored values
+"""
+import argparse
+import sys
+from datetime import date
+from typing import NamedTuple, Union
+from sqlmodel import Session, select, update, delete, insert
+
+from persistence.database import engine, write_engine
+from persistence.models import Friend, Expense, FriendExpenseLink, MonthlyTotal, MonthlyFriendTotal
+from persistence.balances import get_friend_balances, get_expense_balances, get_monthly_totals, get_monthly_friend_totals
+from persistence import ledger
+
+class Drift(NamedTuple):
+    table: str
+    # (expense_id, friend_id) for links and ledger entries, the month for
+    # monthly totals and (month, friend_id) for monthly friend totals
+    id: Union[int, date, tuple[int, int], tuple[date, int]]
+    column: str
+    stored: int
+    expected: int
+
+
+def find_ledger_drift(session: Session) -> list[Drift]:
+    drift = []
+    credits = ledger.get_credits(session)
+    for expense_id, friend_id, amount in session.exec(select(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id,
+                                                             FriendExpenseLink.amount_cents)):
+        expected = credits.pop((expense_id, friend_id), 0)
+        if amount != expected:
+            drift.append(Drift("friendexpenselink", (expense_id, friend_id), "amount_cents", amount, expected))
+    # Whatever is left belongs to links that were removed without a reversal
+    for key, amount in sorted(credits.items()):
+        if amount != 0:
+            drift.append(Drift("payment", key, "amount_cents", amount, 0))
+    return drift
+
+
+def find_balance_drift(session: Session) -> list[Drift]:
+    drift = []
+
+    friend_balances = get_friend_balances(session)
+    # Balances are integer cents, so any difference at all is drift
+    for friend_id, credit_balance, debit_balance in session.exec(select(Friend.id, Friend.credit_balance_cents, Friend.debit_balance_cents)):
+        expected_credit, expected_debit = friend_balances.get(friend_id, (0, 0))
+        if credit_balance != expected_credit:
+            drift.append(Drift("friend", friend_id, "credit_balance_cents", credit_balance, expected_credit))
+        if debit_balance != expected_debit:
+            drift.append(Drift("friend", friend_id, "debit_balance_cents", debit_balance, expected_debit))
+
+    expense_balances = get_expense_balances(session)
+    for expense_id, credit_balance, num_friends in session.exec(select(Expense.id, Expense.credit_balance_cents, Expense.num_friends)):
+        expected_credit, expected_num_friends = expense_balances[expense_id]
+        if credit_balance != expected_credit:
+            drift.append(Drift("expense", expense_id, "credit_balance_cents", credit_balance, expected_credit))
+        if num_friends != expected_num_friends:
+            drift.append(Drift("expense", expense_id, "num_friends", num_friends, expected_num_friends))
+
+    return drift
+
+
+# Rollup tables: model, key columns and value columns
+ROLLUPS = {
+    "monthlytotal": (MonthlyTotal, ("month",), ("num_expenses", "amount_cents", "credit_balance_cents")),
+    "monthlyfriendtotal": (MonthlyFriendTotal, ("month", "friend_id"), ("num_expenses", "credit_balance_cents", "debit_balance_cents")),
+}
+
+
+def find_rollup_drift(session: Session) -> list[Drift]:
+    drift = []
+    for table, expected_rows in (("monthlytotal", get_monthly_totals(session)),
+                                 ("monthlyfriendtotal", get_monthly_friend_totals(session))):
+        model, keys, columns = ROLLUPS[table]
+        stored_rows = {}
+        for row in session.exec(select(*(getattr(model, column) for column in keys + columns))):
+            key = row[0] if len(keys) == 1 else tuple(row[:len(keys)])
+            stored_rows[key] = tuple(row[len(keys):])
+        for key in sorted(stored_rows.keys() | expected_rows.keys()):
+            stored = stored_rows.get(key, (0,) * len(columns))
+            expected = expected_rows.get(key, (0,) * len(columns))
+            drift += [Drift(table, key, column, stored_value, expected_value)
+                      for column, stored_value, expected_value in zip(columns, stored, expected)
+                      if stored_value != expected_value]
+    return drift
+
+
+def find_drift(session: Session) -> list[Drift]:
+    return find_ledger_drift(session) + find_balance_drift(session) + find_rollup_drift(session)
+
+
+def reconcile(session: Session, fix: bool = False) -> list[Drift]:
+    if not fix:
+        return find_drift(session)
+
+    # Credits go first, the balances are then recomputed from the fixed links
+    drift = find_ledger_drift(session)
+    reversals = []
+    for entry in drift:
+        expense_id, friend_id = entry.id
+        if entry.table == "friendexpenselink":
+            session.exec(update(FriendExpenseLink)
+                         .where(FriendExpenseLink.expense_id == expense_id, FriendExpenseLink.friend_id == friend_id)
+                         .values(amount_cents=entry.expected))
+        else:
+            reversals.append({"expense_id": expense_id, "friend_id": friend_id,
+                              "amount_cents": entry.expected - entry.stored, "kind": ledger.REVERSAL})
+    ledger.record(session, reversals)
+    session.flush()
+
+    balance_drift = find_balance_drift(session)
+    models = {"friend": Friend, "expense": Expense}
+    for entry in balance_drift:
+        model = models[entry.table]
+        session.exec(update(model).where(model.id == entry.id).values({entry.column: entry.expected}))
+    session.flush()
+
+    # The rollups are small (a row per month and friend), so they are rebuilt whole
+    rollup_drift = find_rollup_drift(session)
+    if rollup_drift:
+        for table, expected_rows in (("monthlytotal", get_monthly_totals(session)),
+                                     ("monthlyfriendtotal", get_monthly_friend_totals(session))):
+            model, keys, columns = ROLLUPS[table]
+            session.exec(delete(model))
+            rows = [dict(zip(keys + columns, (key if len(keys) > 1 else (key,)) + values))
+                    for key, values in expected_rows.items()]
+            if rows:
+                session.exec(insert(model), params=rows)
+    session.commit()
+    return drift + balance_drift + rollup_drift
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Recompute the stored balances and report any drift")
+    parser.add_argument("--fix", action="store_true", help="overwrite the drifted values with the recomputed ones")
+    args = parser.parse_args(argv)
+
+    with Session(write_engine if args.fix else engine) as session:
+        drift = reconcile(session, fix=args.fix)
+
+    for entry in drift:
+        entry_id = "(" + ", ".join(map(str, entry.id)) + ")" if isinstance(entry.id, tuple) else entry.id
+        print(f"{entry.table} {entry_id} {entry.column}: stored {entry.stored}, expected {entry.expected}")
+    if not drift:
+        print("No drift found")
+    elif args.fix:
+        print(f"Fixed {len(drift)} drifted value(s)")
+    else:
+        print(f"Found {len(drift)} drifted value(s), run with --fix to repair them")
+    return 1 if drift and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,32 @@
 from persistence.database import engine
-from persistence.models import Friend, FriendExpenseLink, Expense
-from sqlmodel import SQLModel, text, Session, select
-from faker import Faker
-import datetime
-import random
+from persistence.models import Friend
+from persistence.migrations import migrate
+from persistence.fixtures import generate_data
+from sqlmodel import Session, select
 
+DEMO_SEED = 2024
 
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-    # Foreign keys are disabled in sqlite3 by default
-    with Session(engine) as session:
-        session.exec(text("PRAGMA foreign_keys = ON"))
+    # Creates a new database or upgrades an existing one to the current schema
+    migrate(engine)
 
 
 def init_db():
-    fake = Faker("es_ES")
-    expenses = []
-    with Session(engine) as session:
-        for _ in range(5):
-            expenses.append(Expense(description=f"Travel to {fake.city()}", 
-                                    date=fake.date_between(datetime.datetime(2024,10,1), datetime.datetime.now()),
-                                    amount=float(random.randint(50, 1000))))
-            session.add(expenses[-1])
-            session.commit()
-            session.refresh(expenses[-1])
-
-        for _ in range(10):
-            expense_links = []
-            used = []
-            for _ in range(random.randint(0,4)):
-                random_expense = random.randint(0,len(expenses)-1)
-                if random_expense in used:
-                    continue
-                used.append(random_expense)
-                expense_link = FriendExpenseLink(expense_id = expenses[random_expense].id,
-                                   amount = 0)
-                expense_links.append(expense_link)
-            friend = Friend(name=fake.first_name(), expense_links=expense_links)
-            session.add(friend)
-            session.commit()
+    # A small demo dataset, the same on every start
+    generate_data(engine, num_friends=10, num_expenses=5, seed=DEMO_SEED)
+
 
 def init_db_if_empty():
     with Session(engine) as session:
-        friends = session.exec(select(Friend))
-        if len(friends.all()) == 0:
-            init_db()
-        else:
-            print("DB not empty")
+        # Only look for one row, generated databases may hold millions
+        friend = session.exec(select(Friend.id).limit(1)).first()
+    # The session is closed first, its read transaction would keep the seed
+    # from committing with a rollback journal
+    if friend is None:
+        init_db()
+    else:
+        print("DB not empty")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import io
+from pathlib import Path
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from persistence.database import get_session
+from persistence.models import Message, ImportReport, Expense, Fixtures, FixturesReport, SnapshotReport
+from persistence.importer import FORMATS, read_records, import_expenses
+from persistence.fixtures import load_fixtures
+from persistence import ledger
+from sqlmodel import Session, select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+
+router = APIRouter(
+    prefix = "/admin",
+    tags=["admin"]
+)
+
+SUFFIXES = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+@router.post("/import", summary="Import expenses from CSV or JSONL",
+          responses={200: {"model": ImportReport}, 422: {"model": Message}})
+def import_file(file: UploadFile, format: Optional[str] = None, session: Session = Depends(get_session)) -> ImportReport:
+    format = format or SUFFIXES.get(Path(file.filename or "").suffix.lower())
+    if format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown import format (available: {', '.join(FORMATS)})")
+    # The upload is spooled to disk and read back one record at a time; bytes
+    # that are not UTF-8 only make their own record fail
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="surrogateescape", newline="")
+    progress = import_expenses(session, read_records(stream, format))
+    return ImportReport(rows=progress.rows,
+                        expenses=progress.expenses,
+                        friends=progress.friends,
+                        skipped=progress.skipped,
+                        errors=progress.errors,
+                        seconds=progress.seconds,
+                        rows_per_second=progress.rows_per_second)
+
+
+@router.post("/fixtures", summary="Load a fixtures dataset",
+          status_code=201,
+          responses={201: {"model": FixturesReport}, 409: {"model": Message}, 422: {"model": Message}})
+def add_fixtures(fixtures: Fixtures, session: Session = Depends(get_session)) -> FixturesReport:
+    friend_ids = [friend.id for friend in fixtures.friends]
+    expense_ids = [expense.id for expense in fixtures.expenses]
+    if len(set(friend_ids)) < len(friend_ids) or len(set(expense_ids)) < len(expense_ids):
+        raise HTTPException(status_code=422, detail="Fixture ids must be unique")
+    keys = set()
+    for expense in fixtures.expenses:
+        unknown = set(expense.paid()) - set(friend_ids)
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Expense '{expense.id}' has unknown participants: {', '.join(sorted(unknown))}")
+        if (expense.description, expense.date) in keys:
+            raise HTTPException(status_code=422, detail=f"Expense '{expense.description}' on {expense.date} is repeated")
+        keys.add((expense.description, expense.date))
+
+    if keys:
+        existing = session.exec(select(Expense.description, Expense.date)
+                                .where(tuple_(Expense.description, Expense.date).in_(list(keys)))).first()
+        if existing is not None:
+            raise HTTPException(status_code=409, detail=f"Expense '{existing[0]}' on {existing[1]} already exists")
+    try:
+        return load_fixtures(session, fixtures)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Data was created concurrently, retry the request")
+
+
+@router.post("/compact", summary="Roll the new ledger events into a snapshot",
+          responses={200: {"model": SnapshotReport}})
+def compact_ledger(session: Session = Depends(get_session)) -> SnapshotReport:
+    snapshot = ledger.compact(session)
+    if snapshot is None:
+        return SnapshotReport(snapshot_id=None, payment_id=None, links=0)
+    return SnapshotReport(snapshot_id=snapshot.id, payment_id=snapshot.payment_id, links=ledger.count_links(session, snapshot))
@@ -0,0 +1,54 @@
+"""
+Async versions of the routers, enabled with DB_ASYNC=1.
+
+Every handler of a router is wrapped in an `async def` that takes an
+AsyncSession over aiosqlite and runs the original handler body on it with
+`run_sync`: the handler logic stays in one place, but requests no longer hold a
+threadpool worker while waiting on the database.
+
+The handler bodies still run on the event loop thread, only their queries are
+awaited. Work that would block there, like the refresh of the read model after
+a commit, is deferred and awaited in a worker thread before the response.
+"""
+import functools
+import inspect
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from persistence.database import get_async_session
+from persistence.read_model import defer_refresh, run_deferred
+
+ROUTE_SETTINGS = ("response_model", "status_code", "tags", "summary", "description",
+                  "response_description", "responses", "deprecated", "methods",
+                  "operation_id", "include_in_schema", "response_class", "name")
+
+
+def asyncify(endpoint):
+    signature = inspect.signature(endpoint)
+    parameters = [parameter.replace(default=Depends(get_async_session), annotation=AsyncSession)
+                  if parameter.name == "session" else parameter
+                  for parameter in signature.parameters.values()]
+
+    @functools.wraps(endpoint)
+    async def async_endpoint(**kwargs):
+        session = kwargs.pop("session")
+        deferred = defer_refresh(session.sync_session)
+        try:
+            return await session.run_sync(lambda sync_session: endpoint(**kwargs, session=sync_session))
+        finally:
+            await run_deferred(deferred)
+
+    async_endpoint.__signature__ = signature.replace(parameters=parameters)
+    return async_endpoint
+
+
+def make_async_router(router: APIRouter) -> APIRouter:
+    async_router = APIRouter()
+    for route in router.routes:
+        if isinstance(route, APIRoute):
+            settings = {setting: getattr(route, setting) for setting in ROUTE_SETTINGS}
+            async_router.add_api_route(route.path, asyncify(route.endpoint), **settings)
+        else:
+            async_router.routes.append(route)
+    return async_router
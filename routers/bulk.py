@@ -0,0 +1,11 @@
+from persistence.models import BulkItemResult
+
+MAX_BULK_ITEMS = 10000
+
+
+def created(index: int, id=None) -> BulkItemResult:
+    return BulkItemResult(index=index, status=201, id=id)
+
+
+def failed(index: int, status: int, detail: str) -> BulkItemResult:
+    return BulkItemResult(index=index, status=status, detail=detail)
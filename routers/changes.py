@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from persistence.database import get_session
+from persistence.models import Message, ChangesPage
+from persistence import changes
+from routers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from sqlmodel import Session
+
+
+router = APIRouter(
+    prefix = "/changes",
+    tags=["changes"]
+)
+
+
+@router.get("/", summary="Get changes since a cursor",
+         responses={200: {"model": ChangesPage}, 410: {"model": Message}})
+def get_changes(since: int = Query(default=0, ge=0),
+                limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                session: Session = Depends(get_session)) -> ChangesPage:
+    page = changes.get_changes(session, since, limit)
+    # A cursor past the end of the feed was issued by another database: the
+    # client has to start over from 0
+    if page.cursor == since and since > 0 and changes.last_change_id(session) < since:
+        raise HTTPException(status_code=410, detail=f"Cursor '{since}' is not part of this change feed")
+    return page
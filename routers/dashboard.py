@@ -0,0 +1,54 @@
+from calendar import monthrange
+from datetime import date
+from fastapi import APIRouter, Depends, Path
+from persistence.database import get_session
+from persistence.models import Friend, MonthlyTotal, MonthlyFriendTotal, MonthTotal, FriendTotal, Dashboard
+from persistence.money import from_cents
+from sqlmodel import Session, select, func
+
+
+router = APIRouter(
+    prefix = "/dashboard",
+    tags=["dashboard"]
+)
+
+
+def get_dashboard(session: Session, first_month: date, last_month: date) -> Dashboard:
+    # Reads the monthly rollups only: at most a row per month and per friend
+    # with expenses in the period, however many expenses there are
+    months = session.exec(select(MonthlyTotal)
+                          .where(MonthlyTotal.month >= first_month, MonthlyTotal.month <= last_month)
+                          .order_by(MonthlyTotal.month)).all()
+    friends = session.exec(select(MonthlyFriendTotal.friend_id, Friend.name,
+                                  func.sum(MonthlyFriendTotal.num_expenses),
+                                  func.sum(MonthlyFriendTotal.credit_balance_cents),
+                                  func.sum(MonthlyFriendTotal.debit_balance_cents))
+                           .join(Friend, Friend.id == MonthlyFriendTotal.friend_id)
+                           .where(MonthlyFriendTotal.month >= first_month, MonthlyFriendTotal.month <= last_month)
+                           .group_by(MonthlyFriendTotal.friend_id)
+                           .order_by(MonthlyFriendTotal.friend_id)).all()
+
+    return Dashboard(date_from=first_month,
+                     date_to=last_month.replace(day=monthrange(last_month.year, last_month.month)[1]),
+                     num_expenses=sum(month.num_expenses for month in months),
+                     amount=from_cents(sum(month.amount_cents for month in months)),
+                     credit_balance=from_cents(sum(month.credit_balance_cents for month in months)),
+                     months=[MonthTotal(month=month.month, num_expenses=month.num_expenses,
+                                        amount=from_cents(month.amount_cents),
+                                        credit_balance=from_cents(month.credit_balance_cents)) for month in months],
+                     friends=[FriendTotal(friend_id=friend_id, name=name, num_expenses=num_expenses,
+                                          credit_balance=from_cents(credit_balance),
+                                          debit_balance=from_cents(debit_balance))
+                              for friend_id, name, num_expenses, credit_balance, debit_balance in friends])
+
+
+@router.get("/{year}", summary="Get the totals of a year",
+         responses={200: {"model": Dashboard}})
+def get_year(year: int = Path(ge=1, le=9999), session: Session = Depends(get_session)) -> Dashboard:
+    return get_dashboard(session, date(year, 1, 1), date(year, 12, 1))
+
+
+@router.get("/{year}/{month}", summary="Get the totals of a month",
+         responses={200: {"model": Dashboard}})
+def get_month(year: int = Path(ge=1, le=9999), month: int = Path(ge=1, le=12), session: Session = Depends(get_session)) -> Dashboard:
+    return get_dashboard(session, date(year, month, 1), date(year, month, 1))
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from persistence.database import engine
+from persistence.events import hub, RESET, read_changes, last_change_id
+from persistence.models import ChangesPage
+
+
+router = APIRouter(
+    prefix = "/events",
+    tags=["events"]
+)
+
+# A comment line is sent after this long without events, so that proxies
+# and clients can tell an idle stream from a dead one
+KEEPALIVE_S = 15.0
+# Reconnection delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+def changes_message(page: ChangesPage) -> str:
+    return f"id: {page.cursor}\nevent: changes\ndata: {page.model_dump_json()}\n\n"
+
+
+RESET_MESSAGE = "event: reset\ndata: {}\n\n"
+
+
+async def stream_events(since: Optional[int]):
+    # Subscribed before reading the feed, so that no change falls in between
+    queue = hub.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if since is None:
+            since = await asyncio.to_thread(last_change_id, engine)
+        else:
+            if since > await asyncio.to_thread(last_change_id, engine):
+                # The cursor was issued by another database
+                yield RESET_MESSAGE
+                return
+            for page in await asyncio.to_thread(read_changes, engine, since):
+                yield changes_message(page)
+                since = page.cursor
+
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is RESET:
+                yield RESET_MESSAGE
+                return
+            start, page = item
+            if start > since:
+                # Changes before the hub's page that this stream has not sent
+                for missed in await asyncio.to_thread(read_changes, engine, since):
+                    yield changes_message(missed)
+                    since = missed.cursor
+            if page.cursor > since:
+                yield changes_message(page)
+                since = page.cursor
+    finally:
+        hub.unsubscribe(queue)
+
+
+@router.get("/", summary="Subscribe to changes (Server-Sent Events)",
+         response_class=StreamingResponse,
+         responses={200: {"content": {"text/event-stream": {}},
+                          "description": "`changes` events with the same content as GET /changes/, and `reset` events"}})
+def get_events(since: Optional[int] = Query(default=None, ge=0),
+               last_event_id: Optional[int] = Header(default=None, ge=0)) -> StreamingResponse:
+    # EventSource sends the id of the last event it got when it reconnects
+    return StreamingResponse(stream_events(last_event_id if last_event_id is not None else since),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
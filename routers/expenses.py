@@ -1,91 +1,143 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from persistence.database import get_session
-from persistence.models import Message, Friend, Expense, FriendExpenseLink, Expense
-from sqlmodel import Session, select, func
+from persistence.models import Message, Expense, ExpenseCreate, ExpensePublic, BulkItemResult
+from persistence.money import to_cents
+from persistence.balances import NO_SHARES, get_expense_shares, update_balances, update_expenses_balances
+from persistence.read_model import read_model
+from routers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from routers.bulk import MAX_BULK_ITEMS, created, failed
+from routers.versioning import bump_version
+from sqlmodel import Session, select, insert, tuple_
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
 
-from datetime import datetime
+from datetime import date
 
 router = APIRouter(
     prefix = "/expenses",
     tags=["expenses"]
 )
 
-def is_valid_date(date_str: str) -> bool:
-    try:
-        datetime.strptime(date_str, "%Y-%m-%d")
-        return True
-    except ValueError:
-        return False
-
 @router.post("/",
           status_code=201,
-          responses={201: {"model": Expense}, 409: {"model": Message}})
-def add_expense(expense: Expense, session: Session = Depends(get_session)) -> Expense:
-    if not is_valid_date(expense.date):
-        raise HTTPException(status_code=422, detail=f"Malformed date '{expense.date}' (required format: YYYY-MM-DD)")
-    existing_expense = session.exec(select(Expense).where(Expense.description == expense.description).where(Expense.date == expense.date))
-    if existing_expense.first() is None:
-        session.add(expense)
-        session.commit()
-        session.refresh(expense)
-        return expense
-    else:
+          responses={201: {"model": ExpensePublic}, 409: {"model": Message}})
+def add_expense(expense: ExpenseCreate, session: Session = Depends(get_session)) -> ExpensePublic:
+    # Balances are maintained by the server
+    new_expense = Expense(id=expense.id, description=expense.description, date=expense.date,
+                          amount_cents=to_cents(expense.amount))
+    session.add(new_expense)
+    try:
+        # The unique index on (description, date) rejects duplicates
+        session.flush()
+    except IntegrityError:
+        session.rollback()
         raise HTTPException(status_code=409, detail="Expense already exists")
+    update_balances(session, new_expense.id, NO_SHARES)
+    # Read back before the commit, a concurrent delete may remove the expense right after
+    session.refresh(new_expense)
+    public_expense = ExpensePublic.from_expense(new_expense)
+    session.commit()
+    return public_expense
 
 
-def get_credit_balance(expense_id: int, session: Session) -> float:
-    # Sum all the contributions of the expense
-    credit_balance = session.exec(select(func.sum(FriendExpenseLink.amount)).where(FriendExpenseLink.expense_id == expense_id)).first()
-    if credit_balance is None:
-        credit_balance = 0
-    return credit_balance
+@router.post("/bulk",
+          status_code=207,
+          responses={207: {"model": list[BulkItemResult]}, 409: {"model": Message}})
+def add_expenses(expenses: list[ExpenseCreate] = Body(max_length=MAX_BULK_ITEMS), session: Session = Depends(get_session)) -> list[BulkItemResult]:
+    results = [None] * len(expenses)
+    pending = {}
+    requested_ids = {}
+    for index, expense in enumerate(expenses):
+        key = (expense.description, expense.date)
+        if key in pending:
+            results[index] = failed(index, 409, f"Expense repeats item {pending[key]}")
+        elif expense.id is not None and expense.id in requested_ids:
+            results[index] = failed(index, 409, f"Expense repeats item {requested_ids[expense.id]}")
+        else:
+            if expense.id is not None:
+                requested_ids[expense.id] = index
+            pending[key] = index
 
-def get_num_friends(expense_id: int, session: Session) -> float:
-    # Get all the friends
-    num_friends = session.exec(select(func.count(FriendExpenseLink.friend_id)).where(FriendExpenseLink.expense_id == expense_id)).first()
-    if num_friends is None:
-        num_friends = 1
-    return num_friends + 1
+    # Check every candidate and explicit id against the stored expenses at once
+    if pending:
+        existing = session.exec(select(Expense.description, Expense.date)
+                                .where(tuple_(Expense.description, Expense.date).in_(list(pending)))).all()
+        for description, date in existing:
+            index = pending.pop((description, date))
+            results[index] = failed(index, 409, "Expense already exists")
+    if requested_ids:
+        for expense_id in session.exec(select(Expense.id).where(Expense.id.in_(list(requested_ids)))).all():
+            index = requested_ids[expense_id]
+            if results[index] is None:
+                del pending[(expenses[index].description, expenses[index].date)]
+                results[index] = failed(index, 409, "Expense already exists")
 
+    if pending:
+        rows = [{"id": expenses[index].id,
+                 "description": expenses[index].description,
+                 "date": expenses[index].date,
+                 "amount_cents": to_cents(expenses[index].amount),
+                 "credit_balance_cents": 0,
+                 "num_friends": 1} for index in pending.values()]
+        table = Expense.__table__
+        ids = session.exec(insert(table).returning(table.c.id, sort_by_parameter_order=True), params=rows).scalars().all()
+        update_expenses_balances(session, {expense_id: NO_SHARES for expense_id in ids})
+        session.commit()
+        for index, expense_id in zip(pending.values(), ids):
+            results[index] = created(index, expense_id)
+
+    return results
 
 
 @router.get("/{expense_id}",
-         responses={200: {"model": Expense}, 404: {"model": Message}})
-def get_expense(expense_id: int, session: Session = Depends(get_session)) -> Expense: 
-    results = session.exec(select(Expense).where(Expense.id == expense_id))
-    expense = results.first()
+         responses={200: {"model": ExpensePublic}, 404: {"model": Message}})
+def get_expense(expense_id: int, session: Session = Depends(get_session)) -> ExpensePublic: 
+    if read_model.enabled:
+        expense = read_model.expenses.get(expense_id)
+    else:
+        expense = session.exec(select(Expense).where(Expense.id == expense_id)).first()
     if expense is not None:
-        expense.credit_balance = get_credit_balance(expense_id, session)
-        return expense
+        return ExpensePublic.from_expense(expense)
     else:
         raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' not found")
 
 
 @router.get("/",
-         responses={200: {"model": list[Expense]}, 404: {"model": Message}})
-def get_expenses(session: Session = Depends(get_session)) -> list[Expense]:
-    expenses = session.exec(select(Expense)).all()
-    for expense in expenses:
-        expense.credit_balance = get_credit_balance(expense.id, session)
-        expense.num_friends = get_num_friends(expense.id, session)
-    return expenses
+         responses={200: {"model": list[ExpensePublic]}, 404: {"model": Message}})
+def get_expenses(search: Optional[str] = None,
+                 date_from: Optional[date] = None,
+                 date_to: Optional[date] = None,
+                 after: Optional[int] = None,
+                 limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 session: Session = Depends(get_session)) -> list[ExpensePublic]:
+    query = select(Expense)
+    if search:
+        query = query.where(Expense.description.contains(search, autoescape=True))
+    if date_from is not None:
+        query = query.where(Expense.date >= date_from)
+    if date_to is not None:
+        query = query.where(Expense.date <= date_to)
+    expenses = session.exec(paginate(query, Expense.id, after, limit)).all()
+    return [ExpensePublic.from_expense(expense) for expense in expenses]
 
 @router.put("/{expense_id}",
          status_code=204,
-         responses={404: {"model": Message}})
-def update_expense(expense_id: int, expense: Expense, session: Session = Depends(get_session)):
-    if not is_valid_date(expense.date):
-        raise HTTPException(status_code=422, detail=f"Malformed date '{expense.date}' (required format: YYYY-MM-DD)")
-    results = session.exec(select(Expense).where(Expense.id == expense_id))
-    stored_expense = results.first()
-    if stored_expense is not None:
-        stored_expense.description = expense.description
-        stored_expense.date = expense.date
-        stored_expense.amount = expense.amount
-        session.commit()
-        session.refresh(stored_expense)
-    else:
-        raise HTTPException(status_code=404, detail=f"Expense {expense_id} not found")
+         responses={404: {"model": Message}, 409: {"model": Message}})
+def update_expense(expense_id: int, expense: ExpenseCreate, session: Session = Depends(get_session)):
+    bump_version(session, Expense, expense_id, expense.version)
+    # The shares are read after the version bump took the write lock
+    previous_shares = get_expense_shares(session, expense_id)
+    stored_expense = session.get(Expense, expense_id)
+    stored_expense.description = expense.description
+    stored_expense.date = expense.date
+    stored_expense.amount_cents = to_cents(expense.amount)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Expense already exists")
+    update_balances(session, expense_id, previous_shares)
+    session.commit()
     
 @router.delete("/{expense_id}",
          status_code=204,
@@ -94,7 +146,10 @@ def delete_expense(expense_id: int, session: Session = Depends(get_session)):
     results = session.exec(select(Expense).where(Expense.id == expense_id))
     stored_expense = results.first()
     if stored_expense is not None:
+        previous_shares = get_expense_shares(session, expense_id)
         session.delete(stored_expense)
+        session.flush()
+        update_balances(session, expense_id, previous_shares)
         session.commit()  
     else:
         raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' not found")
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from typing import Literal
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from persistence.database import engine
+from persistence.models import Friend, Expense, FriendExpenseLink
+from persistence.money import from_cents
+from sqlmodel import select
+
+
+router = APIRouter(
+    prefix = "/export",
+    tags=["export"]
+)
+
+# Rows are fetched from the cursor and sent in batches of this size
+BATCH_SIZE = 1000
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_rows(query, format: str):
+    # The generator runs after the handler returns, so it owns its connection
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(query)
+        columns = list(result.keys())
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.partitions():
+                writer.writerows(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            # Header only when there are no rows
+            yield buffer.getvalue()
+        else:
+            for batch in result.partitions():
+                # Dates are written as YYYY-MM-DD
+                yield "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in batch)
+
+
+def export_response(query, format: str, name: str) -> StreamingResponse:
+    extension = "jsonl" if format == "ndjson" else format
+    return StreamingResponse(stream_rows(query, format),
+                             media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'})
+
+
+# Amounts are converted to the decimals of the API by SQLite, with the same
+# from_cents() the models use
+
+@router.get("/friends", summary="Export Friends with their balances")
+def export_friends(format: Literal["ndjson", "csv"] = "ndjson") -> StreamingResponse:
+    query = select(Friend.id, Friend.name,
+                   from_cents(Friend.credit_balance_cents).label("credit_balance"),
+                   from_cents(Friend.debit_balance_cents).label("debit_balance")).order_by(Friend.id)
+    return export_response(query, format, "friends")
+
+
+@router.get("/expenses", summary="Export Expenses with their balances")
+def export_expenses(format: Literal["ndjson", "csv"] = "ndjson") -> StreamingResponse:
+    query = select(Expense.id, Expense.description, Expense.date,
+                   from_cents(Expense.amount_cents).label("amount"),
+                   Expense.num_friends,
+                   from_cents(Expense.credit_balance_cents).label("credit_balance")).order_by(Expense.id)
+    return export_response(query, format, "expenses")
+
+
+@router.get("/ledger", summary="Export the balance of every Friend in every Expense")
+def export_ledger(format: Literal["ndjson", "csv"] = "ndjson") -> StreamingResponse:
+    query = (select(FriendExpenseLink.friend_id,
+                    Friend.name,
+                    FriendExpenseLink.expense_id,
+                    Expense.description,
+                    Expense.date,
+                    from_cents(Expense.amount_cents).label("amount"),
+                    Expense.num_friends,
+                    from_cents(FriendExpenseLink.amount_cents).label("credit_balance"),
+                    from_cents(Expense.amount_cents // Expense.num_friends).label("debit_balance"))
+             .join(Friend, Friend.id == FriendExpenseLink.friend_id)
+             .join(Expense, Expense.id == FriendExpenseLink.expense_id)
+             .order_by(FriendExpenseLink.friend_id, FriendExpenseLink.expense_id))
+    return export_response(query, format, "ledger")
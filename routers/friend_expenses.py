@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from persistence.database import get_session
-from persistence.models import Message, Friend, Expense, FriendExpenseLink, Expense
-from sqlmodel import Session, select, func
+from persistence.models import Message, Friend, FriendPublic, Expense, FriendExpenseLink, FriendExpenseLinkPublic, Participant, BulkItemResult
+from persistence.money import to_cents, from_cents, share
+from persistence.balances import get_expense_shares, get_shares, update_balances, update_expenses_balances, add_credit
+from persistence.read_model import read_model
+from routers.bulk import MAX_BULK_ITEMS, created, failed
+from sqlmodel import Session, select, insert, tuple_
+from sqlalchemy.exc import IntegrityError
 
 
 router = APIRouter(
@@ -10,44 +15,101 @@ router = APIRouter(
 )
 
 
+@router.post("/friends/bulk", summary="Add Friends to Expenses",
+          status_code=207,
+          responses={207: {"model": list[BulkItemResult]}, 409: {"model": Message}})
+def add_friends_to_expenses(participants: list[Participant] = Body(max_length=MAX_BULK_ITEMS), session: Session = Depends(get_session)) -> list[BulkItemResult]:
+    results = [None] * len(participants)
+    pending = {}
+    for index, participant in enumerate(participants):
+        key = (participant.expense_id, participant.friend_id)
+        if key in pending:
+            results[index] = failed(index, 409, f"Participant repeats item {pending[key]}")
+        else:
+            pending[key] = index
+
+    # Validate friends, expenses and existing links with one query each
+    existing_friends, existing_expenses, existing_links = set(), set(), set()
+    if pending:
+        existing_friends = set(session.exec(select(Friend.id).where(Friend.id.in_({friend_id for _, friend_id in pending}))).all())
+        existing_expenses = set(session.exec(select(Expense.id).where(Expense.id.in_({expense_id for expense_id, _ in pending}))).all())
+        existing_links = set(session.exec(select(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id)
+                                          .where(tuple_(FriendExpenseLink.expense_id, FriendExpenseLink.friend_id).in_(list(pending)))).all())
+    for (expense_id, friend_id), index in list(pending.items()):
+        if friend_id not in existing_friends:
+            results[index] = failed(index, 404, f"Friend '{friend_id}' not found")
+        elif expense_id not in existing_expenses:
+            results[index] = failed(index, 404, f"Expense '{expense_id}' not found")
+        elif (expense_id, friend_id) in existing_links:
+            results[index] = failed(index, 409, "Friend was previously assigned to expense")
+        else:
+            continue
+        del pending[(expense_id, friend_id)]
+
+    if pending:
+        previous_shares = get_shares(session, {expense_id for expense_id, _ in pending})
+        session.exec(insert(FriendExpenseLink.__table__),
+                     params=[{"expense_id": expense_id, "friend_id": friend_id, "amount_cents": 0} for expense_id, friend_id in pending])
+        update_expenses_balances(session, previous_shares)
+        session.commit()
+        for index in pending.values():
+            results[index] = created(index)
+
+    return results
+
+
 @router.post("/{expense_id}/friends",
           status_code=201,
-          responses={201: {"model": Expense},
+          responses={201: {"model": FriendExpenseLinkPublic},
                      404: {"model": Message}, 
                      409: {"model": Message}})
-def add_friend_to_expense(expense_id: int, friend_id: int, session: Session = Depends(get_session)) -> FriendExpenseLink:
+def add_friend_to_expense(expense_id: int, friend_id: int, session: Session = Depends(get_session)) -> FriendExpenseLinkPublic:
     existing_friend = session.exec(select(Friend).where(Friend.id==friend_id)).first()
     if existing_friend is None:
         raise  HTTPException(status_code=404, detail=f"Friend '{friend_id}' not found")
     existing_expense = session.exec(select(Expense).where(Expense.id==expense_id)).first()
     if existing_expense is None:
          raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' not found")
-    existing_friend_expense = session.exec(select(FriendExpenseLink).where(FriendExpenseLink.expense_id == expense_id).where(FriendExpenseLink.friend_id == friend_id))
-    if existing_friend_expense.first() is None:
-        friend_expense_link = FriendExpenseLink(expense_id=expense_id, friend_id=friend_id)
-        session.add(friend_expense_link)
-        session.commit()
-        session.refresh(friend_expense_link)
-        return friend_expense_link
-    else:
+    previous_shares = get_expense_shares(session, expense_id)
+    friend_expense_link = FriendExpenseLink(expense_id=expense_id, friend_id=friend_id)
+    session.add(friend_expense_link)
+    try:
+        # The primary key of the link rejects a friend already in the expense
+        session.flush()
+    except IntegrityError:
+        session.rollback()
         raise HTTPException(status_code=409, detail="Friend was previously assigned to expense")
+    update_balances(session, expense_id, previous_shares)
+    # Read back before the commit, a concurrent delete may remove the link right after
+    session.refresh(friend_expense_link)
+    link = FriendExpenseLinkPublic.from_link(friend_expense_link)
+    session.commit()
+    return link
 
 
 
 @router.get("/{expense_id}/friends",
-         responses={200: {"model": list[Friend]}, 404: {"model": Message}})
-def get_friends_by_expense(expense_id: int, session: Session = Depends(get_session)) -> list[Friend]:
-    expense = session.exec(select(Expense).where(Expense.id == expense_id)).first()
+         responses={200: {"model": list[FriendPublic]}, 404: {"model": Message}})
+def get_friends_by_expense(expense_id: int, session: Session = Depends(get_session)) -> list[FriendPublic]:
+    if read_model.enabled:
+        expense = read_model.expenses.get(expense_id)
+        friends_by_expense = [(friend_id, friend.name, credit_balance)
+                              for friend_id, credit_balance in read_model.expense_links.get(expense_id, {}).items()
+                              if (friend := read_model.friends.get(friend_id)) is not None]
+    else:
+        expense = session.exec(select(Expense).where(Expense.id == expense_id)).first()
+        friends_by_expense = session.exec(select(Friend.id, Friend.name, FriendExpenseLink.amount_cents)
+                                          .join(FriendExpenseLink, FriendExpenseLink.friend_id == Friend.id)
+                                          .where(FriendExpenseLink.expense_id == expense_id)).all() if expense is not None else []
     if expense is not None:
-        friends_by_expense = expense.friend_links
         friends = []
-        debit_per_friend = expense.amount / (len(friends_by_expense)+1)
+        debit_per_friend = from_cents(share(expense.amount_cents, expense.num_friends))
 
-        for friend_by_expense in friends_by_expense:
-            friend = friend_by_expense.friend
-            friend.credit_balance = friend_by_expense.amount
-            friend.debit_balance = debit_per_friend
-            friends.append(friend)
+        # Balances relative to this expense, not the stored totals of the friend
+        for friend_id, name, credit_balance in friends_by_expense:
+            friends.append(FriendPublic(id=friend_id, name=name,
+                                        credit_balance=from_cents(credit_balance),
+                                        debit_balance=debit_per_friend))
     
         return friends
     else:
@@ -55,15 +117,23 @@ def get_friends_by_expense(expense_id: int, session: Session = Depends(get_sessi
 
 
 @router.get("/{expense_id}/friends/{friend_id}", summary="Get Friend info by Expense",
-         responses={200: {"model": Friend}, 404: {"model": Message}})
-def get_expenses(expense_id: int, friend_id: int, session: Session = Depends(get_session)) -> Friend:
+         responses={200: {"model": FriendPublic}, 404: {"model": Message}})
+def get_expenses(expense_id: int, friend_id: int, session: Session = Depends(get_session)) -> FriendPublic:
+    if read_model.enabled:
+        credit_balance = read_model.expense_links.get(expense_id, {}).get(friend_id)
+        expense = read_model.expenses.get(expense_id)
+        friend = read_model.friends.get(friend_id)
+        if credit_balance is not None and expense is not None and friend is not None:
+            return FriendPublic(id=friend_id, name=friend.name,
+                                credit_balance=from_cents(credit_balance),
+                                debit_balance=from_cents(share(expense.amount_cents, expense.num_friends)))
+        raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' for friend '{friend_id}' not found")
     friend_by_expense = session.exec(select(FriendExpenseLink).where(FriendExpenseLink.expense_id == expense_id).where(FriendExpenseLink.friend_id == friend_id)).first()
     if friend_by_expense is not None:
         expense = friend_by_expense.expense
-        debit_per_friend = expense.amount / (len(expense.friend_links)+1)
-        friend = friend_by_expense.friend
-        friend.credit_balance = friend_by_expense.amount
-        friend.debit_balance = debit_per_friend
+        friend = FriendPublic(id=friend_id, name=friend_by_expense.friend.name,
+                              credit_balance=from_cents(friend_by_expense.amount_cents),
+                              debit_balance=from_cents(share(expense.amount_cents, expense.num_friends)))
         
         return friend
     else:
@@ -72,13 +142,10 @@ def get_expenses(expense_id: int, friend_id: int, session: Session = Depends(get
 @router.put("/{expense_id}/friends/{friend_id}", summary="Update Friend's credit in Expense",
          status_code=204,
          responses={404: {"model": Message}})
-def update_expense(expense_id: int, friend_id: int, amount: float, session: Session = Depends(get_session)):
-    friend_by_expense = session.exec(select(FriendExpenseLink).where(FriendExpenseLink.expense_id == expense_id).where(FriendExpenseLink.friend_id == friend_id)).first()
-
-    if friend_by_expense is not None:
-        friend_by_expense.amount += amount
+def update_expense(expense_id: int, friend_id: int, amount: float = Query(allow_inf_nan=False), session: Session = Depends(get_session)):
+    credit = add_credit(session, expense_id, friend_id, to_cents(amount))
+    if credit is not None:
         session.commit()
-        session.refresh(friend_by_expense)
     else:
         raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' for friend '{friend_id}' not found")
     
@@ -89,8 +156,11 @@ def update_expense(expense_id: int, friend_id: int, amount: float, session: Sess
 def delete_expense(expense_id: int, friend_id: int, session: Session = Depends(get_session)):
     friend_by_expense = session.exec(select(FriendExpenseLink).where(FriendExpenseLink.expense_id == expense_id).where(FriendExpenseLink.friend_id == friend_id)).first()
     if friend_by_expense is not None:
-        if friend_by_expense.amount == 0:
+        if friend_by_expense.amount_cents == 0:
+            previous_shares = get_expense_shares(session, expense_id)
             session.delete(friend_by_expense)
+            session.flush()
+            update_balances(session, expense_id, previous_shares)
             session.commit()  
         else:
             raise HTTPException(status_code=409, detail=f"Credit balance of friend '{friend_id}' in expense '{expense_id}' is not zero")
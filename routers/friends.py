@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from persistence.database import get_session
-from persistence.models import Message, Friend, FriendExpenseLink, FriendExpense
-from sqlmodel import Session, select, func
+from persistence.models import Message, Friend, FriendCreate, FriendPublic, FriendExpenseLink, FriendExpense, BulkItemResult
+from persistence.money import from_cents, share
+from persistence.balances import get_friend_expenses, get_shares, update_expenses_balances
+from persistence.read_model import read_model, touch
+from routers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from routers.bulk import MAX_BULK_ITEMS, created, failed
+from routers.versioning import bump_version
+from sqlmodel import Session, select, insert
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
 
 
 router = APIRouter(
@@ -12,46 +20,69 @@ router = APIRouter(
 
 @router.post("/",
           status_code=201,
-          responses={201: {"model": Friend}, 409: {"model": Message}})
-def add_friend(friend: Friend, session: Session = Depends(get_session)) -> Friend:
-    existing_friend = session.exec(select(Friend).where(Friend.id == friend.id))
-    if existing_friend.first() is None:
-        session.add(friend)
-        session.commit()
-        session.refresh(friend)
-        return friend
-    else:
+          responses={201: {"model": FriendPublic}, 409: {"model": Message}})
+def add_friend(friend: FriendCreate, session: Session = Depends(get_session)) -> FriendPublic:
+    # Balances are maintained by the server
+    new_friend = Friend(id=friend.id, name=friend.name)
+    session.add(new_friend)
+    try:
+        # The primary key rejects an explicit id that is already taken
+        session.flush()
+    except IntegrityError:
+        session.rollback()
         raise HTTPException(status_code=409, detail="Friend already exists")
+    # Read back before the commit, a concurrent delete may remove the friend right after
+    session.refresh(new_friend)
+    public_friend = FriendPublic.from_friend(new_friend)
+    session.commit()
+    return public_friend
 
 
-def get_credit_balance(friend_id: int, session: Session) -> float:
-    # Sum all the contributions of the friend
-    credit_balance = session.exec(select(func.sum(FriendExpenseLink.amount)).where(FriendExpenseLink.friend_id == friend_id)).first()
-    if credit_balance is None:
-        credit_balance = 0
-    return credit_balance
-
-def get_debit_balance(friend_id: int, session: Session) -> float:
-    # Get all the expenses this friend has 
-    expense_links = session.exec(select(FriendExpenseLink).where(FriendExpenseLink.friend_id == friend_id)).all()
-    debit_balance = 0
-    for expense_link in expense_links:
-        # Get the amount of each expense
-        total_amount = expense_link.expense.amount
-        # and the number of friends involved plus the user himself/herself
-        num_friends = len(expense_link.expense.friend_links) + 1
-        debit_balance += total_amount / num_friends
-    return debit_balance
+@router.post("/bulk",
+          status_code=207,
+          responses={207: {"model": list[BulkItemResult]}, 409: {"model": Message}})
+def add_friends(friends: list[FriendCreate] = Body(max_length=MAX_BULK_ITEMS), session: Session = Depends(get_session)) -> list[BulkItemResult]:
+    results = [None] * len(friends)
+    # Indexes of the friends still to create, in request order
+    pending = {}
+    requested_ids = {}
+    for index, friend in enumerate(friends):
+        if friend.id is not None and friend.id in requested_ids:
+            results[index] = failed(index, 409, f"Friend repeats item {requested_ids[friend.id]}")
+        else:
+            if friend.id is not None:
+                requested_ids[friend.id] = index
+            pending[index] = friend
+
+    # Check the explicit ids against the stored friends at once
+    if requested_ids:
+        for friend_id in session.exec(select(Friend.id).where(Friend.id.in_(list(requested_ids)))).all():
+            index = requested_ids[friend_id]
+            results[index] = failed(index, 409, "Friend already exists")
+            del pending[index]
+
+    if pending:
+        rows = [{"id": friend.id, "name": friend.name,
+                 "credit_balance_cents": 0, "debit_balance_cents": 0} for friend in pending.values()]
+        table = Friend.__table__
+        ids = session.exec(insert(table).returning(table.c.id, sort_by_parameter_order=True), params=rows).scalars().all()
+        touch(session, friend_ids=ids)
+        session.commit()
+        for index, friend_id in zip(pending, ids):
+            results[index] = created(index, friend_id)
+
+    return results
+
 
 @router.get("/{friend_id}",
-         responses={200: {"model": Friend}, 404: {"model": Message}})
-def get_friend(friend_id: int, session: Session = Depends(get_session)) -> Friend:
-    results = session.exec(select(Friend).where(Friend.id == friend_id))
-    friend = results.first()
+         responses={200: {"model": FriendPublic}, 404: {"model": Message}})
+def get_friend(friend_id: int, session: Session = Depends(get_session)) -> FriendPublic:
+    if read_model.enabled:
+        friend = read_model.friends.get(friend_id)
+    else:
+        friend = session.exec(select(Friend).where(Friend.id == friend_id)).first()
     if friend is not None:
-        friend.credit_balance = get_credit_balance(friend_id, session)
-        friend.debit_balance = get_debit_balance(friend_id, session)
-        return friend
+        return FriendPublic.from_friend(friend)
     else:
         raise HTTPException(status_code=404, detail=f"Friend '{friend_id}' not found")
 
@@ -59,18 +90,23 @@ def get_friend(friend_id: int, session: Session = Depends(get_session)) -> Frien
 @router.get("/{friend_id}/expenses", summary="Get Expenses by Friend",
          responses={200: {"model": FriendExpense}, 404: {"model": Message}})
 def get_friend(friend_id: int, session: Session = Depends(get_session)) -> list[FriendExpense]:
-    friend = session.exec(select(Friend).where(Friend.id == friend_id)).first()
+    if read_model.enabled:
+        friend = read_model.friends.get(friend_id)
+        expenses = [(expense, credit_balance)
+                    for expense_id, credit_balance in read_model.friend_links.get(friend_id, {}).items()
+                    if (expense := read_model.expenses.get(expense_id)) is not None]
+    else:
+        friend = session.exec(select(Friend).where(Friend.id == friend_id)).first()
+        expenses = get_friend_expenses(session, friend_id) if friend is not None else []
     if friend is not None:
         friend_expenses = []
-        for friend_expense_link in friend.expense_links:
-            expense = friend_expense_link.expense
-            num_friends = len(expense.friend_links)
+        for expense, credit_balance in expenses:
             friend_expenses.append(FriendExpense(id=expense.id, 
                                                  description=expense.description,
-                                                 amount=expense.amount,
-                                                 num_friends=num_friends + 1,
-                                                 credit_balance=friend_expense_link.amount,
-                                                 debit_balance=expense.amount/(num_friends+1)))
+                                                 amount=from_cents(expense.amount_cents),
+                                                 num_friends=expense.num_friends,
+                                                 credit_balance=from_cents(credit_balance),
+                                                 debit_balance=from_cents(share(expense.amount_cents, expense.num_friends))))
         
         return friend_expenses
     else:
@@ -78,26 +114,23 @@ def get_friend(friend_id: int, session: Session = Depends(get_session)) -> list[
 
 
 @router.get("/",
-         responses={200: {"model": list[Friend]}, 404: {"model": Message}})
-def get_friends(session: Session = Depends(get_session)) -> list:
-    friends = session.exec(select(Friend)).all()
-    for friend in friends:
-        friend.credit_balance = get_credit_balance(friend.id, session)
-        friend.debit_balance = get_debit_balance(friend.id, session)
-    return friends
+         responses={200: {"model": list[FriendPublic]}, 404: {"model": Message}})
+def get_friends(search: Optional[str] = None,
+                after: Optional[int] = None,
+                limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                session: Session = Depends(get_session)) -> list[FriendPublic]:
+    query = select(Friend)
+    if search:
+        query = query.where(Friend.name.contains(search, autoescape=True))
+    friends = session.exec(paginate(query, Friend.id, after, limit)).all()
+    return [FriendPublic.from_friend(friend) for friend in friends]
 
 @router.put("/{friend_id}",
          status_code=204,
-         responses={404: {"model": Message}})
-def update_friend(friend_id: int, friend: Friend, session: Session = Depends(get_session)):
-    results = session.exec(select(Friend).where(Friend.id == friend_id))
-    stored_friend = results.first()
-    if stored_friend is not None:
-        stored_friend.name = friend.name
-        session.commit()
-        session.refresh(stored_friend)
-    else:
-        raise HTTPException(status_code=404, detail=f"Friend '{friend_id}' not found")
+         responses={404: {"model": Message}, 409: {"model": Message}})
+def update_friend(friend_id: int, friend: FriendCreate, session: Session = Depends(get_session)):
+    bump_version(session, Friend, friend_id, friend.version, name=friend.name)
+    session.commit()
     
 @router.delete("/{friend_id}",
          status_code=204,
@@ -107,9 +140,13 @@ def delete_friend(friend_id: int, session: Session = Depends(get_session)):
     results = session.exec(select(Friend).where(Friend.id == friend_id))
     stored_friend = results.first()
     if stored_friend is not None:
-        credit_balance = get_credit_balance(friend_id, session)
-        if credit_balance == 0:
+        if stored_friend.credit_balance_cents == 0:
+            # Removing the friend resizes every expense they shared
+            expense_ids = session.exec(select(FriendExpenseLink.expense_id).where(FriendExpenseLink.friend_id == friend_id)).all()
+            previous_shares = get_shares(session, expense_ids)
             session.delete(stored_friend)
+            session.flush()
+            update_expenses_balances(session, previous_shares)
             session.commit()
         else:
             raise HTTPException(status_code=409, detail=f"Credit balance of '{friend_id}' is not zero")
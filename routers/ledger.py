@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from persistence.database import get_session
+from persistence.models import Message, Friend, Expense, Payment, PaymentPublic, FriendExpenseLinkPublic, LedgerBalance
+from persistence.money import from_cents
+from persistence import ledger
+from routers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from sqlmodel import Session, select
+
+
+router = APIRouter(
+    prefix = "/ledger",
+    tags=["ledger"]
+)
+
+
+def as_utc(as_of: Optional[datetime]) -> Optional[datetime]:
+    # Ledger timestamps are UTC, as given by the database clock: naive dates are
+    # taken as UTC and the rest converted, since SQLite drops the offset
+    if as_of is None:
+        return None
+    if as_of.tzinfo is None:
+        return as_of.replace(tzinfo=timezone.utc)
+    return as_of.astimezone(timezone.utc)
+
+
+def get_balance(session: Session, as_of: Optional[datetime], **filters) -> LedgerBalance:
+    as_of = as_utc(as_of)
+    credits = ledger.get_credits(session, as_of, **filters)
+    links = [FriendExpenseLinkPublic(friend_id=friend_id, expense_id=expense_id, amount=from_cents(amount))
+             for (expense_id, friend_id), amount in sorted(credits.items())]
+    return LedgerBalance(as_of=as_of, credit_balance=from_cents(sum(credits.values())), links=links)
+
+
+@router.get("/", summary="Get Payments",
+         responses={200: {"model": list[PaymentPublic]}})
+def get_payments(expense_id: Optional[int] = None,
+                 friend_id: Optional[int] = None,
+                 after: Optional[int] = None,
+                 limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 session: Session = Depends(get_session)) -> list[PaymentPublic]:
+    query = select(Payment)
+    if expense_id is not None:
+        query = query.where(Payment.expense_id == expense_id)
+    if friend_id is not None:
+        query = query.where(Payment.friend_id == friend_id)
+    payments = session.exec(paginate(query, Payment.id, after, limit)).all()
+    return [PaymentPublic.from_payment(payment) for payment in payments]
+
+
+@router.get("/friends/{friend_id}", summary="Get Friend credit from the ledger",
+         responses={200: {"model": LedgerBalance}, 404: {"model": Message}})
+def get_friend_balance(friend_id: int, as_of: Optional[datetime] = None, session: Session = Depends(get_session)) -> LedgerBalance:
+    balance = get_balance(session, as_of, friend_id=friend_id)
+    # Friends deleted since then still have their history
+    if not balance.links and session.get(Friend, friend_id) is None:
+        raise HTTPException(status_code=404, detail=f"Friend '{friend_id}' not found")
+    return balance
+
+
+@router.get("/expenses/{expense_id}", summary="Get Expense credit from the ledger",
+         responses={200: {"model": LedgerBalance}, 404: {"model": Message}})
+def get_expense_balance(expense_id: int, as_of: Optional[datetime] = None, session: Session = Depends(get_session)) -> LedgerBalance:
+    balance = get_balance(session, as_of, expense_id=expense_id)
+    if not balance.links and session.get(Expense, expense_id) is None:
+        raise HTTPException(status_code=404, detail=f"Expense '{expense_id}' not found")
+    return balance
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from persistence.database import engine, async_engine
+from middleware.metrics import metrics
+
+
+router = APIRouter(
+    tags=["metrics"]
+)
+
+
+# Runs on the event loop, where the middleware updates the metrics
+@router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    pools = {"sync": engine.pool}
+    if async_engine is not None:
+        pools["async"] = async_engine.sync_engine.pool
+    return PlainTextResponse(metrics.render(pools), media_type="text/plain; version=0.0.4")
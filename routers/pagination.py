@@ -0,0 +1,9 @@
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def paginate(query, key, after, limit):
+    # Keyset pagination: rows sorted by key, starting right after the last key of the previous page
+    if after is not None:
+        query = query.where(key > after)
+    return query.order_by(key).limit(limit)
@@ -0,0 +1,65 @@
+import heapq
+from itertools import count
+from typing import Hashable
+from fastapi import APIRouter, Depends
+from persistence.database import get_session
+from persistence.models import Friend, Transfer
+from persistence.money import from_cents
+from sqlmodel import Session, select
+
+
+router = APIRouter(
+    prefix = "/settlements",
+    tags=["settlements"]
+)
+
+ME = None
+ME_NAME = "You"
+
+
+def settle(balances: dict[Hashable, int]) -> list[tuple[Hashable, Hashable, int]]:
+    # Greedy minimum cash flow over net balances in cents (positive: is owed money,
+    # negative: owes money). The largest debtor always pays the largest creditor,
+    # so every transfer clears at least one of them and there are at most n - 1.
+    # The sequence number breaks ties between equal balances, so keys (ME is
+    # None) are never compared
+    seq = count()
+    creditors = [(-balance, next(seq), key) for key, balance in balances.items() if balance > 0]
+    debtors = [(balance, next(seq), key) for key, balance in balances.items() if balance < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, _, creditor = heapq.heappop(creditors)
+        debt, _, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, next(seq), creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, next(seq), debtor))
+    return transfers
+
+
+def get_net_balances(session: Session) -> tuple[dict, dict]:
+    # Net balance of every friend from the stored cents in one pass;
+    # the user paid the expenses, so he/she is owed whatever the friends owe
+    names = {ME: ME_NAME}
+    balances = {}
+    for friend_id, name, credit_balance, debit_balance in session.exec(
+            select(Friend.id, Friend.name, Friend.credit_balance_cents, Friend.debit_balance_cents)):
+        names[friend_id] = name
+        balances[friend_id] = credit_balance - debit_balance
+    balances[ME] = -sum(balances.values())
+    return balances, names
+
+
+@router.get("/", summary="Transfers that settle every balance",
+         responses={200: {"model": list[Transfer]}})
+def get_settlements(session: Session = Depends(get_session)) -> list[Transfer]:
+    balances, names = get_net_balances(session)
+    return [Transfer(from_id=payer, from_name=names[payer],
+                     to_id=payee, to_name=names[payee],
+                     amount=from_cents(amount))
+            for payer, payee, amount in settle(balances)]
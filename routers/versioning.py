@@ -0,0 +1,27 @@
+from typing import Optional
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from persistence.models import Friend
+from persistence.read_model import touch
+
+
+def bump_version(session: Session, model, id: int, expected: Optional[int], **values) -> int:
+    # Conditional UPDATE that sets the values and bumps the version of the row,
+    # only if it is still at the expected version (any version if None). Being
+    # the first write of the transaction, it also takes the write lock before
+    # the handler reads anything else from the row.
+    table = model.__table__
+    query = table.update().where(table.c.id == id)
+    if expected is not None:
+        query = query.where(table.c.version == expected)
+    version = session.exec(query.values(**values, version=table.c.version + 1).returning(table.c.version)).scalar()
+    if version is None:
+        if session.get(model, id) is None:
+            raise HTTPException(status_code=404, detail=f"{model.__name__} '{id}' not found")
+        raise HTTPException(status_code=409, detail=f"{model.__name__} '{id}' was modified concurrently (expected version {expected})")
+    if model is Friend:
+        touch(session, friend_ids=[id])
+    else:
+        touch(session, expense_ids=[id])
+    return version
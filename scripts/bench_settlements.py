@@ -0,0 +1,67 @@
+"""
+Benchmark del cálculo de liquidaciones (routers/settlements.py).
+
+Genera en memoria gastos aleatorios repartidos entre amigos, calcula el
+balance neto de cada uno y mide cuánto tarda settle() en obtener las
+transferencias, para varios números de amigos y de gastos.
+
+Uso:
+    python scripts/bench_settlements.py
+    python scripts/bench_settlements.py --friends 1000 10000 50000 --expenses 10000 100000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routers.settlements import ME, settle
+
+
+def make_balances(num_friends: int, num_expenses: int, max_friends_per_expense: int, rng: random.Random) -> dict:
+    # Mismo reparto que el servidor: cada gasto se divide entre sus amigos y el usuario
+    balances = dict.fromkeys(range(num_friends), 0)
+    for _ in range(num_expenses):
+        amount = rng.randint(100, 100000)
+        friends = rng.sample(range(num_friends), rng.randint(1, min(max_friends_per_expense, num_friends)))
+        share = amount // (len(friends) + 1)
+        for friend in friends:
+            paid = rng.choice((0, share))
+            balances[friend] += paid - share
+    balances[ME] = -sum(balances.values())
+    return balances
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de settle()")
+    parser.add_argument("--friends", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--expenses", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--max-friends-per-expense", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'amigos':>8} {'gastos':>8} {'deudores':>9} {'transfer.':>9} {'balances (s)':>13} {'settle (s)':>11}")
+    for num_expenses in args.expenses:
+        for num_friends in args.friends:
+            rng = random.Random(args.seed)
+            started = time.perf_counter()
+            balances = make_balances(num_friends, num_expenses, args.max_friends_per_expense, rng)
+            built = time.perf_counter()
+            debtors = sum(1 for balance in balances.values() if balance < 0)
+            transfers = settle(balances)
+            settled = time.perf_counter()
+
+            # Comprobación: después de las transferencias todos quedan a cero
+            for payer, payee, amount in transfers:
+                balances[payer] += amount
+                balances[payee] -= amount
+            assert not any(balances.values())
+
+            print(f"{num_friends:>8} {num_expenses:>8} {debtors:>9} {len(transfers):>9} "
+                  f"{built - started:>13.3f} {settled - built:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Genera datos deterministas a gran escala directamente en la base de datos.
+
+Con los mismos argumentos sobre una base de datos vacía siempre se obtienen las
+mismas filas, así que sirve para preparar bases de datos de pruebas de carga.
+La base de datos es la de DB_URL (por defecto expenses.db).
+
+Uso:
+    python scripts/generate_data.py --friends 100000 --expenses 1000000
+    DB_URL=sqlite:///carga.db python scripts/generate_data.py --expenses 5000000 --distribution 1:2,2:3,8:1 --seed 7
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from persistence.database import engine
+from persistence.fixtures import DEFAULT_DISTRIBUTION, PAID_RATIO, generate_data
+from persistence.utils import create_db_and_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera amigos, gastos y participaciones deterministas")
+    parser.add_argument("--friends", type=int, default=10000)
+    parser.add_argument("--expenses", type=int, default=100000)
+    parser.add_argument("--distribution", default=DEFAULT_DISTRIBUTION, help="amigos por gasto, como tamaño:peso,...")
+    parser.add_argument("--paid-ratio", type=float, default=PAID_RATIO, help="proporción de amigos que ya han pagado")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    started = time.perf_counter()
+
+    def print_progress(generated):
+        print(f"\r{generated.expenses} gastos, {generated.links} participaciones "
+              f"({generated.expenses / (time.perf_counter() - started):.0f} gastos/s)", end="", flush=True)
+
+    generated = generate_data(engine, args.friends, args.expenses, args.distribution, args.seed,
+                              args.paid_ratio, print_progress)
+    print()
+    print(f"Generados {generated.friends} amigos, {generated.expenses} gastos y {generated.links} "
+          f"participaciones en {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Importa gastos históricos desde CSV o JSONL directamente en la base de datos.
+
+Uso:
+    python scripts/import_expenses.py gastos.csv
+    python scripts/import_expenses.py gastos.jsonl --chunk-size 5000
+
+El formato se deduce de la extensión (.csv, .jsonl, .ndjson) o se indica con
+--format. Ver persistence/importer.py para el formato de cada registro.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session
+
+from persistence.database import write_engine
+from persistence.importer import CHUNK_SIZE, FORMATS, read_records, import_expenses
+from persistence.utils import create_db_and_tables
+
+SUFFIXES = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+def print_progress(progress):
+    print(f"\r{progress.rows} filas, {progress.expenses} gastos, {progress.skipped} omitidas "
+          f"({progress.rows_per_second:.0f} filas/s)", end="", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa gastos desde CSV o JSONL")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or SUFFIXES.get(args.path.suffix.lower())
+    if format is None:
+        parser.error("no se puede deducir el formato, usa --format")
+
+    create_db_and_tables()
+    with args.path.open(encoding="utf-8", errors="surrogateescape", newline="") as stream, Session(write_engine) as session:
+        progress = import_expenses(session, read_records(stream, format), args.chunk_size, print_progress)
+    print()
+    for error in progress.errors:
+        print(error)
+    print(f"Importadas {progress.rows} filas en {progress.seconds:.2f}s: {progress.expenses} gastos, "
+          f"{progress.friends} amigos nuevos, {progress.skipped} omitidas")
+
+
+if __name__ == "__main__":
+    main()
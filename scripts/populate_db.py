@@ -12,7 +12,7 @@ import httpx
 from pathlib import Path
 
 API_BASE = os.getenv("API_BASE_URL", "http://127.0.0.1:8000")
-FIXTURES = Path(__file__).parent / "fixtures" / "demo_data.json"
+FIXTURES = Path(__file__).parent / "demo_data.json"
 
 def try_post_fixtures():
     data = json.loads(FIXTURES.read_text(encoding="utf-8"))
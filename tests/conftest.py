@@ -0,0 +1,46 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# The engine is built when persistence.database is imported, so the test
+# database has to be configured before anything imports it
+os.environ["DB_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("DB_COMPACTION_INTERVAL_S", "0")
+
+from fastapi.testclient import TestClient
+
+from main import app
+from persistence.database import engine
+
+
+@pytest.fixture(scope="session")
+def client():
+    # The lifespan migrates the database and loads the demo data
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def db_engine(client):
+    return engine
+
+
+@pytest.fixture
+def make_expense(client):
+    # Creates an expense shared with new friends, each one with the given credit
+    def make(amount: float = 30.0, credits: tuple = (), date: str = "2024-06-01") -> dict:
+        expense = client.post("/expenses/", json={"description": f"Test {uuid.uuid4()}", "date": date, "amount": amount})
+        assert expense.status_code == 201
+        expense = expense.json()
+        friend_ids = []
+        for credit in credits:
+            friend = client.post("/friends/", json={"name": f"Test {uuid.uuid4()}"}).json()
+            assert client.post(f"/expenses/{expense['id']}/friends", params={"friend_id": friend["id"]}).status_code == 201
+            if credit:
+                assert client.put(f"/expenses/{expense['id']}/friends/{friend['id']}", params={"amount": credit}).status_code < 300
+            friend_ids.append(friend["id"])
+        return {**expense, "friend_ids": friend_ids}
+
+    return make
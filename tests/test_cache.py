@@ -0,0 +1,20 @@
+from persistence.database import write_engine
+from persistence.ledger import compact_engine
+
+
+def test_etag_only_validates_its_own_request(client):
+    etag = client.get("/friends/").headers["etag"]
+
+    assert client.get("/friends/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/expenses/", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/friends/", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_compaction_keeps_cached_responses(client, make_expense):
+    expense = make_expense(credits=(5.0,))
+    etag = client.get(f"/expenses/{expense['id']}").headers["etag"]
+
+    assert compact_engine(write_engine) is not None
+    assert compact_engine(write_engine) is None
+
+    assert client.get(f"/expenses/{expense['id']}", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,48 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_concurrently(requests: list) -> list[int]:
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return [response.status_code for response in executor.map(lambda request: request(), requests)]
+
+
+def test_concurrent_writes_wait_for_the_write_lock(client, make_expense):
+    # Writers that read first must queue on busy_timeout instead of failing
+    # when another request commits between their read and their write
+    expenses = [make_expense() for _ in range(16)]
+    friends = [client.post("/friends/", json={"name": f"Test {uuid.uuid4()}"}).json() for _ in range(16)]
+
+    requests = []
+    for expense, friend in zip(expenses, friends):
+        requests.append(lambda: client.post("/friends/", json={"name": f"Test {uuid.uuid4()}"}))
+        requests.append(lambda expense=expense, friend=friend:
+                        client.post(f"/expenses/{expense['id']}/friends", params={"friend_id": friend["id"]}))
+        requests.append(lambda expense=expense: client.delete(f"/expenses/{expense['id']}"))
+    statuses = run_concurrently(requests)
+
+    assert all(status < 500 for status in statuses), statuses
+    assert statuses.count(201) >= len(friends)
+
+
+def test_concurrent_duplicate_links(client, make_expense):
+    expense = make_expense()
+    friend = client.post("/friends/", json={"name": f"Test {uuid.uuid4()}"}).json()
+
+    statuses = run_concurrently([
+        lambda: client.post(f"/expenses/{expense['id']}/friends", params={"friend_id": friend["id"]})
+        for _ in range(16)])
+
+    assert sorted(set(statuses)) == [201, 409]
+    assert statuses.count(201) == 1
+
+
+def test_concurrent_friends_with_the_same_id(client):
+    friend_id = client.post("/friends/", json={"name": f"Test {uuid.uuid4()}"}).json()["id"] + 1000
+
+    statuses = run_concurrently([
+        lambda: client.post("/friends/", json={"id": friend_id, "name": f"Test {uuid.uuid4()}"})
+        for _ in range(16)])
+
+    assert sorted(set(statuses)) == [201, 409]
+    assert statuses.count(201) == 1
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from persistence.models import Expense
+
+
+def test_create_duplicate_expense(client):
+    expense = {"description": "Duplicate", "date": "2024-04-01", "amount": 10}
+    assert client.post("/expenses/", json=expense).status_code == 201
+    assert client.post("/expenses/", json=expense).status_code == 409
+
+
+def test_create_concurrent_duplicate_expenses(client):
+    expense = {"description": "Concurrent duplicate", "date": "2024-04-02", "amount": 10}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(lambda _: client.post("/expenses/", json=expense).status_code, range(16)))
+    assert sorted(set(statuses)) == [201, 409]
+    assert statuses.count(201) == 1
+
+
+def test_unique_index_rejects_duplicate_expenses(db_engine):
+    # The index is what answers 409 when the check of POST /expenses/ is raced
+    with Session(db_engine) as session:
+        for _ in range(2):
+            session.add(Expense(description="Unique index", date=date(2024, 4, 3), amount_cents=100))
+        with pytest.raises(IntegrityError):
+            session.commit()
+
+
+def test_bulk_expenses_keep_explicit_ids(client):
+    taken = client.post("/expenses/", json={"description": "Bulk taken", "date": "2024-04-03", "amount": 10}).json()["id"]
+    free = taken + 1000
+    results = client.post("/expenses/bulk", json=[
+        {"id": free, "description": "Bulk explicit", "date": "2024-04-03", "amount": 10},
+        {"id": free, "description": "Bulk repeated id", "date": "2024-04-03", "amount": 10},
+        {"id": taken, "description": "Bulk stored id", "date": "2024-04-03", "amount": 10},
+        {"description": "Bulk generated", "date": "2024-04-03", "amount": 10},
+    ]).json()
+
+    assert [result["status"] for result in results] == [201, 409, 409, 201]
+    assert results[0]["id"] == free
+    assert client.get(f"/expenses/{free}").json()["description"] == "Bulk explicit"
+    assert client.get(f"/expenses/{taken}").json()["description"] == "Bulk taken"
@@ -0,0 +1,18 @@
+import csv
+import io
+import json
+
+
+def test_export_ledger_amounts(client, make_expense):
+    expense = make_expense(10.01, credits=(2.5, 0))
+    response = client.get("/export/ledger")
+    assert response.status_code == 200
+    rows = [row for row in map(json.loads, response.text.splitlines()) if row["expense_id"] == expense["id"]]
+    assert [(row["amount"], row["credit_balance"], row["debit_balance"]) for row in rows] == [(10.01, 2.5, 3.33), (10.01, 0.0, 3.33)]
+
+
+def test_export_expenses_csv(client, make_expense):
+    expense = make_expense(0.07)
+    response = client.get("/export/expenses", params={"format": "csv"})
+    rows = {row["id"]: row for row in csv.DictReader(io.StringIO(response.text))}
+    assert float(rows[str(expense["id"])]["amount"]) == 0.07
@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_update_credit_answers_no_content(client, make_expense):
+    expense = make_expense(credits=(0,))
+    friend_id = expense["friend_ids"][0]
+    response = client.put(f"/expenses/{expense['id']}/friends/{friend_id}", params={"amount": 2.5})
+    assert (response.status_code, response.content) == (204, b"")
+    assert client.get(f"/expenses/{expense['id']}/friends/{friend_id}").json()["credit_balance"] == 2.5
+
+
+def test_update_credit_of_missing_link(client, make_expense):
+    expense = make_expense()
+    assert client.put(f"/expenses/{expense['id']}/friends/0", params={"amount": 1}).status_code == 404
+
+
+def test_concurrent_credit_updates_are_all_applied(client, make_expense):
+    expense = make_expense(credits=(0,))
+    path = f"/expenses/{expense['id']}/friends/{expense['friend_ids'][0]}"
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(lambda _: client.put(path, params={"amount": 0.25}).status_code, range(20)))
+    assert set(statuses) == {204}
+    assert client.get(path).json()["credit_balance"] == 5.0
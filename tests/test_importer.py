@@ -0,0 +1,41 @@
+import io
+
+from persistence.importer import read_records
+
+
+def upload(client, name, content: bytes):
+    response = client.post("/admin/import", files={"file": (name, content)})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_import_jsonl_skips_malformed_lines(client):
+    content = (b'{"description": "Malformed first", "date": "2024-03-01", "amount": 10}\n'
+               b'{"description": "Malformed", "date": \n'
+               b'\n'
+               b'[1, 2]\n'
+               b'{"description": "Malformed last", "date": "2024-03-01", "amount": 10}\n')
+    report = upload(client, "expenses.jsonl", content)
+    assert (report["rows"], report["expenses"], report["skipped"]) == (4, 2, 2)
+    assert [error.split(":")[0] for error in report["errors"]] == ["Row 2", "Row 4"]
+
+
+def test_import_jsonl_skips_lines_that_are_not_utf8(client):
+    content = ('{"description": "Latin-1 ñ", "date": "2024-03-02", "amount": 10}\n'.encode("latin-1")
+               + '{"description": "UTF-8 ñ", "date": "2024-03-02", "amount": 10}\n'.encode("utf-8"))
+    report = upload(client, "expenses.jsonl", content)
+    assert (report["rows"], report["expenses"], report["skipped"]) == (2, 1, 1)
+    assert report["errors"][0].startswith("Row 1: ")
+
+
+def test_import_csv_skips_rows_that_are_not_utf8(client):
+    content = ("description,date,amount,participants\n"
+               "CSV Latin-1 ñ,2024-03-03,10,Ana\n").encode("latin-1") + \
+              "CSV UTF-8 ñ,2024-03-03,10,Ana:5\n".encode("utf-8")
+    report = upload(client, "expenses.csv", content)
+    assert (report["rows"], report["expenses"], report["skipped"]) == (2, 1, 1)
+
+
+def test_read_records_numbers_jsonl_lines():
+    stream = io.StringIO('{"a": 1}\n\n{"a": 2}\n')
+    assert [row for row, _ in read_records(stream, "jsonl")] == [1, 3]
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from routers.ledger import as_utc
+
+
+def test_as_utc():
+    assert as_utc(None) is None
+    assert as_utc(datetime(2024, 1, 1, 12)) == datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+    converted = as_utc(datetime(2024, 1, 1, 12, tzinfo=timezone(timedelta(hours=2))))
+    assert (converted, converted.utcoffset()) == (datetime(2024, 1, 1, 10, tzinfo=timezone.utc), timedelta(0))
+
+
+@pytest.mark.parametrize("offset", [timedelta(hours=2), timedelta(hours=-5), timedelta(0)])
+def test_expense_balance_as_of_with_offset(client, make_expense, offset):
+    expense = make_expense(credits=(4.0,))
+    payment, = [payment for payment in client.get("/ledger/", params={"expense_id": expense["id"]}).json()
+                if payment["kind"] == "payment"]
+    paid_at = datetime.fromisoformat(payment["created_at"]).replace(tzinfo=timezone.utc)
+
+    def credit_as_of(as_of: datetime) -> float:
+        response = client.get(f"/ledger/expenses/{expense['id']}", params={"as_of": as_of.astimezone(timezone(offset)).isoformat()})
+        assert response.status_code == 200
+        return response.json()["credit_balance"]
+
+    assert credit_as_of(paid_at - timedelta(seconds=1)) == 0
+    assert credit_as_of(paid_at + timedelta(seconds=1)) == 4.0
@@ -0,0 +1,47 @@
+from dataclasses import replace
+from datetime import date
+
+from sqlmodel import Session, select
+
+from persistence.changes import TRACKED
+from persistence.database import build_engine, config
+from persistence.migrations import MIGRATIONS, add_rollups, migrate
+from persistence.models import Expense, MonthlyTotal, MonthlyFriendTotal
+
+
+def downgrade_to_rollups(connection):
+    # Back to the version before add_rollups, for tables created from the models
+    for table in TRACKED:
+        for event in ("insert", "update", "delete"):
+            connection.exec_driver_sql(f"DROP TRIGGER {table}_{event}_change")
+    for table in ("change", "monthlytotal", "monthlyfriendtotal"):
+        connection.exec_driver_sql(f"DROP TABLE {table}")
+    connection.exec_driver_sql(f"PRAGMA user_version = {MIGRATIONS.index(add_rollups)}")
+
+
+def test_migration_normalizes_unpadded_dates(tmp_path):
+    engine = build_engine(replace(config, url=f"sqlite:///{tmp_path}/legacy.db"))
+    migrate(engine)
+    with engine.begin() as connection:
+        downgrade_to_rollups(connection)
+        connection.exec_driver_sql("INSERT INTO friend (id, name, credit_balance_cents, debit_balance_cents, version) VALUES (1, 'Ana', 0, 500, 1)")
+        connection.exec_driver_sql("""
+            INSERT INTO expense (id, description, date, amount_cents, credit_balance_cents, num_friends, version) VALUES
+                (1, 'Cena', '2024-01-05', 1000, 0, 2, 1),
+                (2, 'Cena', '2024-1-5', 2000, 0, 1, 1),
+                (3, 'Taxi', '2024-3-9', 3000, 0, 1, 1)
+        """)
+        connection.exec_driver_sql("INSERT INTO friendexpenselink (friend_id, expense_id, amount_cents) VALUES (1, 1, 0)")
+
+    assert migrate(engine) == len(MIGRATIONS)
+
+    with Session(engine) as session:
+        expenses = {expense.id: (expense.description, expense.date) for expense in session.exec(select(Expense))}
+        assert expenses == {1: ("Cena", date(2024, 1, 5)), 2: ("Cena (2)", date(2024, 1, 5)), 3: ("Taxi", date(2024, 3, 9))}
+        months = {row.month: (row.num_expenses, row.amount_cents) for row in session.exec(select(MonthlyTotal))}
+        assert months == {date(2024, 1, 1): (2, 3000), date(2024, 3, 1): (1, 3000)}
+        friend_months = {(row.month, row.friend_id): row.debit_balance_cents for row in session.exec(select(MonthlyFriendTotal))}
+        assert friend_months == {(date(2024, 1, 1), 1): 500}
+        in_march = session.exec(select(Expense.id).where(Expense.date >= date(2024, 3, 1))).all()
+        assert in_march == [3]
+    engine.dispose()
@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+from persistence.money import share, to_cents
+
+
+@pytest.mark.parametrize("amount, cents", [(0.285, 29), ("12.5", 1250), (-0.005, -1), (" 3 ", 300)])
+def test_to_cents(amount, cents):
+    assert to_cents(amount) == cents
+
+
+@pytest.mark.parametrize("amount", ["abc", "", "zz", "nan", "Infinity", float("inf")])
+def test_to_cents_rejects_invalid_amounts(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+@pytest.mark.parametrize("amount_cents", [0, 1, 7, 1000, -1, -7, -1000])
+@pytest.mark.parametrize("num_friends", [1, 2, 3])
+def test_share_matches_sqlite_division(amount_cents, num_friends):
+    with sqlite3.connect(":memory:") as connection:
+        expected, = connection.execute("SELECT ? / ?", (amount_cents, num_friends)).fetchone()
+    assert share(amount_cents, num_friends) == expected
+
+
+@pytest.mark.parametrize("amount", ["NaN", "Infinity", "-Infinity"])
+def test_create_expense_rejects_non_finite_amounts(client, amount):
+    response = client.post("/expenses/", content=f'{{"description": "Non finite", "date": "2024-01-01", "amount": {amount}}}',
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+
+
+def test_create_expense_rejects_negative_amounts(client):
+    response = client.post("/expenses/", json={"description": "Negative", "date": "2024-01-01", "amount": -10})
+    assert response.status_code == 422
+
+
+def test_update_credit_rejects_non_finite_amounts(client):
+    response = client.put("/expenses/1/friends/1", params={"amount": "nan"})
+    assert response.status_code == 422
+
+
+def test_import_skips_invalid_amounts(client):
+    lines = ('{"description": "Bad amount", "date": "2024-02-01", "amount": "abc"}\n'
+             '{"description": "Bad participant", "date": "2024-02-01", "amount": 10, "participants": {"Ana": "zz"}}\n'
+             '{"description": "Negative import", "date": "2024-02-01", "amount": -10}\n'
+             '{"description": "Good import", "date": "2024-02-01", "amount": 10}\n')
+    response = client.post("/admin/import", files={"file": ("expenses.jsonl", lines.encode())})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["rows"], report["expenses"], report["skipped"]) == (4, 1, 3)
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+from sqlmodel import Session
+
+from persistence.generation import data_generation
+from persistence.models import Friend
+from persistence.read_model import defer_refresh, read_model, run_deferred
+
+
+@pytest.fixture
+def enabled_read_model(db_engine):
+    enabled = read_model.enabled
+    read_model.rebuild(db_engine)
+    yield read_model
+    read_model.enabled = enabled
+
+
+def test_commit_refreshes_read_model(db_engine, enabled_read_model):
+    with Session(db_engine) as session:
+        friend = Friend(name="Refreshed")
+        session.add(friend)
+        session.commit()
+        assert enabled_read_model.friends[friend.id].name == "Refreshed"
+
+
+def test_deferred_refresh_runs_in_a_worker_thread(db_engine, enabled_read_model, monkeypatch):
+    threads = []
+    refresh = enabled_read_model.refresh
+    monkeypatch.setattr(enabled_read_model, "refresh", lambda *touched: threads.append(threading.get_ident()) or refresh(*touched))
+
+    with Session(db_engine) as session:
+        deferred = defer_refresh(session)
+        friend = Friend(name="Deferred")
+        session.add(friend)
+        session.commit()
+        friend_id = friend.id
+    assert friend_id not in enabled_read_model.friends
+    assert threads == []
+
+    generation = data_generation.value
+    asyncio.run(run_deferred(deferred))
+    assert enabled_read_model.friends[friend_id].name == "Deferred"
+    assert threads and threading.get_ident() not in threads
+    assert deferred == [] and data_generation.value == generation + 1
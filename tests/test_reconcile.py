@@ -0,0 +1,55 @@
+from datetime import date
+
+from sqlmodel import Session, insert, update
+
+from persistence.balances import NO_SHARES, update_expenses_balances
+from persistence.models import Expense, Friend
+from persistence.reconcile import find_drift, reconcile
+
+
+def test_write_paths_keep_balances_reconciled(client, db_engine, make_expense):
+    # Amounts that do not split evenly, so the remainders have to match too
+    first = make_expense(10.0, credits=(1.0, 2.5, 0))
+    second = make_expense(0.07, credits=(0.01, 0), date="2024-07-15")
+    third = make_expense(99.99, credits=(50.0,), date="2024-08-31")
+
+    assert client.put(f"/expenses/{first['id']}", json={"description": first["description"], "date": "2024-07-02", "amount": 12.34}).status_code == 204
+    assert client.put(f"/expenses/{second['id']}/friends/{second['friend_ids'][0]}", params={"amount": 0.02}).status_code < 300
+    assert client.delete(f"/expenses/{first['id']}/friends/{first['friend_ids'][2]}").status_code == 204
+    assert client.delete(f"/expenses/{third['id']}").status_code == 204
+
+    with Session(db_engine) as session:
+        assert find_drift(session) == []
+
+
+def test_legacy_negative_expense_reconciles(client, db_engine, make_expense):
+    # Negative amounts are rejected now, but may be stored from before; SQL
+    # and Python have to split them alike
+    with Session(db_engine) as session:
+        expense_id = session.exec(insert(Expense.__table__).returning(Expense.__table__.c.id),
+                                  params=[{"description": "Legacy refund", "date": date(2024, 9, 1), "amount_cents": -1000,
+                                           "credit_balance_cents": 0, "num_friends": 1}]).scalar()
+        update_expenses_balances(session, {expense_id: NO_SHARES})
+        session.commit()
+    for _ in range(2):
+        friend = client.post("/friends/", json={"name": "Legacy"}).json()
+        assert client.post(f"/expenses/{expense_id}/friends", params={"friend_id": friend["id"]}).status_code == 201
+
+    assert client.get(f"/friends/{friend['id']}").json()["debit_balance"] == -3.33
+    with Session(db_engine) as session:
+        assert find_drift(session) == []
+
+
+def test_reconcile_fixes_drift(client, db_engine, make_expense):
+    expense = make_expense(30.0, credits=(5.0,))
+    friend_id = expense["friend_ids"][0]
+    with Session(db_engine) as session:
+        session.exec(update(Friend).where(Friend.id == friend_id).values(debit_balance_cents=1, credit_balance_cents=2))
+        session.commit()
+
+        drift = reconcile(session)
+        assert {(entry.table, entry.id, entry.column) for entry in drift} == {
+            ("friend", friend_id, "debit_balance_cents"), ("friend", friend_id, "credit_balance_cents")}
+        reconcile(session, fix=True)
+        assert find_drift(session) == []
+        assert session.get(Friend, friend_id).debit_balance_cents == 1500
@@ -0,0 +1,27 @@
+from routers.settlements import ME, settle
+
+
+def test_settle_clears_every_balance():
+    balances = {1: 500, 2: -1000, 3: 300, ME: 200}
+    net = dict(balances)
+    for payer, payee, amount in settle(balances):
+        net[payer] += amount
+        net[payee] -= amount
+    assert all(balance == 0 for balance in net.values())
+
+
+def test_settle_with_equal_balances_including_me():
+    transfers = settle({1: 5, 2: -10, ME: 5})
+    assert sorted(transfers, key=lambda transfer: str(transfer[1])) == [(2, 1, 5), (2, ME, 5)]
+
+
+def test_settle_with_equal_debts_including_me():
+    transfers = settle({1: -5, ME: -5, 2: 10})
+    assert len(transfers) == 2
+    assert {payer for payer, _, _ in transfers} == {1, ME}
+
+
+def test_get_settlements(client):
+    response = client.get("/settlements/")
+    assert response.status_code == 200
+    assert all(transfer["amount"] > 0 for transfer in response.json())
@@ -0,0 +1,22 @@
+from dataclasses import replace
+
+import pytest
+from sqlmodel import Session, func, select
+
+from persistence import utils
+from persistence.config import PROFILES
+from persistence.database import build_engine
+from persistence.models import Friend
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_startup_seeds_an_empty_database(profile, tmp_path, monkeypatch):
+    # The rollback journal of the dev profile cannot commit the seed while
+    # another connection still reads
+    engine = build_engine(replace(PROFILES[profile], url=f"sqlite:///{tmp_path}/startup.db", echo=False))
+    monkeypatch.setattr(utils, "engine", engine)
+    utils.create_db_and_tables()
+    utils.init_db_if_empty()
+    utils.init_db_if_empty()
+    with Session(engine) as session:
+        assert session.exec(select(func.count()).select_from(Friend)).one() == 10